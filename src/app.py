@@ -1,6 +1,11 @@
 from gui.mainwindow import MainWindow
 from tkinter import *
 from tkinter.ttk import *
+import os
+
+# the file pickers list these
+os.makedirs("./data", exist_ok=True)
+os.makedirs("./bundles", exist_ok=True)
 
 root = Tk()
 
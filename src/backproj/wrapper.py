@@ -7,38 +7,56 @@ from ctypes import *
 import platform
 import struct
 
-os = platform.system()
-arch = platform.machine()
+# shared library for each supported OS & architecture
+LIBRARIES = {
+    ("Linux", "x86_64"): ("./bin/backproj_linux64.so", "Linux 64-bit"),
+    ("Darwin", "arm64"): ("./bin/backproj_darwinarm64.dylib", "Apple ARM64"),
+    ("Darwin", "x86_64"): ("./bin/backproj_darwin64.dylib", "Apple 64-bit")
+}
 
-print("OS: " + os)
-print("Architecture: " + str(arch))
+lib = None  # loaded on first use by get_lib()
 
-lib = None
-if os == "Linux" and arch == "x86_64":
-    lib = cdll.LoadLibrary('./bin/backproj_linux64.so')
-    print("Loaded Linux 64-bit library")
-if os == "Darwin" and arch == "arm64":
-    lib = cdll.LoadLibrary("./bin/backproj_darwinarm64.dylib")
-    print("Loaded Apple ARM64 library")
-if os == "Darwin" and arch == "x86_64":
-    lib = cdll.LoadLibrary("./bin/backproj_darwin64.dylib")
-    print("Loaded Apple 64-bit library")
 
+def get_lib():
+    """Loads the backprojection library the first time it is needed
 
-# Lib.getRegion takes the following arguments:
-# (int *scans, float *positions, int scanCount, int scanLength, float binStart, float binEnd, float binSize, float x, float y, float width, float length, float resolution)
-lib.bp_getRegion.argtypes = [
-    POINTER(c_int32), POINTER(c_float), c_int, c_int, c_float, c_float, c_float,  c_float, c_float, c_float, c_float, c_float, c_float]
+    Returns:
+        The loaded library
+    """
+    global lib
 
+    if lib is not None:
+        return lib
 
-# returns a list of longs
-lib.bp_getRegion.restype = POINTER(c_float)
+    os = platform.system()
+    arch = platform.machine()
 
-# Lib.BackProj_getDim takes the same arguments as Lib.BackProj_getRegion
-lib.bp_getDim.argtypes = [c_float, c_float, c_float, c_float, c_float]
+    print("OS: " + os)
+    print("Architecture: " + str(arch))
 
-# but returns an int
-lib.bp_getDim.restype = POINTER(c_int)
+    if (os, arch) not in LIBRARIES:
+        raise OSError(f"No backprojection library for {os} {arch}, see the README")
+
+    path, name = LIBRARIES[(os, arch)]
+    loaded = cdll.LoadLibrary(path)
+    print(f"Loaded {name} library")
+
+    # Lib.getRegion takes the following arguments:
+    # (int *scans, float *positions, int scanCount, int scanLength, float binStart, float binEnd, float binSize, float x, float y, float width, float length, float resolution)
+    loaded.bp_getRegion.argtypes = [
+        POINTER(c_int32), POINTER(c_float), c_int, c_int, c_float, c_float, c_float,  c_float, c_float, c_float, c_float, c_float, c_float]
+
+    # returns a list of longs
+    loaded.bp_getRegion.restype = POINTER(c_float)
+
+    # Lib.BackProj_getDim takes the same arguments as Lib.BackProj_getRegion
+    loaded.bp_getDim.argtypes = [c_float, c_float, c_float, c_float, c_float]
+
+    # but returns an int
+    loaded.bp_getDim.restype = POINTER(c_int)
+
+    lib = loaded
+    return lib
 
 
 class BackProj(object):
@@ -88,6 +106,8 @@ class BackProj(object):
             np.ndarray: The backprojected region
         """
 
+        lib = get_lib()
+
         dim = lib.bp_getDim(x, y, width, height, resolution)
 
         pix_width = dim[0]
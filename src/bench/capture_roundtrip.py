@@ -0,0 +1,88 @@
+# Checks that every capture format reads back what was written
+#
+# Writes a synthetic capture with host times from a ClockModel in the plain,
+# compressed and columnar formats, streams it through open_writer() the way
+# a dynamic scan does, then reads it back with read_data_file(). Raises if
+# the timestamps, samples, flags, wall clock host times or clock summary
+# don't survive the round trip, and prints how long each format took.
+#
+# Run from the src directory:
+#   python3 -m bench.capture_roundtrip
+#   python3 -m bench.capture_roundtrip --scans 4000 --samples 2880
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from bench.compression import synthetic_capture
+from lib.clock import ClockModel
+from lib.file_utils import read_data_file, DIRECT_PATH_BINS
+from lib.save_data import open_writer, capture_extension
+
+FORMATS = {
+    "pickle": (None, False),
+    "compressed": ({"codec": "zlib", "transform": "shuffle"}, False),
+    "columnar": (None, True)
+}
+
+
+def run(timestamps: np.ndarray, samples: np.ndarray, name: str, directory: str) -> dict:
+    """Writes and reads one format
+
+    Returns:
+        dict of results
+    """
+    compression, columnar = FORMATS[name]
+    path = os.path.join(directory, "capture" + capture_extension(compression, columnar))
+
+    # host times 2 ms after the radar time, on this host's monotonic clock
+    clock = ClockModel()
+    host_times = time.monotonic() + (timestamps - timestamps[0]) / 1000 + 0.002
+    for timestamp, host_time in zip(timestamps, host_times):
+        clock.add(int(timestamp), host_time)
+    host_times[::7] = np.nan  # scans that came without one
+
+    flags = np.zeros(len(timestamps), dtype=np.uint8)
+    flags[::5] = 1
+
+    start = time.perf_counter()
+    with open_writer(path, 1.0, 5.0, compression, columnar, clock) as writer:
+        for first in range(0, len(timestamps), 100):
+            rows = slice(first, first + 100)
+            writer.write(timestamps[rows], samples[rows], flags[rows], host_times[rows])
+    encode = time.perf_counter() - start
+
+    start = time.perf_counter()
+    data = read_data_file(path)
+    decode = time.perf_counter() - start
+
+    expected = np.maximum(np.abs(samples).astype(np.float64), 1e-8)
+    expected[:, :DIRECT_PATH_BINS] = 0
+    checks = {
+        "timestamps": np.array_equal(data["time"], timestamps),
+        "samples": np.array_equal(data["data"], expected),
+        "flags": np.array_equal(data["flags"], flags),
+        "host_times": np.allclose(data["host_times"], host_times + clock.wall_offset,
+                                  rtol=0, atol=1e-6, equal_nan=True),
+        "clock": data["clock"] == clock.summary()
+    }
+    failed = [check for check, ok in checks.items() if not ok]
+    if failed:
+        raise RuntimeError(f"{name} did not round trip: {failed}")
+
+    return {"size": os.path.getsize(path), "encode": encode, "decode": decode}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that captures round trip")
+    parser.add_argument("--scans", type=int, default=1000)
+    parser.add_argument("--samples", type=int, default=1000)
+    args = parser.parse_args()
+
+    timestamps, samples = synthetic_capture(args.scans, args.samples)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name in FORMATS:
+            result = run(timestamps, samples, name, directory)
+            print(f"{name:<12}ok  {result['size'] / 1e6:7.1f} MB  "
+                  f"write {result['encode']:.2f} s  read {result['decode']:.2f} s")
@@ -0,0 +1,134 @@
+# Measures the size / speed trade-off of the capture encodings
+#
+# Builds a synthetic capture the size of a real one (noise plus a couple of
+# moving echoes, like the simulator sends) and writes it with every codec and
+# transform, next to the plain pickle capture. Reports the compression ratio,
+# encode speed, and decode speed with one thread and with one per CPU.
+#
+# Run from the src directory:
+#   python3 -m bench.compression
+#   python3 -m bench.compression --scans 4000 --samples 2880 --codecs zlib --levels 1 6 9
+import argparse
+import os
+import pickle
+import tempfile
+import time
+from collections import deque
+import numpy as np
+from lib.compression import CODECS, TRANSFORMS, COMPRESSED_EXTENSION, read_compressed
+from lib.save_data import save_data
+
+
+def synthetic_capture(scans: int, samples: int, seed=1) -> tuple[np.ndarray, np.ndarray]:
+    """Makes scans that look like radar data
+
+    Args:
+        scans (int): Number of scans.
+        samples (int): Samples per scan.
+        seed (int): Seed for the noise.
+
+    Returns:
+        (timestamps, samples)
+    """
+    rng = np.random.default_rng(seed)
+    bins = np.arange(samples)
+
+    data = rng.normal(0, 200, (scans, samples))
+    # a couple of slowly moving targets
+    for i in range(scans):
+        for center, amplitude in ((samples * 0.3 + i / 50, 20000), (samples * 0.6 - i / 100, 8000)):
+            data[i] += amplitude * np.exp(-((bins - center) / 3) ** 2) * np.cos(bins - center)
+
+    timestamps = 1000 + np.arange(scans, dtype=np.int64) * 10
+    return timestamps, data.astype(np.int32)
+
+
+def run(timestamps: np.ndarray, samples: np.ndarray, codec: str, transform: str,
+        level: int, directory: str) -> dict:
+    """Writes and reads one encoding
+
+    Returns:
+        dict of results
+    """
+    path = os.path.join(directory, f"{codec}-{transform}-{level}{COMPRESSED_EXTENSION}")
+    data = deque({"timestamp": ts, "data": scan} for ts, scan in zip(timestamps, samples))
+
+    start = time.perf_counter()
+    save_data(data, 0.0, 10.0, path,
+              compression={"codec": codec, "transform": transform, "level": level})
+    encode = time.perf_counter() - start
+
+    start = time.perf_counter()
+    serial = read_compressed(path, workers=1)
+    decode_serial = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parallel = read_compressed(path)
+    decode_parallel = time.perf_counter() - start
+
+    if not (np.array_equal(serial["samples"], samples)
+            and np.array_equal(parallel["samples"], samples)
+            and np.array_equal(parallel["timestamps"], timestamps)):
+        raise RuntimeError(f"{codec}/{transform} did not round trip")
+
+    size = os.path.getsize(path)
+    os.remove(path)
+
+    return {"size": size, "encode": encode, "decode_serial": decode_serial,
+            "decode_parallel": decode_parallel}
+
+
+def pickle_baseline(timestamps: np.ndarray, samples: np.ndarray, directory: str) -> dict:
+    """Writes and reads a plain pickle capture"""
+
+    path = os.path.join(directory, "baseline.pkl")
+    data = deque({"timestamp": ts, "data": scan} for ts, scan in zip(timestamps, samples))
+
+    start = time.perf_counter()
+    save_data(data, 0.0, 10.0, path)
+    encode = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        header = pickle.load(f)
+        for _ in range(header["frame_count"]):
+            pickle.load(f)
+    decode = time.perf_counter() - start
+
+    size = os.path.getsize(path)
+    os.remove(path)
+
+    return {"size": size, "encode": encode, "decode_serial": decode, "decode_parallel": decode}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark capture compression")
+    parser.add_argument("--scans", type=int, default=2000)
+    parser.add_argument("--samples", type=int, default=2880)
+    parser.add_argument("--codecs", nargs="+", default=["zlib", "lzma"], choices=list(CODECS))
+    parser.add_argument("--transforms", nargs="+", default=TRANSFORMS, choices=TRANSFORMS)
+    parser.add_argument("--levels", nargs="+", type=int, default=[None],
+                        help="compression levels, the codec default if not given")
+    args = parser.parse_args()
+
+    timestamps, samples = synthetic_capture(args.scans, args.samples)
+    megabytes = samples.nbytes / 1e6
+    print(f"{args.scans} scans x {args.samples} samples, {megabytes:.1f} MB of samples\n")
+
+    with tempfile.TemporaryDirectory() as directory:
+        baseline = pickle_baseline(timestamps, samples, directory)
+        rows = [("pickle", "-", "-", baseline)]
+        for codec in args.codecs:
+            for transform in args.transforms:
+                for level in args.levels:
+                    result = run(timestamps, samples, codec, transform, level, directory)
+                    rows.append((codec, transform, "default" if level is None else level, result))
+
+    print(f"{'codec':<7}{'transform':<15}{'level':<9}{'ratio':>7}"
+          f"{'enc MB/s':>10}{'dec MB/s':>10}{'par MB/s':>10}")
+    for codec, transform, level, result in rows:
+        print(f"{codec:<7}{transform:<15}{str(level):<9}"
+              f"{baseline['size'] / result['size']:>7.2f}"
+              f"{megabytes / result['encode']:>10.0f}"
+              f"{megabytes / result['decode_serial']:>10.0f}"
+              f"{megabytes / result['decode_parallel']:>10.0f}")
@@ -0,0 +1,120 @@
+# Measures how long each lib, processor and backproj module takes to import,
+# and checks that importing it has no side effects
+#
+# Every import runs in a fresh interpreter in an empty temporary directory.
+# Reports the import time (median of --repeat runs), which heavy packages
+# got pulled in, and any files created, sockets opened or output printed.
+#
+# Run from the src directory:
+#   python3 -m bench.import_time
+#   python3 -m bench.import_time lib.commanager lib.bundle --repeat 10
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PACKAGES = ["lib", "processor", "backproj"]
+
+# packages that are slow to import and should only load when used
+HEAVY = ["pandas", "scipy", "matplotlib", "tkinter"]
+
+# runs in the child interpreter
+CHILD = """
+import contextlib, importlib, io, json, os, sys, time
+output = io.StringIO()
+start = time.perf_counter()
+with contextlib.redirect_stdout(output):
+    importlib.import_module(sys.argv[1])
+elapsed = time.perf_counter() - start
+
+sockets = 0
+if os.path.isdir("/proc/self/fd"):
+    for fd in os.listdir("/proc/self/fd"):
+        try:
+            sockets += os.readlink(f"/proc/self/fd/{fd}").startswith("socket:")
+        except OSError:
+            pass
+
+print(json.dumps({
+    "time": elapsed,
+    "heavy": [name for name in sys.argv[2:] if name in sys.modules],
+    "files": sorted(os.listdir(".")),
+    "sockets": sockets,
+    "output": output.getvalue().strip()
+}))
+"""
+
+
+def find_modules(root: str) -> list[str]:
+    """Lists the modules in PACKAGES"""
+
+    modules = []
+    for package in PACKAGES:
+        for name in sorted(os.listdir(os.path.join(root, package))):
+            if name.endswith(".py"):
+                modules.append(f"{package}.{name[:-3]}")
+    return modules
+
+
+def measure(module: str, root: str, repeat: int) -> dict:
+    """Imports a module in fresh interpreters
+
+    Args:
+        module (str): The module to import.
+        root (str): The src directory.
+        repeat (int): How many times to import it.
+
+    Returns:
+        dict with the median import time and what the last import did
+    """
+    env = dict(os.environ, PYTHONPATH=root)
+    times = []
+
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as cwd:
+            proc = subprocess.run([sys.executable, "-c", CHILD, module, *HEAVY],
+                                  cwd=cwd, env=env, capture_output=True, text=True)
+
+        if proc.returncode != 0:
+            error = proc.stderr.strip().splitlines()
+            return {"module": module, "error": error[-1] if error else "failed"}
+
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        times.append(result["time"])
+
+    result["module"] = module
+    result["time"] = statistics.median(times)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import time and side effect check")
+    parser.add_argument("modules", nargs="*", help="defaults to every module in " + ", ".join(PACKAGES))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    modules = args.modules or find_modules(root)
+
+    print(f"{'module':<28} {'ms':>8}  side effects")
+    for module in modules:
+        result = measure(module, root, args.repeat)
+
+        if "error" in result:
+            print(f"{module:<28} {'-':>8}  import failed: {result['error']}")
+            continue
+
+        effects = []
+        if result["heavy"]:
+            effects.append("imports " + ", ".join(result["heavy"]))
+        if result["files"]:
+            effects.append("creates " + ", ".join(result["files"]))
+        if result["sockets"]:
+            effects.append(f"opens {result['sockets']} socket(s)")
+        if result["output"]:
+            effects.append("prints")
+
+        print(f"{module:<28} {result['time'] * 1e3:>8.1f}  {'; '.join(effects) or '-'}")
@@ -0,0 +1,144 @@
+# Benchmarks the whole receive path: radario -> commanager.get_data -> reassembly -> ScanBuffer
+#
+# A PulsON 440 simulator runs in a separate process on loopback, so its CPU
+# time isn't counted, and each configuration of the sweep is run with a
+# fresh commanager. Reports packets/s, completed scans/s, reassembly latency
+# (first part received to scan complete), CPU time per scan and drop rate.
+#
+# Run from the src directory:
+#   python3 -m bench.ingest
+#   python3 -m bench.ingest --lengths 2880 --messages 3 9 --rates 500 2000 --duration 5
+import argparse
+import contextlib
+import io
+import multiprocessing
+import time
+import numpy as np
+from lib.commanager import commanager
+from lib.radario import RadarConnection, MAX_PACKET_SIZE, PACKET_HEADER
+from lib.mrmapi import SCAN_INFO_HEADER
+from sim.pulson440 import PulsonSimulator
+
+# most samples that fit in one MRM_SCAN_INFO packet
+MAX_MESSAGE_SAMPLES = (MAX_PACKET_SIZE - PACKET_HEADER.size - SCAN_INFO_HEADER.size) // 4
+
+
+class TimedCommanager(commanager):
+    """commanager that records when packets arrive and scans complete"""
+
+    def __init__(self, connection: RadarConnection) -> None:
+        commanager.__init__(self, connection=connection)
+        self.packets = 0
+        self.first_rx = None
+        self.last_done = None
+        self.latencies = []
+
+    def handle_packet(self, msgtype, msgid, payload, rx_time=None):
+        scan = commanager.handle_packet(self, msgtype, msgid, payload, rx_time)
+
+        if msgtype == 0xF201:
+            self.packets += 1
+            if self.first_rx is None:
+                self.first_rx = rx_time
+
+        if scan is not None:
+            self.last_done = time.monotonic()
+            self.latencies.append(self.last_done - scan.first_rx)
+
+        return scan
+
+
+def serve(address_queue, samples: int, per_message: int, rate: float, loss: float) -> None:
+    """Runs a simulator, in its own process"""
+
+    sim = PulsonSimulator(port=0, rate=rate, samples=samples,
+                          samples_per_message=per_message, loss=loss, seed=1)
+    address_queue.put(sim.address)
+    sim.serve_forever()
+
+
+def run(samples: int, messages: int, rate: float, duration: float, loss=0.0) -> dict:
+    """Runs one configuration end to end
+
+    Args:
+        samples (int): Samples per scan.
+        messages (int): MRM_SCAN_INFO messages per scan.
+        rate (float): Scans per second.
+        duration (float): Roughly how long to scan for in seconds.
+        loss (float): Packet loss in the simulator.
+
+    Returns:
+        dict of results
+    """
+    per_message = -(-samples // messages)
+    scan_count = min(max(int(rate * duration), 1), 65534)
+
+    address_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=serve, args=(address_queue, samples, per_message, rate, loss), daemon=True)
+    process.start()
+    # a fresh socket per run, so nothing is left over from the previous one
+    comm = TimedCommanager(RadarConnection(address_queue.get(timeout=10)))
+
+    cpu = time.process_time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        comm.exec_scan(scan_count, 0)
+    cpu = time.process_time() - cpu
+
+    process.terminate()
+    process.join()
+
+    completed = len(comm.databuffer)
+    elapsed = (comm.last_done - comm.first_rx) if completed else float("nan")
+    latencies = np.array(comm.latencies) * 1e3
+
+    result = {
+        "samples": samples,
+        "messages": messages,
+        "rate": rate,
+        "packets_per_s": comm.packets / elapsed,
+        "scans_per_s": completed / elapsed,
+        "latency_ms": np.percentile(latencies, [50, 90, 99]) if completed else [np.nan] * 3,
+        "cpu_per_scan_us": cpu / max(completed, 1) * 1e6,
+        "drop_rate": 1 - completed / scan_count,
+        "expired": comm.reassembler.expired,
+        "overruns": comm.connection.receiver.overruns
+    }
+
+    comm.connection.close()
+    return result
+
+
+def report(result: dict) -> None:
+    p50, p90, p99 = result["latency_ms"]
+    print(f"{result['samples']:>7} {result['messages']:>4} {result['rate']:>7.0f} "
+          f"{result['packets_per_s']:>10.0f} {result['scans_per_s']:>8.0f} "
+          f"{p50:>7.3f} {p90:>7.3f} {p99:>7.3f} {result['cpu_per_scan_us']:>8.1f} "
+          f"{result['drop_rate'] * 100:>6.2f}% {result['expired']:>7} {result['overruns']:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest throughput benchmark")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[960, 2880],
+                        help="samples per scan")
+    parser.add_argument("--messages", type=int, nargs="+", default=[3, 8],
+                        help="MRM_SCAN_INFO messages per scan")
+    parser.add_argument("--rates", type=float, nargs="+", default=[100, 500, 2000],
+                        help="scans per second")
+    parser.add_argument("--duration", type=float, default=2, help="seconds per run")
+    parser.add_argument("--loss", type=float, default=0.0, help="simulated packet loss")
+    args = parser.parse_args()
+
+    print(f"{'samples':>7} {'msgs':>4} {'rate':>7} {'packets/s':>10} {'scans/s':>8} "
+          f"{'p50 ms':>7} {'p90 ms':>7} {'p99 ms':>7} {'cpu us':>8} {'drop':>7} "
+          f"{'expired':>7} {'overruns':>8}")
+
+    for samples in args.lengths:
+        for messages in args.messages:
+            if -(-samples // messages) > MAX_MESSAGE_SAMPLES:
+                print(f"skipping {samples} samples in {messages} messages, "
+                      f"more than {MAX_MESSAGE_SAMPLES} samples per packet")
+                continue
+
+            for rate in args.rates:
+                report(run(samples, messages, rate, args.duration, args.loss))
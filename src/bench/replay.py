@@ -0,0 +1,62 @@
+# Replays a packet log (see lib.recorder) into a commanager
+#
+# Reassembly is fed the recorded receive times, so every run over the same
+# log produces the same scans. Use --speed 0 to replay as fast as possible
+# and --profile to see where the time goes.
+#
+# Run from the src directory:
+#   python3 -m bench.replay ../data/2023-07-28_10-00-00.pktlog --speed 0 --profile
+import argparse
+import cProfile
+import pstats
+import time
+from lib.commanager import commanager
+from lib.recorder import replay
+
+
+def run(path: str, speed: float) -> dict:
+    """Replays a log once
+
+    Args:
+        path (str): The packet log.
+        speed (float): Playback speed, 0 for as fast as possible.
+
+    Returns:
+        dict of results
+    """
+    comm = commanager()
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    packets = replay(path, comm, speed or None)
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+
+    return {
+        "packets": packets,
+        "scans": len(comm.databuffer),
+        "expired": comm.reassembler.expired,
+        "duplicates": comm.reassembler.duplicates,
+        "wall": wall,
+        "cpu": cpu
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a packet log")
+    parser.add_argument("path")
+    parser.add_argument("--speed", type=float, default=0, help="1 is real time, 0 is max speed")
+    parser.add_argument("--profile", action="store_true", help="run under cProfile")
+    args = parser.parse_args()
+
+    if args.profile:
+        profiler = cProfile.Profile()
+        result = profiler.runcall(run, args.path, args.speed)
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
+    else:
+        result = run(args.path, args.speed)
+
+    print(f"{result['packets']} packets -> {result['scans']} scans "
+          f"({result['expired']} expired, {result['duplicates']} duplicate parts)")
+    print(f"{result['wall']:.3f} s wall, {result['cpu']:.3f} s cpu, "
+          f"{result['packets'] / result['wall']:.0f} packets/s")
@@ -0,0 +1,134 @@
+# Compares ingest sharing a process with heavy processing against ingest in its own process
+#
+# "single" runs commanager and the processing in one process, the way the
+# GUI does: packets are handled between processing steps. "shared" runs an
+# IngestProcess that writes scans into a shared memory ring, and the same
+# processing reads them from the ring in this process. The processing is a
+# pure Python busy loop, so it holds the GIL like drawing or filtering does.
+# A PulsON 440 simulator runs in a separate process on loopback.
+#
+# Run from the src directory:
+#   python3 -m bench.shm_ingest
+#   python3 -m bench.shm_ingest --rate 2000 --work 40 --period 50 --duration 5
+import argparse
+import contextlib
+import io
+import multiprocessing
+import time
+from lib.commanager import commanager
+from lib.ingest import IngestProcess
+from lib.radario import RadarConnection
+from bench.ingest import serve
+
+
+def busy(ms: float) -> None:
+    """Keeps the interpreter busy, holding the GIL"""
+
+    end = time.perf_counter() + ms / 1e3
+    while time.perf_counter() < end:
+        pass
+
+
+def start_simulator(samples: int, messages: int, rate: float) -> tuple:
+    """Starts a simulator process
+
+    Returns:
+        (process, address)
+    """
+    address_queue = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=serve, args=(address_queue, samples, -(-samples // messages), rate, 0.0), daemon=True)
+    process.start()
+    return process, address_queue.get(timeout=10)
+
+
+def run_single(address: tuple, scan_count: int, work: float, period: float) -> dict:
+    """Ingest and processing in this process"""
+
+    comm = commanager(connection=RadarConnection(address))
+    comm.connection.start_receiver()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        comm.send_sync("MRM_CONTROL_REQUEST", False, scanCount=scan_count, scanIntervalTime=0)
+    comm.mode = "async"
+
+    processed = 0
+    quiet = 0
+    next_work = time.perf_counter()
+    while quiet < 2:
+        if time.perf_counter() >= next_work:
+            busy(work)
+            processed += 1
+            next_work += period / 1e3
+
+        try:
+            msgtype, msgid, payload, rx_time = comm.connection.recv_packet(0.01)
+        except TimeoutError:
+            quiet += 0.01
+            continue
+        quiet = 0
+        comm.handle_packet(msgtype, msgid, payload, rx_time)
+
+    result = {"scans": comm.metrics.scans, "expired": comm.metrics.expired,
+              "overruns": comm.connection.receiver.overruns, "lost": 0, "work": processed}
+    comm.connection.close()
+    return result
+
+
+def run_shared(address: tuple, scan_count: int, work: float, period: float) -> dict:
+    """Ingest in its own process, processing here reading from the ring"""
+
+    ingest = IngestProcess(address)
+    ingest.start()
+    reader = ingest.reader()
+
+    ingest.send_sync("MRM_CONTROL_REQUEST", False, scanCount=scan_count, scanIntervalTime=0)
+
+    scans = 0
+    processed = 0
+    quiet = 0
+    next_work = time.perf_counter()
+    while quiet < 2:
+        if time.perf_counter() >= next_work:
+            busy(work)
+            processed += 1
+            next_work += period / 1e3
+
+        count = len(reader.read()["timestamps"])
+        scans += count
+        if count == 0:
+            quiet += 0.01
+            time.sleep(0.01)
+        else:
+            quiet = 0
+
+    metrics = ingest.get_metrics()
+    result = {"scans": scans, "expired": metrics["expired"], "overruns": metrics["overruns"],
+              "lost": reader.lost, "work": processed}
+    ingest.close()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Single vs multi-process ingest")
+    parser.add_argument("--samples", type=int, default=2880)
+    parser.add_argument("--messages", type=int, default=3)
+    parser.add_argument("--rate", type=float, default=2000, help="scans per second")
+    parser.add_argument("--duration", type=float, default=3, help="seconds of scanning")
+    parser.add_argument("--work", type=float, default=40, help="ms of processing per step")
+    parser.add_argument("--period", type=float, default=50, help="ms between processing steps")
+    args = parser.parse_args()
+
+    scan_count = min(int(args.rate * args.duration), 65534)
+    print(f"{scan_count} scans at {args.rate:.0f}/s, {args.work:.0f} ms of processing "
+          f"every {args.period:.0f} ms\n")
+    print(f"{'mode':<8}{'scans':>8}{'drop':>8}{'expired':>9}{'overruns':>10}{'lost':>6}{'steps':>7}")
+
+    for mode, run in (("single", run_single), ("shared", run_shared)):
+        process, address = start_simulator(args.samples, args.messages, args.rate)
+        result = run(address, scan_count, args.work, args.period)
+        process.terminate()
+        process.join()
+
+        print(f"{mode:<8}{result['scans']:>8}{(1 - result['scans'] / scan_count) * 100:>7.2f}%"
+              f"{result['expired']:>9}{result['overruns']:>10}{result['lost']:>6}{result['work']:>7}")
@@ -3,6 +3,7 @@ from tkinter.ttk import *
 from os import listdir
 from lib.bundle import bundle_data
 import lib.file_utils as file_util
+from lib.save_data import CAPTURE_EXTENSIONS
 import lib.filter_utils as filters
 import processor.heatmap as hp
 from gui.partials.filter_conf_panel import FilterConfigPanel
@@ -58,7 +59,7 @@ class BundlerModal(object):
         path = ""
 
         for i in file_indicies:
-            if files[i].endswith(".pkl"):
+            if files[i].endswith(CAPTURE_EXTENSIONS):
                 path = "data/" + files[i]
 
         data = file_util.read_data_file(path)
@@ -76,8 +77,8 @@ class BundlerModal(object):
     def update_files(self) -> None:
         files = listdir("./data")
 
-        # only files ending in .pkl
-        pkl_files = [f for f in files if f.endswith(".pkl")]
+        # only captures, in any format
+        pkl_files = [f for f in files if f.endswith(CAPTURE_EXTENSIONS)]
 
         # only files ending in .csv
         csv_files = [f for f in files if f.endswith(".csv")]
@@ -106,7 +107,7 @@ class BundlerModal(object):
             name = files[i]
             if name.endswith(".csv"):
                 csv = name
-            elif name.endswith(".pkl"):
+            elif name.endswith(CAPTURE_EXTENSIONS):
                 pkl = name
 
         # get the first csv
@@ -1,13 +1,20 @@
 from datetime import datetime
+import os
 from tkinter import *
 from tkinter.ttk import *
 from gui.logger import Logger
 from gui.state import get_state, set_state
 from lib.config import write_config_file
 from lib.commanager import commanager
-from lib.trimdata import trim_data
-from lib.save_data import save_data
+from lib.save_data import save_data, open_writer, capture_extension
+from lib.scanbuffer import ScanBuffer
+from lib.snapshot import SnapshotStream
+from lib.ratecontrol import RateController
 from lib.util import range_to_ps, ps_to_range
+from lib.reduction import ScanReducer
+from lib.reassembly import reassembly_from_config
+from lib.compression import compression_from_config
+from lib.columnar import columnar_from_config
 
 comm = commanager()
 
@@ -16,7 +23,9 @@ class RunFrame(Frame):
     statusLog = Logger(maxLen=10)
     log = statusLog.log
     run_dynamic = True
-    snapshot_count = 1
+    writer = None  # CaptureWriter of the running dynamic scan
+    stream = None  # SnapshotStream the snapshots are taken from
+    logged_adjustments = 0  # rate adjustments already in the log
 
     def __init__(self, root: Tk, update_status: callable):
         Frame.__init__(self, root)
@@ -164,6 +173,15 @@ class RunFrame(Frame):
     def start_scan_handler(self):
         """ Starts the scan """
 
+        if self.stream is not None and self.stream.running:
+            self.log("FAILED: Save the snapshots first.")
+            self.update_log_box()
+            return
+
+        # pick up any changes to the reduction and reassembly settings
+        comm.reducer = ScanReducer.from_config(get_state("config"))
+        comm.set_reassembly(**reassembly_from_config(get_state("config")))
+
         # get the current settings
         config = get_state("config")["radar"]
 
@@ -213,29 +231,45 @@ class RunFrame(Frame):
         contents = self.statusLog.get()
         self.logItems.set(contents)
 
-    def __dump_data_buffers(self):
-        """ Dumps the data buffers to a file """
+    def __dump_data_buffers(self, data: ScanBuffer = None):
+        """ Dumps the data buffers to a file
 
-        data = comm.databuffer
+            Args:
+                data (ScanBuffer): The scans to save, defaults to comm.databuffer
+        """
+
+        if data is None:
+            data = comm.databuffer
         self.log("Scan Complete")
         self.log(f"Data Length: {len(data)}")
+        for line in comm.metrics_report():
+            self.log(line)
+
+        start_range, end_range = self.__get_ranges()
+
+        # get current date and time string
+        now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        config = get_state("config")
+        compression = compression_from_config(config)
+        columnar = columnar_from_config(config)
+        file_name = f"{now}{capture_extension(compression, columnar)}"
+        save_data(data, start_range, end_range, f"./data/{file_name}",
+                  compression=compression, columnar=columnar, clock=comm.clock)
+        self.log(f"File saved to {file_name}")
 
-        # there are 0-pads, so get rid of them
-        data = trim_data(data)
+    def __get_ranges(self) -> tuple[float, float]:
+        """ Gets the start and end range of the scan in meters """
 
-        # grab range settings
         config = get_state("config")["radar"]
         start_range = ps_to_range(
             config["scanStart"]) + config["distanceCorrection"]
         end_range = ps_to_range(
             config["scanEnd"]) + config["distanceCorrection"]
 
-        print(config["scanStart"], config["distanceCorrection"])
-
-        # get current date and time string
-        now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        save_data(data, start_range, end_range, f"./data/{now}.pkl")
-        self.log(f"File saved to {now}.pkl")
+        # range gating moves the ends of the scan
+        if comm.reducer is not None:
+            return comm.reducer.ranges(start_range, end_range)
+        return start_range, end_range
 
     def __static_scan(self):
         """ Runs a static scan """
@@ -289,6 +323,21 @@ class RunFrame(Frame):
 
         self.log("Dynamic Scan Started")
 
+        # scans are streamed to disk as they come in
+        start_range, end_range = self.__get_ranges()
+        now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        config = get_state("config")
+        compression = compression_from_config(config)
+        columnar = columnar_from_config(config)
+        file_name = f"{now}{capture_extension(compression, columnar)}"
+        self.writer = open_writer(f"./data/{file_name}", start_range, end_range,
+                                  compression, columnar, comm.clock)
+        self.log(f"Saving to {file_name}")
+
+        # slow the radar down if we can't keep up
+        comm.controller = RateController.from_config(get_state("config"))
+        self.logged_adjustments = 0
+
         # also set comm to async mode
         comm.mode = "async"
 
@@ -313,33 +362,131 @@ class RunFrame(Frame):
                 while comm.get_data():
                     pass
 
-                self.__dump_data_buffers()
-                comm.__reset__()
+                self.__finish_dynamic_scan()
 
                 break
 
-        self.log(f"Saved {len(comm.databuffer)} scans")
+        if self.writer is not None:
+            # move what we have so far to disk, so memory use stays flat
+            self.writer.start_range, self.writer.end_range = self.__get_ranges()
+            self.writer.write_buffer(comm.databuffer)
+            self.log(f"Saved {self.writer.frame_count + self.writer.pending} scans")
+
+        if comm.controller is not None:
+            for adjustment in comm.controller.adjustments[self.logged_adjustments:]:
+                self.log(f"Scan interval {adjustment['old_interval']} -> "
+                         f"{adjustment['new_interval']} us ({adjustment['reason']})")
+            self.logged_adjustments = len(comm.controller.adjustments)
         self.update_log_box()
 
         # add self to root with a delay of 1 ms
         if (self.run_dynamic):
             self.root.after(1, self.__run_dynamic_scan)
 
+    def __finish_dynamic_scan(self):
+        """ Writes the last scans and closes the capture file """
+
+        self.log("Scan Complete")
+        for line in comm.metrics_report():
+            self.log(line)
+
+        # scans salvage mode was still holding back
+        comm.flush_reassembly()
+
+        self.writer.start_range, self.writer.end_range = self.__get_ranges()
+        self.writer.write_buffer(comm.databuffer)
+        self.writer.close()
+        self.log(f"Saved {self.writer.frame_count} scans to {self.writer.file_path}")
+
+        # the rate changes go next to the capture
+        if comm.controller is not None:
+            comm.controller.save(os.path.splitext(self.writer.file_path)[0] + ".rate.json")
+        self.writer = None
+
+        comm.__reset__()
+
     def __snapshot_scan(self):
-        """ Takes a snapshot """
+        """ Takes a snapshot, starting the snapshot stream first if needed """
+
+        if self.stream is not None and self.stream.running:
+            self.__take_snapshot()
+            return
 
-        comm.exec_scan(self.snapshot_count, 0)
-        self.snapshot_count += 1
-        self.log("Took a snapshot!")
+        if comm.mode == "async":
+            self.log("FAILED: End the scan first.")
+            self.update_log_box()
+            return
+
+        config = get_state("config")
+
+        # keep any snapshots taken before the stream was stopped
+        snapshots = self.stream.snapshots if self.stream is not None else None
+
+        comm.reducer = ScanReducer.from_config(config)
+        comm.set_reassembly(**reassembly_from_config(config))
+        self.stream = SnapshotStream.from_config(comm, config)
+        if snapshots is not None:
+            self.stream.snapshots = snapshots
+
+        self.log("Starting Snapshot Stream")
+        try:
+            resp = self.stream.start(config["radar"]["scanInterval"])
+        except TimeoutError:
+            self.log("FAILED: Did not receive confirm.")
+            self.update_log_box()
+            return
+
+        if resp["status"] != 0:
+            self.log(f"FAILED. Error code: {resp['status']}")
+            self.update_log_box()
+            return
+
+        self.__poll_snapshot_stream()
+
+        # give the first scan a moment to arrive
+        self.root.after(100, self.__take_snapshot)
+        self.update_log_box()
+
+    def __take_snapshot(self):
+        """ Copies the newest scans out of the snapshot stream """
+
+        average = get_state("config").get("snapshot", {}).get("average", 1)
+        snapshot = self.stream.snapshot(average)
+
+        if snapshot is None:
+            self.log("FAILED: No scans received yet.")
+        elif snapshot["scans"] > 1:
+            self.log(f"Took snapshot {len(self.stream.snapshots)} "
+                     f"(average of {snapshot['scans']} scans)")
+        else:
+            self.log(f"Took snapshot {len(self.stream.snapshots)}")
 
         self.update_log_box()
 
+    def __poll_snapshot_stream(self):
+        """ Keeps the snapshot stream's ring up to date while it runs """
+
+        if self.stream is None or not self.stream.running:
+            return
+
+        self.stream.poll()
+        self.root.after(10, self.__poll_snapshot_stream)
+
     def __dump_snapshots(self):
         """ Dumps the snapshots to a file """
 
-        self.__dump_data_buffers()
+        if self.stream is None or len(self.stream.snapshots) == 0:
+            self.log("FAILED: No snapshots to save.")
+            self.update_log_box()
+            return
+
+        self.log("Stopping Snapshot Stream")
+        self.update_log_box()
+        self.stream.stop()
+
+        self.__dump_data_buffers(self.stream.snapshots)
         self.log("Dumped snapshots")
         comm.__reset__()
-        self.snapshot_count = 1
+        self.stream = None
 
         self.update_log_box()
@@ -5,6 +5,7 @@ import processor.heatmap as hp
 from gui.state import get_state
 import lib.filter_utils as filters
 import lib.file_utils as file_util
+from lib.save_data import CAPTURE_EXTENSIONS
 import lib.image_utils as image_util
 import numpy as np
 from gui.partials.filter_conf_panel import FilterConfigPanel
@@ -61,16 +62,16 @@ class TimePlotModal(object):
     def update_files(self) -> None:
         files = listdir("./data")
 
-        # only files ending in .pkl
-        files = [f for f in files if f.endswith(".pkl")]
+        # only captures, in any format
+        files = [f for f in files if f.endswith(CAPTURE_EXTENSIONS)]
 
         self.files.set(files)
 
     def getLatestFile(self) -> str:
         files = listdir("./data")
 
-        # only files ending in .pkl
-        files = [f for f in files if f.endswith(".pkl")]
+        # only captures, in any format
+        files = [f for f in files if f.endswith(CAPTURE_EXTENSIONS)]
 
         # sort by name
         files.sort()
@@ -1,38 +1,81 @@
 from datetime import datetime
+import os
+import sys
 from lib.commanager import commanager
-from lib.util import range_to_ps, ps_to_range
-from lib.trimdata import trim_data
-from lib.save_data import save_data
+from lib.util import ps_to_range
+from lib.save_data import save_data, capture_extension
 from lib.config import get_config
-
-cmm = commanager()
+from lib.radario import start_recording, stop_recording
+from lib.reduction import ScanReducer
+from lib.reassembly import reassembly_from_config
+from lib.compression import compression_from_config
+from lib.columnar import columnar_from_config
+from lib.ratecontrol import RateController
+from lib.scanplan import ScanPlan, load_plan
+from lib.detection import detection_from_config
 
 config = get_config()
 radar_config = config["radar"]
 
-# these are in meters
-start_range = range_to_ps(radar_config["scanStart"])
-end_range = range_to_ps(radar_config["scanEnd"])
+cmm = commanager(reducer=ScanReducer.from_config(config), **reassembly_from_config(config))
+
+# get current date and time string
+now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+
+# "python3 index.py plan.json" runs a scan plan instead, one capture per step
+if len(sys.argv) > 1:
+    plan = ScanPlan.from_config(load_plan(sys.argv[1], radar_config), f"./data/{now}", config)
+    for result in plan.run((config["net"]["ip"], config["net"]["port"])):
+        print(f"{result['file']}: {result['scans']} scans ({result['written']} written) "
+              f"in {result['duration']:.1f} s")
+    sys.exit(0)
+
+# optionally keep every raw packet, so the run can be replayed
+if radar_config.get("recordPackets", False):
+    os.makedirs("./data", exist_ok=True)
+    start_recording(f"./data/{now}.pktlog")
 
+# these are already in picoseconds, like the GUI saves them
 actual_config = cmm.init_radar(baseIntegrationIndex=radar_config["integrationIndex"], persistFlag=1,
-                               scanStart=start_range, scanEnd=end_range, nodeID=6)
+                               scanStart=radar_config["scanStart"], scanEnd=radar_config["scanEnd"],
+                               nodeID=6)
 
 # figure out what the actual ranges are
 startRange = ps_to_range(actual_config["scanStart"])
 endRange = ps_to_range(actual_config["scanEnd"])
 
+# optionally collect the radar's detection lists, instead of or as well as the scans
+detection = detection_from_config(config)
+cmm.set_detection_mode(detection is not None, **(detection or {}))
+
+# optionally slow the radar down (or speed it back up) if we fall behind
+cmm.controller = RateController.from_config(config, scan_count=radar_config["scanCount"])
+
 # start the scan
-data = cmm.exec_scan(
-    scanCount=radar_config["scanCount"], scanInterval=radar_config["scanInterval"])
+data = cmm.exec_scan(radar_config["scanCount"], radar_config["scanInterval"])
+
+for line in cmm.metrics_report():
+    print(line)
 
 # turn off the radar
 cmm.sleep_radar()
+stop_recording()
 
-# there are 0-pads, so get rid of them
-data = trim_data(data)
+# detection indexes count from the start of the whole scan
+if cmm.detections is not None:
+    print(f"Saving {len(cmm.detections)} detections")
+    cmm.detections.save(f"./data/{now}.det.npz", startRange, endRange)
 
-# write data to file
+# range gating moves the ends of the scan
+startRange, endRange = cmm.reducer.ranges(startRange, endRange)
 
-# get current date and time string
-now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-save_data(data, startRange, endRange, f"./data/{now}.pkl")
+# write data to file, exec_scan returns None if it refused to start
+if data is not None and len(data):
+    compression = compression_from_config(config)
+    columnar = columnar_from_config(config)
+    save_data(data, startRange, endRange, f"./data/{now}{capture_extension(compression, columnar)}",
+              compression=compression, columnar=columnar, clock=cmm.clock)
+
+if cmm.controller is not None:
+    print(f"Scan interval changed {len(cmm.controller.adjustments)} times")
+    cmm.controller.save(f"./data/{now}.rate.json")
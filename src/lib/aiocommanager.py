@@ -0,0 +1,297 @@
+import asyncio
+import time
+from lib.commanager import commanager
+from lib.scanbuffer import ScanBuffer
+from lib.detection import DetectionStore
+from lib.mrmapi import get_outgoing, resolve_name, get_incoming, FILTER_RAW, FILTER_DETECTION_LIST
+from lib.radario import PACKET_HEADER, MAX_PACKET_SIZE, RECV_TIMEOUT
+from lib.config import get_config
+
+# asyncio version of commanager
+# Every request gets a future keyed by its message ID, so several requests
+# can be in flight at once. Scan data that arrives in between is handed to
+# commanager.handle_packet on the same event loop.
+
+
+class RadarProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, owner) -> None:
+        """Forwards datagrams to an aiocommanager
+
+        Args:
+            owner (aiocommanager): The manager to forward to.
+        """
+        self.owner = owner
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.owner.datagram_received(data)
+
+    def error_received(self, exc: Exception) -> None:
+        self.owner.fail_pending(exc)
+
+    def connection_lost(self, exc: Exception) -> None:
+        self.owner.fail_pending(exc or ConnectionError("Radar connection closed"))
+
+
+class aiocommanager(commanager):
+
+    def __init__(self, address: tuple = None) -> None:
+        """Creates the manager. Call connect() from a running event loop before use.
+
+        Args:
+            address (tuple): (ip, port) of the radar. Defaults to the config.
+        """
+        commanager.__init__(self)
+
+        if address is None:
+            cfg = get_config()
+            address = (cfg["net"]["ip"], cfg["net"]["port"])
+
+        self.address = address
+        self.transport = None
+        self.pending = {}  # msgid: (response type, future)
+        self.send_buffer = bytearray(MAX_PACKET_SIZE)
+        self.scan_event = None  # set every time a packet was handled
+
+    async def connect(self) -> None:
+        """Opens the UDP endpoint on the running event loop."""
+
+        loop = asyncio.get_running_loop()
+        self.scan_event = asyncio.Event()
+        self.transport, _protocol = await loop.create_datagram_endpoint(
+            lambda: RadarProtocol(self), remote_addr=self.address)
+
+    def close(self) -> None:
+        """Closes the UDP endpoint."""
+
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    def request(self, msgtype: int or str, **kwargs) -> asyncio.Future:
+        """ Sends a message to the radar without waiting for the response.
+
+        Args:
+            msgtype (int or str): The message type.
+            **kwargs: The message arguments.
+
+        Returns:
+            A future that resolves to the decoded response. Messages without
+            a response resolve to an empty dict straight away.
+        """
+
+        process_func = get_outgoing(msgtype)
+
+        if isinstance(msgtype, str):
+            msgtype = resolve_name(msgtype)
+
+        msgid = self.__gen_msg_id__()
+
+        # pack the message in place
+        PACKET_HEADER.pack_into(self.send_buffer, 0, msgtype, msgid)
+        size = PACKET_HEADER.size + process_func["codec"].pack_into(
+            self.send_buffer, PACKET_HEADER.size, **kwargs)
+
+        future = asyncio.get_running_loop().create_future()
+
+        targetID = process_func["responseID"]
+        if targetID is None:
+            future.set_result({})
+        else:
+            self.pending[msgid] = (targetID, future)
+
+        self.transport.sendto(bytes(self.send_buffer[:size]))
+
+        return future
+
+    async def send(self, msgtype: int or str, timeout=RECV_TIMEOUT, **kwargs) -> dict:
+        """ Sends a message to the radar and waits for its response.
+
+        Args:
+            msgtype (int or str): The message type.
+            timeout (float): How long to wait for the response in seconds.
+            **kwargs: The message arguments.
+
+        Returns:
+            The response payload.
+        """
+
+        future = self.request(msgtype, **kwargs)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No response to {msgtype}")
+        finally:
+            # drop the pending entry if we gave up on it
+            for msgid, (_type, _future) in list(self.pending.items()):
+                if _future is future:
+                    del self.pending[msgid]
+
+    async def gather(self, *requests: tuple, timeout=RECV_TIMEOUT) -> list[dict]:
+        """ Pipelines several requests and waits for all responses.
+
+        Args:
+            *requests (tuple): (msgtype, kwargs) pairs, sent in order.
+            timeout (float): How long to wait for all responses in seconds.
+
+        Returns:
+            The responses, in the same order as the requests.
+        """
+
+        return await asyncio.gather(*[self.send(msgtype, timeout=timeout, **kwargs)
+                                      for msgtype, kwargs in requests])
+
+    def set_and_get(self, set_request: tuple, get_request: tuple,
+                    timeout=RECV_TIMEOUT) -> asyncio.Future:
+        """ Sends a set request and the get that reads it back, without waiting.
+
+        UDP may deliver the get first, and then it is answered with the state
+        from before the set. So if the get reply doesn't show every value
+        that was set, the get is sent again. The set has been confirmed by
+        then, so the second reply is current. Values the radar rounds cost
+        the same extra round trip.
+
+        Args:
+            set_request (tuple): (msgtype, kwargs) of the set.
+            get_request (tuple): (msgtype, kwargs) of the get.
+            timeout (float): How long to wait for each round of responses in seconds.
+
+        Returns:
+            A future that resolves to (set response, get response)
+        """
+
+        replies = asyncio.gather(self.request(set_request[0], **set_request[1]),
+                                 self.request(get_request[0], **get_request[1]))
+        return asyncio.ensure_future(self.__read_back(replies, set_request[1], get_request, timeout))
+
+    async def __read_back(self, replies: asyncio.Future, wanted: dict, get_request: tuple,
+                          timeout: float) -> tuple[dict, dict]:
+        """The waiting half of set_and_get()"""
+
+        try:
+            status, reply = await asyncio.wait_for(replies, timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No response to {get_request[0]}")
+
+        if any(reply.get(key, value) != value for key, value in wanted.items()):
+            reply = await self.send(get_request[0], timeout=timeout, **get_request[1])
+
+        return status, reply
+
+    def datagram_received(self, data: bytes) -> None:
+        """Routes an incoming datagram to its future or to the scan handler.
+
+        Args:
+            data (bytes): The full packet.
+        """
+
+        msgtype, msgid = PACKET_HEADER.unpack_from(data)
+        payload = memoryview(data)[PACKET_HEADER.size:]
+
+        # is it the reply to something we are waiting for?
+        entry = self.pending.get(msgid)
+        if entry is not None and (msgtype == entry[0] or msgtype == 0xF10C):
+            del self.pending[msgid]
+            targetID, future = entry
+
+            if not future.done():
+                try:
+                    future.set_result(get_incoming(msgtype)(payload))
+                except Exception as e:
+                    future.set_exception(e)
+            return
+
+        self.handle_packet(msgtype, msgid, payload, time.monotonic())
+        self.scan_event.set()
+
+    def fail_pending(self, exc: Exception) -> None:
+        """Fails every request still waiting for a response.
+
+        Args:
+            exc (Exception): The error to raise in the waiters.
+        """
+
+        for targetID, future in self.pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        self.pending = {}
+
+    # the following are metafunctions
+    async def init_radar(self, **kwargs) -> dict:
+        """Initializes the radar. The set and get are pipelined, see set_and_get().
+          Args:
+              **kwargs: Keyword arguments for config
+          Returns
+              The configuration read back from the radar
+        """
+
+        _status, config = await self.set_and_get(
+            ("MRM_SET_CONFIG_REQUEST", kwargs),
+            ("MRM_GET_CONFIG_REQUEST", {}))
+        return config
+
+    async def set_detection_mode(self, enabled: bool, keep_scans: bool = False,
+                                 motion_filter_index: int = 0) -> dict:
+        """Turns the radar's detection lists on or off. The set and get are pipelined.
+          Args:
+              enabled (bool): Whether to send detection lists.
+              keep_scans (bool): Whether to keep sending raw scans as well.
+              motion_filter_index (int): The radar's motion filter setting.
+          Returns
+              The filter config read back from the radar
+        """
+
+        mask = FILTER_RAW
+        if enabled:
+            mask = FILTER_DETECTION_LIST | (FILTER_RAW if keep_scans else 0)
+
+        _status, config = await self.set_and_get(
+            ("MRM_SET_FILTER_CONFIG_REQUEST", {"filterMask": mask,
+                                               "motionFilterIndex": motion_filter_index}),
+            ("MRM_GET_FILTER_CONFIG_REQUEST", {}))
+
+        if config["filterMask"] != mask:
+            print("WARNING: Radar did not take the filter config!")
+
+        self.detections = DetectionStore() if enabled else None
+        return config
+
+    async def exec_scan(self, scan_count: int, scan_interval: int) -> ScanBuffer:
+        """Executes a scan.
+          Args:
+              scan_count (int): Number of scans to execute
+              scan_interval (int): Time between scans
+          Returns:
+              A ScanBuffer of data sets
+        """
+
+        if scan_count == 0 or scan_count > 65535:
+            print("ERROR: scan_count must be between 1 and 65535!")
+            return None
+
+        self.mode = "async"
+        await self.send("MRM_CONTROL_REQUEST", scanCount=scan_count, scanIntervalTime=scan_interval)
+
+        # wait for the data, stop once the radar goes quiet.
+        # Scans held back by salvage mode are released when the scan ends.
+        # Without raw scans, every scan is a detection list
+        while max(self.received_scans(), self.metrics.detection_lists) < scan_count:
+            self.scan_event.clear()
+            try:
+                await asyncio.wait_for(self.scan_event.wait(), RECV_TIMEOUT)
+            except asyncio.TimeoutError:
+                break
+
+        self.__resolve__buffers__()
+        self.mode = "sync"
+
+        return self.databuffer
+
+    async def sleep_radar(self) -> None:
+        """Puts the radar to sleep."""
+
+        await self.send("MRM_SET_SLEEPMODE_REQUEST", mode=1)
+        resp = await self.send("MRM_GET_SLEEPMODE_REQUEST")
+
+        if resp["sleepMode"] != 1:
+            print("ERROR: Radar failed to sleep!")
@@ -1,3 +1,4 @@
+import os
 import numpy as np
 import lib.read_csv as mocap
 from lib.file_utils import read_data_file
@@ -58,6 +59,7 @@ def bundle_data(pickle_path: str, csv_path: str, filter_strength=8, filter_boost
 
     # write to a pickle file
     name = pickle_path.split("/")[-1].split(".")[0]
+    os.makedirs("bundles", exist_ok=True)
     pickle.dump(bundle, open(f"bundles/bndl-{name}.pkl", "wb"))
 
     return f"bundles/{name}.pkl"
@@ -0,0 +1,199 @@
+from collections import deque
+import time
+import numpy as np
+
+# Radar timestamps and how they map to host time
+# MRM_SCAN_INFO timestamps are a 32-bit millisecond counter, which rolls
+# over after about 50 days of radar uptime. TimestampUnwrapper turns them
+# into a counter that keeps going up, so comparisons and sorting keep
+# working across the rollover.
+#
+# ClockModel fits host time (time.monotonic()) as a linear function of
+# radar time while scans come in, so every scan can be given a host time
+# without the jitter of its own receive time. A packet can only arrive
+# late, never early, so for each window of radar time only the scan that
+# arrived soonest after it was taken is kept, and the line is fitted
+# through those. The slope absorbs the drift between the two clocks.
+#
+# time.monotonic() only means something inside the running system, so
+# captures store host times as wall clock (time.time()) seconds, shifted by
+# one wall_clock_offset() taken when the capture starts. That is what lines
+# scans up with motion capture or anything else recorded on the host.
+
+COUNTER_WRAP = 1 << 32  # the radar counter rolls over here
+
+
+class TimestampUnwrapper:
+
+    def __init__(self) -> None:
+        """Creates an unwrapper that hasn't seen a timestamp yet"""
+
+        self.epoch = 0  # added to every raw timestamp
+        self.last = None  # the newest raw timestamp seen
+
+    def unwrap(self, timestamp: int) -> int:
+        """Unwraps one timestamp
+
+        Timestamps may arrive a little out of order. A jump back by more
+        than half the counter range is taken as a rollover, and a jump
+        forward by as much as a late packet from before the last rollover.
+
+        Args:
+            timestamp (int): The raw radar timestamp (ms).
+
+        Returns:
+            The unwrapped timestamp (ms)
+        """
+        if self.last is not None:
+            if timestamp < self.last - COUNTER_WRAP // 2:
+                self.epoch += COUNTER_WRAP
+            elif timestamp > self.last + COUNTER_WRAP // 2:
+                return timestamp + self.epoch - COUNTER_WRAP
+
+        self.last = timestamp
+        return timestamp + self.epoch
+
+
+def unwrap_timestamps(timestamps: np.ndarray) -> np.ndarray:
+    """Unwraps a whole series of radar timestamps, see TimestampUnwrapper
+
+    Already unwrapped timestamps come back unchanged.
+
+    Args:
+        timestamps (np.ndarray): The timestamps (ms), in the order they were taken.
+
+    Returns:
+        The unwrapped timestamps, as int64
+    """
+    timestamps = np.asarray(timestamps).astype(np.int64)
+    if len(timestamps) < 2:
+        return timestamps
+
+    steps = np.diff(timestamps)
+    wraps = (steps < -COUNTER_WRAP // 2).astype(np.int64) - (steps > COUNTER_WRAP // 2)
+    offsets = np.zeros(len(timestamps), dtype=np.int64)
+    np.cumsum(wraps * COUNTER_WRAP, out=offsets[1:])
+
+    return timestamps + offsets
+
+
+def wall_clock_offset() -> float:
+    """What to add to a time.monotonic() time to get the time.time() of the same moment"""
+
+    return time.time() - time.monotonic()
+
+
+class ClockModel:
+
+    def __init__(self, window: int = 1000, points: int = 60) -> None:
+        """Creates an empty model
+
+        Args:
+            window (int): Radar ms per point of the fit. Only the scan that
+                arrived soonest in each window is used.
+            points (int): How many windows the fit covers, oldest dropped first.
+        """
+        self.window = window
+        self.points = deque(maxlen=points)  # (radar ms, host time) per closed window
+
+        self.bucket = None  # window of the scans being looked at
+        self.best = None  # (radar ms, host time) with the smallest delay in it
+
+        # the fitted line, host = host0 + slope * (radar - radar0) / 1000
+        self.radar0 = None
+        self.host0 = None
+        self.slope = 1.0
+
+        # taken once, so the wall clock being adjusted doesn't bend the line
+        self.wall_offset = wall_clock_offset()
+
+    @property
+    def ready(self) -> bool:
+        """Whether there is a fitted line yet"""
+        return self.radar0 is not None
+
+    @property
+    def drift(self) -> float:
+        """How much faster the host clock runs than the radar's, in ppm"""
+        return (self.slope - 1.0) * 1e6
+
+    def add(self, radar_time: int, host_time: float) -> None:
+        """Adds a scan
+
+        Scans may arrive a little out of order. One from a window that has
+        already been closed is dropped, so every window adds one point.
+
+        Args:
+            radar_time (int): The unwrapped radar timestamp (ms).
+            host_time (float): When the host received it. Ignored if None.
+        """
+        if host_time is None:
+            return
+
+        bucket = radar_time // self.window
+        if self.bucket is not None and bucket < self.bucket:
+            # a late scan from a window that's already closed, don't reopen it
+            return
+
+        if bucket != self.bucket:
+            if self.best is not None:
+                self.points.append(self.best)
+                self.__fit()
+            self.bucket = bucket
+            self.best = None
+
+        if self.best is None or self.__delay(radar_time, host_time) < self.__delay(*self.best):
+            self.best = (radar_time, host_time)
+
+    def __delay(self, radar_time: int, host_time: float) -> float:
+        """Host time minus radar time, which is the clock offset plus the delay"""
+        return host_time - radar_time / 1000
+
+    def __fit(self) -> None:
+        """Fits the line through the points"""
+
+        points = np.array(self.points)
+        x = (points[:, 0] - points[0, 0]) / 1000
+        y = points[:, 1] - points[0, 1]
+
+        x_mean = x.mean()
+        slope = 1.0
+        if np.ptp(x) > 0:
+            slope = np.dot(x - x_mean, y - y.mean()) / np.dot(x - x_mean, x - x_mean)
+
+        self.slope = float(slope)
+        self.radar0 = points[0, 0] + x_mean * 1000
+        self.host0 = points[0, 1] + y.mean()
+
+    def host_time(self, radar_time):
+        """Maps radar time to host time
+
+        Args:
+            radar_time (int or np.ndarray): Unwrapped radar timestamps (ms).
+
+        Returns:
+            The host times, or None if no scans with a host time were added yet
+        """
+        if self.radar0 is not None:
+            return self.host0 + self.slope * (radar_time - self.radar0) / 1000
+
+        # no window has closed yet, use the soonest arrival so far
+        if self.best is None:
+            return None
+        return radar_time / 1000 + self.__delay(*self.best)
+
+    def summary(self) -> dict:
+        """The fitted line, for saving next to a capture
+
+        Returns:
+            dict with keys: radar0 (ms), host0 (s, time.monotonic()), slope,
+            drift (ppm), points, wall_offset (s, add to host0 for time.time())
+        """
+        return {
+            "radar0": None if self.radar0 is None else float(self.radar0),
+            "host0": None if self.host0 is None else float(self.host0),
+            "slope": self.slope,
+            "drift": self.drift,
+            "points": len(self.points),
+            "wall_offset": self.wall_offset
+        }
@@ -0,0 +1,292 @@
+import json
+import os
+import numpy as np
+from lib.clock import wall_clock_offset
+
+# Columnar capture files, read with np.memmap
+#
+# A capture starts with COLUMNAR_MAGIC and a JSON header, padded with
+# spaces to HEADER_SIZE bytes. The samples follow as one contiguous
+# little-endian int32 (frame_count, point_count) matrix, then the
+# timestamps (little-endian int64), the host times (little-endian float64
+# time.time() seconds, NaN where unknown) and the reassembly flags (uint8),
+# each at the offset given in the header. The header also keeps the clock
+# model that gave the scans their host times. Opening a capture only reads the header
+# and maps the rest, so a time window or range gate only touches the pages
+# it covers.
+#
+# The writer appends scans to the matrix as they come in and rewrites the
+# header after every batch. The timestamps, host times and flags are kept in
+# memory and written after the matrix when the file is closed, so a capture
+# cut short by a crash still has its samples up to the last batch, but no
+# timestamps.
+
+COLUMNAR_MAGIC = b"T2CAPM\x00\x01"
+COLUMNAR_EXTENSION = ".t2c"
+
+# the samples start here, on a page boundary
+HEADER_SIZE = 4096
+
+SAMPLE_DTYPE = np.dtype("<i4")
+TIMESTAMP_DTYPE = np.dtype("<i8")
+HOST_TIME_DTYPE = np.dtype("<f8")
+
+
+class ColumnarCaptureWriter:
+    """Writes scans to a columnar capture.
+
+    Has the same interface as save_data.CaptureWriter, so it can be used to
+    stream dynamic scans too.
+    """
+
+    def __init__(self, file_path: str, start_range: float, end_range: float, batch_size=256,
+                 clock=None):
+        """ Opens a capture file for writing.
+            Args:
+                file_path (str): The path where to save the file
+                start_range (float): The start range of the scan (in meters)
+                end_range (float): The end range of the scan (in meters)
+                batch_size (int): How many scans to write between header updates
+                clock (ClockModel): The model that gives the scans their host
+                    times. Its summary is kept in the header.
+        """
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.file_path = file_path
+        self.start_range = start_range
+        self.end_range = end_range
+        self.batch_size = batch_size
+        self.clock = clock
+        # added to host times to put them on the wall clock
+        self.wall_offset = wall_clock_offset() if clock is None else clock.wall_offset
+
+        self.point_count = None  # set by the first scan written
+        self.frame_count = 0  # frames covered by the header on disk
+        self.pending = 0  # frames written since the last header update
+        self.timestamps = np.zeros(batch_size, dtype=TIMESTAMP_DTYPE)
+        self.host_times = np.full(batch_size, np.nan, dtype=HOST_TIME_DTYPE)
+        self.flags = np.zeros(batch_size, dtype=np.uint8)
+
+        self.file = open(file_path, "wb")
+        self.file.write(self.__header())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __header(self, timestamps_offset: int = None, host_times_offset: int = None,
+                 flags_offset: int = None) -> bytes:
+        """Encodes the header, padded to exactly HEADER_SIZE bytes"""
+
+        header = json.dumps({
+            "point_count": self.point_count or 0,
+            "frame_count": self.frame_count,
+            "start_range": self.start_range,
+            "end_range": self.end_range,
+            "samples_offset": HEADER_SIZE,
+            "timestamps_offset": timestamps_offset,
+            "host_times_offset": host_times_offset,
+            "flags_offset": flags_offset,
+            "clock": None if self.clock is None else self.clock.summary()
+        }).encode()
+
+        data = COLUMNAR_MAGIC + header
+        if len(data) > HEADER_SIZE:
+            raise ValueError("capture header doesn't fit in HEADER_SIZE")
+        return data.ljust(HEADER_SIZE, b" ")
+
+    def write(self, timestamps, samples, flags=None, host_times=None) -> None:
+        """ Appends scans to the file.
+            Args:
+                timestamps (np.ndarray): The radar timestamp of each scan
+                samples (np.ndarray): One scan per row. Scans are padded or cut
+                    to the length of the first scan written.
+                flags (np.ndarray): Reassembly flags of each scan, None if all
+                    are complete.
+                host_times (np.ndarray): Host time of each scan, from
+                    time.monotonic(). NaN or None if unknown.
+        """
+        count = len(timestamps)
+        if self.point_count is None:
+            if count == 0:
+                return
+            self.point_count = samples.shape[1]
+
+        if samples.shape[1] == self.point_count:
+            rows = np.ascontiguousarray(samples, dtype=SAMPLE_DTYPE)
+        else:
+            width = min(samples.shape[1], self.point_count)
+            rows = np.zeros((count, self.point_count), dtype=SAMPLE_DTYPE)
+            rows[:, :width] = samples[:, :width]
+        self.file.write(rows.tobytes())
+
+        # the per-scan columns go after the samples once we know how many there are
+        end = self.frame_count + self.pending + count
+        if end > len(self.timestamps):
+            size = max(end, 2 * len(self.timestamps))
+            self.timestamps = np.resize(self.timestamps, size)
+            self.host_times = np.resize(self.host_times, size)
+            self.flags = np.resize(self.flags, size)
+        start = self.frame_count + self.pending
+        self.timestamps[start:end] = timestamps
+        self.host_times[start:end] = np.nan if host_times is None else host_times + self.wall_offset
+        self.flags[start:end] = 0 if flags is None else flags
+
+        self.pending += count
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def write_buffer(self, buffer) -> int:
+        """ Moves every scan out of a ScanBuffer into the file.
+            Args:
+                buffer (ScanBuffer): The buffer to drain. It is left empty.
+            Returns:
+                The number of scans written
+        """
+        count = len(buffer)
+        if count == 0:
+            return 0
+
+        buffer.sort()
+        self.write(*buffer.arrays(), buffer.latest_flags(count), buffer.latest_host_times(count))
+        buffer.clear()
+
+        return count
+
+    def flush(self) -> None:
+        """ Writes out everything so far and updates the header to cover it."""
+
+        # the samples have to be on disk before the header counts them
+        self.file.flush()
+        self.frame_count += self.pending
+        self.pending = 0
+
+        self.file.seek(0)
+        self.file.write(self.__header())
+        self.file.seek(0, os.SEEK_END)
+        self.file.flush()
+
+    def close(self) -> None:
+        """ Writes the per-scan columns, finalises the header and closes the file."""
+
+        if self.file is None:
+            return
+
+        self.flush()
+
+        # samples end on a multiple of 4 bytes, pad to 8 for the timestamps
+        timestamps_offset = self.file.tell()
+        timestamps_offset += -timestamps_offset % TIMESTAMP_DTYPE.itemsize
+        host_times_offset = timestamps_offset + self.frame_count * TIMESTAMP_DTYPE.itemsize
+        flags_offset = host_times_offset + self.frame_count * HOST_TIME_DTYPE.itemsize
+
+        self.file.seek(timestamps_offset)
+        self.file.write(self.timestamps[:self.frame_count].tobytes())
+        self.file.write(self.host_times[:self.frame_count].tobytes())
+        self.file.write(self.flags[:self.frame_count].tobytes())
+
+        self.file.seek(0)
+        self.file.write(self.__header(timestamps_offset, host_times_offset, flags_offset))
+        self.file.close()
+        self.file = None
+
+
+def is_columnar(file_path: str) -> bool:
+    """Checks whether a file is a columnar capture"""
+
+    with open(file_path, "rb") as f:
+        return f.read(len(COLUMNAR_MAGIC)) == COLUMNAR_MAGIC
+
+
+def open_capture(file_path: str) -> dict:
+    """Maps a columnar capture without reading it
+
+    Args:
+        file_path (str): The capture.
+
+    Returns:
+        dict with keys: header (dict), samples ((frames, points) int32
+        memmap), timestamps (int64 memmap), host_times (float64 memmap,
+        time.time() seconds), flags (uint8 memmap). The maps are read-only.
+        For a capture that was never closed, timestamps and flags are 0, host
+        times are NaN and a warning is printed.
+    """
+    with open(file_path, "rb") as f:
+        f.seek(len(COLUMNAR_MAGIC))
+        header = json.loads(f.read(HEADER_SIZE - len(COLUMNAR_MAGIC)))
+
+    frames = header["frame_count"]
+    points = header["point_count"]
+
+    def column(offset, dtype, shape):
+        if frames == 0 or points == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(file_path, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+    samples = column(header["samples_offset"], SAMPLE_DTYPE, (frames, points))
+
+    if header["timestamps_offset"] is None:
+        print(f"WARNING: {file_path} was not closed, its timestamps are missing")
+        timestamps = np.zeros(frames, dtype=TIMESTAMP_DTYPE)
+        host_times = np.full(frames, np.nan)
+        flags = np.zeros(frames, dtype=np.uint8)
+    else:
+        timestamps = column(header["timestamps_offset"], TIMESTAMP_DTYPE, (frames,))
+        flags = column(header["flags_offset"], np.uint8, (frames,))
+
+        # captures from before host times were saved don't have them
+        if header.get("host_times_offset") is None:
+            host_times = np.full(frames, np.nan)
+        else:
+            host_times = column(header["host_times_offset"], HOST_TIME_DTYPE, (frames,))
+
+    return {"header": header, "samples": samples, "timestamps": timestamps,
+            "host_times": host_times, "flags": flags}
+
+
+def frame_window(timestamps: np.ndarray, start_time: float = None, end_time: float = None) -> slice:
+    """Finds the scans taken in a time window
+
+    Args:
+        timestamps (np.ndarray): The scan timestamps (ms), in order.
+        start_time (float): First timestamp to include, None for the start.
+        end_time (float): Timestamp to stop before, None for the end.
+
+    Returns:
+        The slice of scans
+    """
+    start = 0 if start_time is None else int(np.searchsorted(timestamps, start_time, "left"))
+    end = len(timestamps) if end_time is None else int(np.searchsorted(timestamps, end_time, "left"))
+    return slice(start, max(start, end))
+
+
+def bin_window(header: dict, start_range: float = None, end_range: float = None) -> slice:
+    """Finds the range bins that cover a range gate
+
+    Args:
+        header (dict): The capture header, with start_range, end_range and point_count.
+        start_range (float): Nearest range to include (in meters), None for the start.
+        end_range (float): Farthest range to include (in meters), None for the end.
+
+    Returns:
+        The slice of range bins
+    """
+    points = header["point_count"]
+    ranges = np.linspace(header["start_range"], header["end_range"], points)
+
+    start = 0 if start_range is None else int(np.searchsorted(ranges, start_range, "left"))
+    end = points if end_range is None else int(np.searchsorted(ranges, end_range, "right"))
+    return slice(start, max(start, end))
+
+
+def columnar_from_config(config: dict) -> bool:
+    """Whether the "storage" section of config.json asks for columnar captures
+
+    Args:
+        config (dict): The whole config.
+    """
+    return config.get("storage", {}).get("format", "pickle") == "columnar"
@@ -1,21 +1,72 @@
-from collections import deque
-from lib.mrmapi import get_outgoing, resolve_name, mrmapi, get_incoming
-from lib.radario import send_payload, recv_payload
-import numpy as np
+from time import perf_counter
+from lib.scanbuffer import ScanBuffer
+from lib.reassembly import ScanReassembler
+from lib.metrics import IngestMetrics
+from lib.clock import TimestampUnwrapper, ClockModel
+from lib.detection import DetectionStore
+from lib.reduction import ScanReducer
+from lib.mrmapi import get_outgoing, resolve_name, mrmapi, get_incoming, FILTER_RAW, \
+    FILTER_DETECTION_LIST
+from lib.radario import RadarConnection, get_connection
 
 # Handles all communication with the Radio
 
 
 class commanager:
-    mode = "sync"  # sync or async
-    databuffer = deque()  # buffer for samples sent from the radar
-    nextmsgid = 0  # the next message ID to use
-    packet_buckets = {}  # buckets for packets that need to be processed
-    bucket_contents = []  # contents of the buckets
-    shutdown_mode = False  # whether or we are in the process of shutting down
-
-    def __init__(self) -> None:
-        self.mode = "sync"
+
+    def __init__(self, buffer_capacity: int = None, connection: RadarConnection = None,
+                 reducer: ScanReducer = None, expiry: int = 3000, salvage: str = None) -> None:
+        """Creates the manager. All state belongs to the instance, so several
+        managers can talk to several radars at once.
+
+        Args:
+            buffer_capacity (int): The most scans to keep in the databuffer.
+                Once full, the oldest scans are overwritten. None keeps all.
+            connection (RadarConnection): The radar to talk to. Defaults to
+                the radar in config.json, connected on first use.
+            reducer (ScanReducer): Gates, averages and decimates scans before
+                they are buffered. None keeps every sample of every scan.
+            expiry (int): How long (in radar ms) to wait for the missing parts
+                of a scan.
+            salvage (str): What to do with scans still missing parts after
+                that, see ScanReassembler. None discards them.
+        """
+        self.mode = "sync"  # sync or async
+        self.buffer_capacity = buffer_capacity
+        self.databuffer = ScanBuffer(buffer_capacity)  # buffer for samples sent from the radar
+        self.nextmsgid = 0  # the next message ID to use
+        self.expiry = expiry
+        self.salvage = salvage
+        self.reassembler = ScanReassembler(expiry, salvage)  # scans that are still missing parts
+        self.metrics = IngestMetrics()  # ingest counters and timings
+        self.unwrapper = TimestampUnwrapper()  # undoes rollover of the radar's ms counter
+        self.clock = ClockModel()  # maps radar time to host time
+        self.detections = None  # DetectionStore, once detection lists are turned on
+        self.reducer = reducer  # reduction applied to each reassembled scan
+        self.shutdown_mode = False  # whether or we are in the process of shutting down
+        self.controller = None  # RateController adjusting the scan rate, if any
+        self.expected_confirms = set()  # msgids of control requests sent while scanning
+        self.__connection = connection
+
+    def set_reassembly(self, expiry: int = 3000, salvage: str = None) -> None:
+        """Changes how long to wait for missing parts and what to do after.
+        Scans that are still in flight are dropped.
+
+        Args:
+            expiry (int): See __init__.
+            salvage (str): See __init__.
+        """
+        self.expiry = expiry
+        self.salvage = salvage
+        self.reassembler = ScanReassembler(expiry, salvage)
+
+    @property
+    def connection(self) -> RadarConnection:
+        """The radar connection, the default one unless another was given"""
+
+        if self.__connection is None:
+            self.__connection = get_connection()
+        return self.__connection
 
     def __gen_msg_id__(self) -> int:
         """Generates a message ID.
@@ -23,18 +74,27 @@ class commanager:
         Returns:
             The message ID.
         """
-        self.nextmsgid += 1
+        # message IDs are 16 bits on the wire
+        self.nextmsgid = (self.nextmsgid + 1) & 0xFFFF
         return self.nextmsgid
 
     def __reset__(self):
         """ Resets bac to defaults"""
 
         self.mode = "sync"
-        self.databuffer = deque()
+        self.databuffer = ScanBuffer(self.buffer_capacity)
         self.nextmsgid = 0
-        self.packet_buckets = {}
-        self.bucket_contents = []
+        self.reassembler = ScanReassembler(self.expiry, self.salvage)
+        self.metrics = IngestMetrics()
+        self.unwrapper = TimestampUnwrapper()
+        self.clock = ClockModel()
+        if self.detections is not None:
+            self.detections = DetectionStore()
         self.shutdown_mode = False
+        self.controller = None
+        self.expected_confirms = set()
+        if self.reducer is not None:
+            self.reducer.reset()
 
     # Send a sync message to the radar
 
@@ -60,11 +120,8 @@ class commanager:
         # generate a message ID
         msgid = self.__gen_msg_id__()
 
-        # process the message
-        payload = process_func["func"](**kwargs)
-
-        # send it off
-        send_payload(msgtype, msgid, payload)
+        # pack the message and send it off
+        self.connection.send_message(msgtype, msgid, process_func["codec"], **kwargs)
 
         # check if we need to wait for a response
         targetID = process_func["responseID"]
@@ -82,7 +139,7 @@ class commanager:
         # other packets, we can just discard them
 
         while True:
-            msgtype, _msgid, payload = recv_payload()
+            msgtype, _msgid, payload = self.connection.recv_payload()
 
             # if we get a good response or error packet
             if msgtype == targetID or msgtype == 0xF10C:
@@ -112,7 +169,8 @@ class commanager:
         """Gets data from the radar. Data is stored in the databuffer.
 
         Args:
-            num_scans (int): The number of scans to get.
+            num_scans (int): The number of scans to get. These are counted as
+                they are reassembled, before any reduction.
 
         Returns:
             Whether or not it needs to be called again.
@@ -137,86 +195,174 @@ class commanager:
         # grab the next packet
         # except on socket timeout
         try:
-            msgtype, msgid, payload = recv_payload()
+            msgtype, msgid, payload, rx_time = self.connection.recv_packet()
         except TimeoutError:
             # If we got here, we're no longer getting any data from the radar
             return False
 
-        # if we get a MRM_SET_SLEEPMODE_CONFIRM or MRM_CONTROL_CONFIRM
-        # go into shutdown mode
-        if msgtype == 0xF10C or msgtype == 0xF10B:
-            self.shutdown_mode = True
+        self.handle_packet(msgtype, msgid, payload, rx_time)
+
+        if self.controller is not None:
+            self.controller.update(self)
+
+        # are we done? count what the radar sent, so averaging and
+        # decimation don't make us wait for scans that will never come.
+        # Scans held back by salvage mode are released when the scan ends.
+        # Without raw scans, every scan is a detection list
+        scans = max(self.received_scans(), self.metrics.detection_lists)
+        if num_scans <= scans:
+            return False
+        else:
+            return True
+
+    def handle_packet(self, msgtype: int, msgid: int, payload: bytes, rx_time: float = None):
+        """Processes a single packet received outside of a sync exchange.
+        Completed scans are stored in the databuffer.
+
+        Args:
+            msgtype (int): The message type.
+            msgid (int): The message ID.
+            payload (bytes): The payload.
+            rx_time (float): Host receive time of the packet, if known.
+
+        Returns:
+            The last PendingScan stored because of this packet, or None. Its
+            samples have already been moved into the databuffer. In salvage
+            mode a packet can release several scans, or complete one that is
+            only stored later.
+        """
+
+        metrics = self.metrics
+        metrics.packet(msgtype, len(payload) + 4)
+
+        # if we get a MRM_SET_SLEEPMODE_CONFIRM, MRM_CONTROL_CONFIRM or an
+        # error packet go into shutdown mode, unless it confirms a rate change
+        if msgtype == 0x1103 or msgtype == 0xF105 or msgtype == 0xF10C:
+            if msgid in self.expected_confirms:
+                self.expected_confirms.discard(msgid)
+            else:
+                self.shutdown_mode = True
+
+        # MRM_DETECTION_LIST_INFO, if we asked for them
+        if msgtype == 0x1201:
+            if self.detections is not None:
+                detections = mrmapi.MRM_DETECTION_LIST_INFO(payload)["detections"]
+                self.detections.append(detections, rx_time)
+                metrics.detection_list(len(detections))
+            return None
 
         # check if it's not MRM_SCAN_INFO
         if msgtype != 0xF201:
             # ignore it
-            return True
+            return None
 
         # parse it
+        start = perf_counter()
         data = mrmapi.MRM_SCAN_INFO(payload)
+        data["timestamp"] = self.unwrapper.unwrap(data["timestamp"])
+        decoded = perf_counter()
 
-        # check if we've seen this bucket before
-        timestamp = data["timestamp"]
-        if timestamp not in self.bucket_contents:
-            # create a new bucket
-            self.packet_buckets[timestamp] = {
-                "totalParts": data["messageCount"],
-                "partsFound": 1,
-                "data": [{
-                    "index": data["messageIndex"],
-                    "data": data["scanData"]
-                }]
-            }
-            self.bucket_contents.append(timestamp)
+        # the part is copied straight from the receive buffer into its scan
+        scan = self.reassembler.add(data, rx_time)
+        if scan is not None:
+            # we have all the parts, reduce it and add it to the buffer
+            self.__store(scan)
 
-        else:
+        # in salvage mode, scans come out here in timestamp order
+        for scan in self.reassembler.collect(data["timestamp"]):
+            self.__store(scan)
 
-            self.packet_buckets[timestamp]["partsFound"] += 1
-            self.packet_buckets[timestamp]["data"].append({
-                "index": data["messageIndex"],
-                "data": data["scanData"]
-            })
-
-        # check if we've found all the parts
-        if self.packet_buckets[timestamp]["partsFound"] == self.packet_buckets[timestamp]["totalParts"]:
-            # we have all the parts, so we can reassemble the data
-
-            # sort the data
-            self.packet_buckets[timestamp]["data"].sort(
-                key=lambda x: x["index"])
-
-            # reassemble the data
-            data = []
-
-            for part in self.packet_buckets[timestamp]["data"]:
-                data += part["data"]
-
-            # add it to the buffer
-            self.databuffer.append({
-                "timestamp": timestamp,
-                "data": np.array(data)
-            })
-
-            # remove the bucket
-            del self.packet_buckets[timestamp]
-            self.bucket_contents.remove(timestamp)
-
-        # look for old buckets
-        for _timestamp in self.bucket_contents:
-
-            # older than 3 seconds
-            if _timestamp < timestamp - 3000:
-                # remove the bucket
-                del self.packet_buckets[_timestamp]
-                self.bucket_contents.remove(_timestamp)
-                print(
-                    f"WARNING: Discarded scan {_timestamp} due to missing packets!")
-
-        # are we done?
-        if num_scans <= len(self.databuffer):
-            return False
+        done = perf_counter()
+        metrics.decode_time.add((decoded - start) * 1e6)
+        metrics.reassembly_time.add((done - decoded) * 1e6)
+
+        # look for old buckets (older than 3 seconds)
+        for _timestamp in self.reassembler.expire(data["timestamp"]):
+            metrics.expired += 1
+            print(
+                f"WARNING: Discarded scan {_timestamp} due to missing packets!")
+
+        return scan
+
+    def __store(self, scan) -> None:
+        """Reduces a reassembled scan, adds it to the databuffer and counts it"""
+
+        # the first part left the radar soonest after the scan was taken
+        self.clock.add(scan.timestamp, scan.first_rx)
+        host_time = self.clock.host_time(scan.timestamp)
+
+        if self.reducer is None:
+            self.databuffer.append(scan.timestamp, scan.samples, host_time, scan.flags)
         else:
-            return True
+            reduced = self.reducer.process(scan.timestamp, scan.samples, host_time, scan.flags)
+            if reduced is not None:
+                self.databuffer.append(*reduced)
+        self.reassembler.release(scan)
+
+        # time spent waiting for the rest of the parts
+        latency = None
+        if scan.last_rx is not None and scan.first_rx is not None:
+            latency = scan.last_rx - scan.first_rx
+        self.metrics.scan(scan.timestamp, scan.messageCount, latency, scan.flags)
+
+    def send_control(self, scan_count: int, scan_interval: int) -> None:
+        """Restarts scanning with a new count and interval without stopping
+        the scan in progress. Its confirm doesn't trigger shutdown mode.
+
+        Args:
+            scan_count (int): Scans to take, 65535 for continuous.
+            scan_interval (int): Time between scans (us).
+        """
+        self.send_sync("MRM_CONTROL_REQUEST", True,
+                       scanCount=scan_count, scanIntervalTime=scan_interval)
+        self.expected_confirms.add(self.nextmsgid)
+
+    def flush_reassembly(self) -> None:
+        """Stores the scans salvage mode is still holding back, at the end of a scan"""
+
+        for scan in self.reassembler.flush():
+            self.__store(scan)
+
+    def received_scans(self) -> int:
+        """Counts the scans the radar sent, before reduction
+
+        Includes the scans salvage mode is still holding back, which
+        flush_reassembly() stores once the scan is over.
+        """
+        held = len(self.reassembler.ready)
+        if self.reassembler.salvage is not None:
+            # incomplete scans are salvaged rather than dropped
+            held += len(self.reassembler)
+        return self.metrics.scans + held
+
+    def __receiver(self):
+        """The connection's receive thread, without connecting if there's no connection yet"""
+
+        if self.__connection is None:
+            return None
+        return self.__connection.receiver
+
+    def get_metrics(self) -> dict:
+        """Gets the ingest metrics for the current capture.
+
+        Returns:
+            dict, see IngestMetrics.summary(), with the clock model under "clock"
+        """
+        summary = self.metrics.summary(self.reassembler, self.__receiver())
+        summary["clock"] = self.clock.summary()
+        return summary
+
+    def metrics_report(self) -> list[str]:
+        """Gets the ingest metrics as a few lines for a log.
+
+        Returns:
+            list of strings
+        """
+        report = self.metrics.report(self.reassembler, self.__receiver())
+        if self.clock.ready:
+            seconds = len(self.clock.points) * self.clock.window / 1000
+            report.append(f"Clock drift: {self.clock.drift:+.1f} ppm over {seconds:.0f} s")
+        return report
 
     # the following are metafunctions
     def init_radar(self, **kwargs):
@@ -236,13 +382,13 @@ class commanager:
         config = self.send_sync("MRM_GET_CONFIG_REQUEST", False)
         return config
 
-    def exec_scan(self, scan_count: int, scan_interval: int) -> deque:
+    def exec_scan(self, scan_count: int, scan_interval: int) -> ScanBuffer:
         """Executes a scan.
           Args:
               scan_count (int): Number of scans to execute
               scanInterval (int): Time between scans
           Returns:
-              A deque of data sets
+              A ScanBuffer of data sets
         """
 
         # data validation on scan_count
@@ -283,6 +429,42 @@ class commanager:
         # return the data
         return self.databuffer
 
+    def __resolve__buffers__(self):
+        """Puts the buffered scans in timestamp order."""
+
+        self.flush_reassembly()
+        self.databuffer.sort()
+
+    def set_detection_mode(self, enabled: bool, keep_scans: bool = False,
+                           motion_filter_index: int = 0) -> dict:
+        """Turns the radar's detection lists on or off. Call it before starting a scan.
+
+        Detection lists are collected in self.detections instead of the
+        databuffer. exec_scan counts them like scans.
+
+        Args:
+            enabled (bool): Whether to send detection lists.
+            keep_scans (bool): Whether to keep sending raw scans as well.
+                Always True when enabled is False.
+            motion_filter_index (int): The radar's motion filter setting.
+
+        Returns:
+            The filter config read back from the radar
+        """
+        mask = FILTER_RAW
+        if enabled:
+            mask = FILTER_DETECTION_LIST | (FILTER_RAW if keep_scans else 0)
+
+        self.send_sync("MRM_SET_FILTER_CONFIG_REQUEST", False, filterMask=mask,
+                       motionFilterIndex=motion_filter_index)
+        config = self.send_sync("MRM_GET_FILTER_CONFIG_REQUEST", False)
+
+        if config["filterMask"] != mask:
+            print("WARNING: Radar did not take the filter config!")
+
+        self.detections = DetectionStore() if enabled else None
+        return config
+
     def sleep_radar(self):
         """Puts the radar to sleep."""
 
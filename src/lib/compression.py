@@ -0,0 +1,369 @@
+import json
+import lzma
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from lib.clock import wall_clock_offset
+
+# Compressed capture files
+#
+# A capture starts with COMPRESSED_MAGIC, then a length-prefixed JSON header
+# (ranges, codec, transform, clock model), then any number of chunks. Each
+# chunk has its own small header (frames, point count, compressed size)
+# followed by the compressed timestamps (little-endian int64), reassembly
+# flags (uint8, if the header says "flags"), host times (little-endian
+# float64 time.time() seconds, if the header says "host_times") and samples
+# (little-endian int32, after the transform). The JSON header is padded with
+# spaces, so it can be rewritten in place as the clock model improves. Chunks decode independently, so a file is
+# readable up to its last complete chunk and chunks can be decoded in
+# parallel. zlib and lzma release the GIL, so threads are enough.
+
+COMPRESSED_MAGIC = b"T2CAPZ\x00\x01"
+COMPRESSED_EXTENSION = ".t2z"
+
+# bytes the JSON header is padded to
+HEADER_PAD = 1024
+
+HEADER_LENGTH = struct.Struct(">I")
+CHUNK_HEADER = struct.Struct(">III")  # frames, point count, compressed size
+
+CODECS = {
+    "zlib": (lambda data, level: zlib.compress(data, 6 if level is None else level),
+             zlib.decompress),
+    "lzma": (lambda data, level: lzma.compress(data, preset=6 if level is None else level),
+             lzma.decompress),
+    "none": (lambda data, level: bytes(data), bytes)
+}
+
+TRANSFORMS = ["none", "delta", "shuffle", "delta+shuffle"]
+
+
+def encode_samples(samples: np.ndarray, transform: str) -> bytes:
+    """Applies a transform to a block of scans
+
+    Args:
+        samples (np.ndarray): One scan per row.
+        transform (str): One of TRANSFORMS. "delta" stores the difference
+            between neighbouring samples of each scan, "shuffle" groups the
+            bytes of every sample by significance.
+
+    Returns:
+        The transformed samples as bytes
+    """
+    data = np.ascontiguousarray(samples, dtype="<i4")
+
+    if "delta" in transform:
+        # int32 wraps around, and so does the cumsum that undoes it
+        delta = np.empty_like(data)
+        delta[:, :1] = data[:, :1]
+        np.subtract(data[:, 1:], data[:, :-1], out=delta[:, 1:])
+        data = delta
+
+    if "shuffle" in transform:
+        return data.view(np.uint8).reshape(-1, 4).T.tobytes()
+
+    return data.tobytes()
+
+
+def decode_samples(raw: bytes, frames: int, point_count: int, transform: str,
+                   out: np.ndarray = None) -> np.ndarray:
+    """Undoes encode_samples()
+
+    Args:
+        raw (bytes): The transformed samples.
+        frames (int): Number of scans.
+        point_count (int): Samples per scan.
+        transform (str): The transform that was applied.
+        out (np.ndarray): Where to write the scans, allocated if None.
+
+    Returns:
+        The scans, one per row
+    """
+    if "shuffle" in transform:
+        data = np.frombuffer(raw, dtype=np.uint8).reshape(4, -1).T.copy().view("<i4")
+    else:
+        data = np.frombuffer(raw, dtype="<i4")
+    data = data.reshape(frames, point_count)
+
+    if out is None:
+        out = np.empty((frames, point_count), dtype=np.int32)
+
+    if "delta" in transform:
+        np.cumsum(data, axis=1, dtype=np.int32, out=out)
+    else:
+        out[:] = data
+
+    return out
+
+
+class CompressedCaptureWriter:
+    """Writes scans to a compressed capture, one chunk at a time.
+
+    Has the same interface as save_data.CaptureWriter, so it can be used to
+    stream dynamic scans too.
+    """
+
+    def __init__(self, file_path: str, start_range: float, end_range: float, codec="zlib",
+                 transform="shuffle", level: int = None, chunk_frames=256, clock=None):
+        """ Opens a capture file for writing.
+            Args:
+                file_path (str): The path where to save the file
+                start_range (float): The start range of the scan (in meters)
+                end_range (float): The end range of the scan (in meters)
+                codec (str): "zlib", "lzma" or "none"
+                transform (str): One of TRANSFORMS
+                level (int): Compression level, None for the codec default
+                chunk_frames (int): Scans per chunk
+                clock (ClockModel): The model that gives the scans their host
+                    times. Its summary is kept in the header.
+        """
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec {codec}, expected one of {list(CODECS)}")
+        if transform not in TRANSFORMS:
+            raise ValueError(f"Unknown transform {transform}, expected one of {TRANSFORMS}")
+
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.file_path = file_path
+        self.start_range = start_range
+        self.end_range = end_range
+        self.codec = codec
+        self.transform = transform
+        self.level = level
+        self.chunk_frames = chunk_frames
+        self.clock = clock
+        # added to host times to put them on the wall clock
+        self.wall_offset = wall_clock_offset() if clock is None else clock.wall_offset
+
+        self.point_count = None  # set by the first scan written
+        self.frame_count = 0  # frames in complete chunks on disk
+        self.pending = 0  # frames waiting for the next chunk
+        self.timestamps = np.zeros(chunk_frames, dtype="<i8")
+        self.flags = np.zeros(chunk_frames, dtype=np.uint8)
+        self.host_times = np.full(chunk_frames, np.nan, dtype="<f8")
+        self.samples = None
+
+        self.file = open(file_path, "wb")
+        self.file.write(COMPRESSED_MAGIC + HEADER_LENGTH.pack(HEADER_PAD) + self.__header())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __header(self) -> bytes:
+        """Encodes the JSON header, padded to exactly HEADER_PAD bytes"""
+
+        header = json.dumps({
+            "start_range": self.start_range,
+            "end_range": self.end_range,
+            "codec": self.codec,
+            "transform": self.transform,
+            "flags": True,
+            "host_times": True,
+            "clock": None if self.clock is None else self.clock.summary()
+        }).encode()
+
+        if len(header) > HEADER_PAD:
+            raise ValueError("capture header doesn't fit in HEADER_PAD")
+        return header.ljust(HEADER_PAD, b" ")
+
+    def write(self, timestamps, samples, flags=None, host_times=None) -> None:
+        """ Appends scans to the file.
+            Args:
+                timestamps (np.ndarray): The radar timestamp of each scan
+                samples (np.ndarray): One scan per row. Scans are padded or cut
+                    to the length of the first scan written.
+                flags (np.ndarray): Reassembly flags of each scan, None if all
+                    are complete.
+                host_times (np.ndarray): Host time of each scan, from
+                    time.monotonic(). NaN or None if unknown.
+        """
+        if self.point_count is None:
+            if len(timestamps) == 0:
+                return
+            self.point_count = samples.shape[1]
+            self.samples = np.zeros((self.chunk_frames, self.point_count), dtype=np.int32)
+
+        width = min(samples.shape[1], self.point_count)
+        done = 0
+        while done < len(timestamps):
+            count = min(len(timestamps) - done, self.chunk_frames - self.pending)
+            rows = slice(self.pending, self.pending + count)
+
+            self.timestamps[rows] = timestamps[done:done + count]
+            self.flags[rows] = 0 if flags is None else flags[done:done + count]
+            if host_times is None:
+                self.host_times[rows] = np.nan
+            else:
+                self.host_times[rows] = host_times[done:done + count] + self.wall_offset
+            self.samples[rows, :width] = samples[done:done + count, :width]
+            self.samples[rows, width:] = 0
+
+            self.pending += count
+            done += count
+
+            if self.pending == self.chunk_frames:
+                self.flush()
+
+    def write_buffer(self, buffer) -> int:
+        """ Moves every scan out of a ScanBuffer into the file.
+            Args:
+                buffer (ScanBuffer): The buffer to drain. It is left empty.
+            Returns:
+                The number of scans written
+        """
+        count = len(buffer)
+        if count == 0:
+            return 0
+
+        buffer.sort()
+        self.write(*buffer.arrays(), buffer.latest_flags(count), buffer.latest_host_times(count))
+        buffer.clear()
+
+        return count
+
+    def flush(self) -> None:
+        """ Compresses the pending scans into a chunk and writes it out."""
+
+        if self.pending == 0:
+            return
+
+        compress = CODECS[self.codec][0]
+        raw = self.timestamps[:self.pending].tobytes() + self.flags[:self.pending].tobytes() + \
+            self.host_times[:self.pending].tobytes() + \
+            encode_samples(self.samples[:self.pending], self.transform)
+        data = compress(raw, self.level)
+
+        self.file.write(CHUNK_HEADER.pack(self.pending, self.point_count, len(data)))
+        self.file.write(data)
+
+        # keep the clock model in the header current
+        self.file.seek(len(COMPRESSED_MAGIC) + HEADER_LENGTH.size)
+        self.file.write(self.__header())
+        self.file.seek(0, os.SEEK_END)
+        self.file.flush()
+
+        self.frame_count += self.pending
+        self.pending = 0
+
+    def close(self) -> None:
+        """ Writes the last chunk and closes the file."""
+
+        if self.file is None:
+            return
+
+        self.flush()
+        self.file.close()
+        self.file = None
+
+
+def is_compressed(file_path: str) -> bool:
+    """Checks whether a file is a compressed capture"""
+
+    with open(file_path, "rb") as f:
+        return f.read(len(COMPRESSED_MAGIC)) == COMPRESSED_MAGIC
+
+
+def read_compressed(file_path: str, workers: int = None) -> dict:
+    """Reads a compressed capture, decoding the chunks in parallel
+
+    Args:
+        file_path (str): The capture to read.
+        workers (int): Decoding threads, None for one per CPU.
+
+    Returns:
+        dict with keys: header (dict), timestamps (np.ndarray), samples (np.ndarray),
+        flags (np.ndarray, all 0 for files written before flags were saved),
+        host_times (np.ndarray of time.time() seconds, NaN where unknown)
+    """
+    with open(file_path, "rb") as f:
+        data = f.read()
+
+    if not data.startswith(COMPRESSED_MAGIC):
+        raise ValueError(f"{file_path} is not a compressed capture")
+
+    offset = len(COMPRESSED_MAGIC)
+    (length,) = HEADER_LENGTH.unpack_from(data, offset)
+    offset += HEADER_LENGTH.size
+    header = json.loads(data[offset:offset + length])
+    offset += length
+
+    # find the chunks, a chunk cut short by a crash is left out
+    chunks = []  # (offset, size, first frame, frames, point count)
+    frames = 0
+    point_count = 0
+    view = memoryview(data)
+    while offset + CHUNK_HEADER.size <= len(data):
+        count, width, size = CHUNK_HEADER.unpack_from(data, offset)
+        offset += CHUNK_HEADER.size
+        if offset + size > len(data):
+            break
+
+        chunks.append((offset, size, frames, count, width))
+        frames += count
+        point_count = max(point_count, width)
+        offset += size
+
+    timestamps = np.zeros(frames, dtype=np.int64)
+    flags = np.zeros(frames, dtype=np.uint8)
+    host_times = np.full(frames, np.nan)
+    samples = np.zeros((frames, point_count), dtype=np.int32)
+    decompress = CODECS[header["codec"]][1]
+    has_flags = header.get("flags", False)
+    has_host_times = header.get("host_times", False)
+
+    def decode(chunk):
+        start, size, first, count, width = chunk
+        raw = decompress(view[start:start + size])
+
+        timestamps[first:first + count] = np.frombuffer(raw, dtype="<i8", count=count)
+        offset = count * 8
+        if has_flags:
+            flags[first:first + count] = np.frombuffer(raw, dtype=np.uint8, count=count,
+                                                       offset=offset)
+            offset += count
+        if has_host_times:
+            host_times[first:first + count] = np.frombuffer(raw, dtype="<f8", count=count,
+                                                            offset=offset)
+            offset += count * 8
+        decode_samples(memoryview(raw)[offset:], count, width, header["transform"],
+                       out=samples[first:first + count, :width])
+
+    if len(chunks) > 1 and workers != 1:
+        with ThreadPoolExecutor(workers) as pool:
+            list(pool.map(decode, chunks))
+    else:
+        for chunk in chunks:
+            decode(chunk)
+
+    header["point_count"] = point_count
+    header["frame_count"] = frames
+
+    return {"header": header, "timestamps": timestamps, "samples": samples, "flags": flags,
+            "host_times": host_times}
+
+
+def compression_from_config(config: dict) -> dict or None:
+    """Gets the capture compression settings from the "storage" section of config.json
+
+    Args:
+        config (dict): The whole config.
+
+    Returns:
+        Keyword arguments for CompressedCaptureWriter, or None for plain pickle captures
+    """
+    storage = config.get("storage", {})
+    if not storage.get("compression"):
+        return None
+
+    return {
+        "codec": storage["compression"],
+        "transform": storage.get("transform", "shuffle"),
+        "level": storage.get("level", None)
+    }
@@ -33,6 +33,40 @@ def create_default_config():
         },
         "ui": {
             "units": "m"
+        },
+        "reduction": {
+            "gateStart": 0,
+            "gateEnd": None,
+            "average": 1,
+            "decimate": 1
+        },
+        "reassembly": {
+            "expiry": 3000,
+            "salvage": None
+        },
+        "detection": {
+            "enabled": False,
+            "keepScans": False,
+            "motionFilterIndex": 0
+        },
+        "rateControl": {
+            "enabled": False,
+            "minInterval": 0,
+            "maxInterval": 100000,
+            "step": 1000,
+            "maxDropRate": 0.01,
+            "maxBacklog": 64,
+            "period": 1.0
+        },
+        "snapshot": {
+            "average": 1,
+            "ringSize": 64
+        },
+        "storage": {
+            "format": "pickle",
+            "compression": None,
+            "transform": "shuffle",
+            "level": None
         }
     }
 
@@ -0,0 +1,157 @@
+import numpy as np
+from lib.util import ps_to_range
+
+# Storage for the radar's own detection lists
+# With FILTER_DETECTION_LIST set in the filter config, the radar sends an
+# MRM_DETECTION_LIST_INFO after every scan: up to 350 (sample index,
+# magnitude) pairs instead of the thousands of samples of the scan itself.
+# Detection lists carry no timestamp, so each one is stamped with the host
+# time it was received. Detections are kept as columns of preallocated
+# arrays that grow in chunks, one row per detection.
+
+# ps between samples with the default scanResolution
+SAMPLE_PERIOD = 61
+
+
+class DetectionStore:
+
+    def __init__(self, chunk: int = 65536) -> None:
+        """Creates an empty store
+
+        Args:
+            chunk (int): How many detections to add each time the store grows.
+        """
+        self.chunk = chunk
+
+        self.list_numbers = np.zeros(0, dtype=np.int64)  # which list each detection came in
+        self.host_times = np.zeros(0, dtype=np.float64)  # when that list was received
+        self.indexes = np.zeros(0, dtype=np.uint16)  # sample index in the scan
+        self.magnitudes = np.zeros(0, dtype=np.int16)
+
+        self.count = 0  # number of detections stored
+        self.lists = 0  # number of lists stored, empty ones included
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the store in bytes"""
+        return self.list_numbers.nbytes + self.host_times.nbytes + self.indexes.nbytes + \
+            self.magnitudes.nbytes
+
+    def __grow(self, rows: int) -> None:
+        """Reallocates the columns to hold rows detections"""
+
+        for name in ("list_numbers", "host_times", "indexes", "magnitudes"):
+            old = getattr(self, name)
+            new = np.zeros(rows, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def append(self, detections: np.ndarray, host_time: float = None) -> None:
+        """Adds a detection list
+
+        Args:
+            detections (np.ndarray): The list, see mrmapi.DETECTION_DTYPE.
+            host_time (float): When the host received it, from time.monotonic().
+                NaN if not given.
+        """
+        count = len(detections)
+        end = self.count + count
+
+        if end > len(self.indexes):
+            self.__grow(max(end, len(self.indexes) + self.chunk))
+
+        self.list_numbers[self.count:end] = self.lists
+        self.host_times[self.count:end] = np.nan if host_time is None else host_time
+        self.indexes[self.count:end] = detections["index"]
+        self.magnitudes[self.count:end] = detections["magnitude"]
+
+        self.count = end
+        self.lists += 1
+
+    def arrays(self) -> dict:
+        """The stored detections, oldest first
+
+        Returns:
+            dict with keys: list_numbers, host_times, indexes, magnitudes (views)
+        """
+        return {
+            "list_numbers": self.list_numbers[:self.count],
+            "host_times": self.host_times[:self.count],
+            "indexes": self.indexes[:self.count],
+            "magnitudes": self.magnitudes[:self.count]
+        }
+
+    def range_time(self, start_range: float, step: float = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """The detections as points in range and time
+
+        Args:
+            start_range (float): The start range of the scan (in meters)
+            step (float): Meters between samples. Defaults to SAMPLE_PERIOD.
+
+        Returns:
+            (host times, ranges in meters, magnitudes)
+        """
+        if step is None:
+            step = ps_to_range(SAMPLE_PERIOD)
+
+        ranges = start_range + self.indexes[:self.count] * step
+        return self.host_times[:self.count], ranges, self.magnitudes[:self.count]
+
+    def clear(self) -> None:
+        """Removes every detection, keeping the storage"""
+
+        self.count = 0
+        self.lists = 0
+
+    def save(self, file_path: str, start_range: float, end_range: float) -> None:
+        """Writes the detections to a .npz file, see load_detections()
+
+        Args:
+            file_path (str): Where to write them.
+            start_range (float): The start range of the scan (in meters)
+            end_range (float): The end range of the scan (in meters)
+        """
+        np.savez(file_path, start_range=start_range, end_range=end_range, lists=self.lists,
+                 **self.arrays())
+
+
+def load_detections(file_path: str) -> dict:
+    """Reads detections written by DetectionStore.save()
+
+    Args:
+        file_path (str): The .npz file.
+
+    Returns:
+        dict with keys: start_range, end_range (float), lists (int),
+        list_numbers, host_times, indexes, magnitudes (np.ndarray)
+    """
+    with np.load(file_path) as f:
+        result = {key: f[key] for key in f.files}
+
+    for key in ("start_range", "end_range"):
+        result[key] = float(result[key])
+    result["lists"] = int(result["lists"])
+    return result
+
+
+def detection_from_config(config: dict) -> dict or None:
+    """Reads the "detection" section of config.json
+
+    Args:
+        config (dict): The whole config.
+
+    Returns:
+        Keyword arguments for commanager.set_detection_mode(), or None if
+        detection lists aren't enabled
+    """
+    detection = config.get("detection", {})
+    if not detection.get("enabled", False):
+        return None
+
+    return {
+        "keep_scans": detection.get("keepScans", False),
+        "motion_filter_index": detection.get("motionFilterIndex", 0)
+    }
@@ -1,55 +1,125 @@
 import os
 import numpy as np
 import pickle
+from lib.compression import is_compressed, read_compressed
+from lib.columnar import is_columnar, open_capture
+from lib.clock import unwrap_timestamps
 
 
-def read_data_file(filePath):
+# the first range bins are the direct path between the antennas, they are zeroed on read
+DIRECT_PATH_BINS = 15
+
+
+def read_data_file(filePath, frames: slice = None, bins: slice = None):
     """Reads the provided file.
 
         Args:
             filePath (string): Full path to data file.
+            frames (slice): Only read these scans, e.g. slice(1000, 2000),
+                with a step of 1 or more. None reads all of them.
+            bins (slice): Only read these range bins of each scan, with a
+                step of 1 or more. start and end are moved to match. None
+                reads all of them.
         Returns:
-            dictionary with keys: data (numpy array), time (list), start (float), end (float);
+            dictionary with keys: data (numpy array), time (list), start (float), end (float),
+            flags (numpy array, non-zero for scans salvaged with missing parts),
+            host_times (numpy array, time.time() seconds of each scan, NaN where unknown),
+            clock (dict, the clock model summary, None if the capture has none);
     """
 
+    # same for every format
+    if frames is not None and frames.step is not None and frames.step < 1:
+        raise ValueError("frames can't go backwards")
+    if bins is not None and bins.step is not None and bins.step < 1:
+        raise ValueError("bins can't go backwards")
+
     file_exists = os.path.isfile(filePath)
 
-    if file_exists == True:
+    if file_exists and (is_compressed(filePath) or is_columnar(filePath)):
+        if is_columnar(filePath):
+            # only the pages of the window are read
+            capture = open_capture(filePath)
+        else:
+            capture = read_compressed(filePath)
+
+        header = capture["header"]
+        frames = __window(frames, header["frame_count"])
+        bins = __window(bins, header["point_count"])
+
+        data = np.abs(capture["samples"][frames, bins], dtype=np.float64)
+        __clean_up(data, bins)
+        start, end = __window_ranges(header["start_range"], header["end_range"],
+                                     header["point_count"], bins)
+
+        return {
+            "data": data,
+            "time": unwrap_timestamps(capture["timestamps"][frames]).astype(np.float64),
+            "flags": np.array(capture["flags"][frames]),
+            "host_times": np.array(capture["host_times"][frames], dtype=np.float64),
+            "start": start,
+            "end": end,
+            "clock": header.get("clock"),
+            "filters_applied": 0
+        }
 
-        time = np.array([])
-        data = np.array([])
+    if file_exists == True:
 
         # read the pickle files
         with open(filePath, "rb") as f:
             header = pickle.load(f)
 
-            start = header["start_range"]
-            end = header["end_range"]
             point_count = header["point_count"]
             frame_count = header["frame_count"]
+            frames = __window(frames, frame_count)
+            bins = __window(bins, point_count)
+
+            # everything is allocated up front and filled in place
+            wanted = range(frame_count)[frames]
+            time = np.zeros(len(wanted), dtype=np.float64)
+            data = np.zeros((len(wanted), len(range(point_count)[bins])), dtype=np.float64)
+            flags = np.zeros(len(wanted), dtype=np.uint8)
+            host_times = np.full(len(wanted), np.nan)
+
+            # frames before the window still have to be unpickled to get past them
+            row = 0
+            for i in range(wanted.stop if len(wanted) else 0):
+                try:
+                    frame = pickle.load(f)
+                except (EOFError, pickle.UnpicklingError):
+                    print(f"WARNING: {filePath} ends after {i} of {frame_count} frames")
+                    break
 
-            # read the data
-            for i in range(frame_count):
-                frame = pickle.load(f)
-                time = np.append(time, frame["timestamp"])
-                data = np.append(data, frame["data"])
+                if i < wanted.start or (i - wanted.start) % wanted.step:
+                    continue
+
+                samples = frame["data"][:point_count][bins]
+                time[row] = frame["timestamp"]
+                data[row, :len(samples)] = samples
+                flags[row] = frame.get("flags", 0)
+                host_times[row] = frame.get("host_time", np.nan)
+                row += 1
 
             f.close()
 
-        data = np.reshape(data, (frame_count, point_count))
+        # a short file keeps the frames it has
+        time, data, flags, host_times = time[:row], data[:row], flags[:row], host_times[:row]
+
+        np.abs(data, out=data)
+        __clean_up(data, bins)
 
-        data = np.abs(data)
+        # older captures hold the raw 32-bit radar counter
+        time = unwrap_timestamps(time).astype(np.float64)
+
+        start, end = __window_ranges(header["start_range"], header["end_range"], point_count, bins)
 
-        # set minimum value to 1e-8
-        data[data < 1e-8] = 1e-8
-        
-        data[:,:15]=0
-        
         return {
             "data": data,
             "time": time,
+            "flags": flags,
+            "host_times": host_times,
             "start": start,
             "end": end,
+            "clock": header.get("clock"),
             "filters_applied": 0
         }
 
@@ -58,8 +128,48 @@ def read_data_file(filePath):
         return {
             "data": np.array([]),
             "time": [],
+            "flags": np.zeros(0, dtype=np.uint8),
+            "host_times": np.zeros(0),
             "start": 0.0,
             "end": 0.0,
+            "clock": None,
             "filters_applied": 0
         }
 
+
+def __window(window: slice, count: int) -> slice:
+    """Turns an optional window into a slice with start and stop in [0, count]
+
+    read_data_file() only lets through windows with a step of 1 or more, so
+    the step stays positive too.
+    """
+
+    if window is None:
+        window = slice(None)
+    return slice(*window.indices(count))
+
+
+def __clean_up(data: np.ndarray, bins: slice) -> None:
+    """Sets the minimum value to 1e-8 and zeroes the direct path bins, in place
+
+    Args:
+        data (np.ndarray): The magnitudes, one scan per row.
+        bins (slice): The range bins data holds, see __window().
+    """
+    np.maximum(data, 1e-8, out=data)
+
+    # only the direct path bins inside the window
+    direct = np.arange(bins.start, bins.stop, bins.step) < DIRECT_PATH_BINS
+    data[:, direct] = 0
+
+
+def __window_ranges(start_range: float, end_range: float, point_count: int,
+                    bins: slice) -> tuple[float, float]:
+    """Moves the start and end range of a scan to a window of its bins"""
+
+    selected = range(point_count)[bins]
+    if len(selected) == 0 or len(selected) == point_count or point_count < 2:
+        return start_range, end_range
+
+    step = (end_range - start_range) / (point_count - 1)
+    return start_range + selected[0] * step, start_range + selected[-1] * step
@@ -1,5 +1,4 @@
 import numpy as np
-import scipy as sp
 
 KERNELS_3x3 = {
     # vals are standard in image processing
@@ -622,7 +621,10 @@ def apply_scipy_gausian_filter(radar_data: dict, start_buffer: int = 50, streak_
     max_val = np.max(data)
 
     #gaussian filter
-    data = sp.ndimage.gaussian_filter(data, sigma=1, radius=2)
+    # scipy is slow to import, so only load it when it's needed
+    import scipy.ndimage
+
+    data = scipy.ndimage.gaussian_filter(data, sigma=1, radius=2)
 
     # create a mask to get rid of early streaks
     noise_floor = np.average(data[:start_buffer], axis=0)
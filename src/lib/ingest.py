@@ -0,0 +1,224 @@
+import multiprocessing
+import time
+from lib.commanager import commanager
+from lib.radario import RadarConnection
+from lib.reduction import ScanReducer
+from lib.reassembly import reassembly_from_config
+from lib.shmring import SharedScanRing, RingReader
+from lib.save_data import open_writer
+
+# Runs radar ingest in its own process
+# The ingest process owns the radar socket. It receives, reassembles and
+# reduces scans and writes them into a SharedScanRing, so its packet
+# handling never waits on the GIL of a process that is drawing or
+# filtering. Other processes read the scans with a RingReader. Requests to
+# the radar (config, starting and stopping scans) are passed to the ingest
+# process over a pipe, because only it may use the socket.
+
+# how long the ingest loop waits for a packet before it checks for requests (seconds)
+POLL_INTERVAL = 0.05
+
+
+def run_ingest(address: tuple, ring_name: str, requests, stop, config: dict) -> None:
+    """The ingest process. Handles packets and requests until stop is set.
+
+    Args:
+        address (tuple): The radar's (ip, port).
+        ring_name (str): The ring to write scans to.
+        requests (Connection): Pipe end requests arrive on and replies go out of.
+        stop (Event): Set to end the process.
+        config (dict): The whole config, for the reduction and reassembly settings.
+    """
+    ring = SharedScanRing.attach(ring_name)
+    connection = RadarConnection(address)
+    comm = commanager(connection=connection, reducer=ScanReducer.from_config(config),
+                      **reassembly_from_config(config))
+    comm.databuffer = ring
+
+    try:
+        while not stop.is_set():
+            while requests.poll():
+                requests.send(handle_request(comm, *requests.recv()))
+
+            try:
+                msgtype, msgid, payload, rx_time = connection.recv_packet(POLL_INTERVAL)
+            except TimeoutError:
+                continue
+
+            comm.handle_packet(msgtype, msgid, payload, rx_time)
+    finally:
+        comm.flush_reassembly()
+        ring.mark_closed()
+        connection.close()
+        ring.close()
+
+
+def handle_request(comm: commanager, name: str, args: tuple, kwargs: dict) -> tuple:
+    """Runs a request from another process in the ingest process
+
+    Args:
+        comm (commanager): The ingest process's manager.
+        name (str): "send_sync", "metrics" or "flush".
+        args (tuple): Arguments for the request.
+        kwargs (dict): Keyword arguments for the request.
+
+    Returns:
+        (result, None) or (None, the exception)
+    """
+    try:
+        if name == "send_sync":
+            return (comm.send_sync(*args, **kwargs), None)
+        if name == "metrics":
+            return (comm.get_metrics(), None)
+        if name == "flush":
+            comm.flush_reassembly()
+            return (None, None)
+        raise ValueError(f"Unknown ingest request {name}")
+    except Exception as e:
+        return (None, e)
+
+
+def write_ring(ring_name: str, file_path: str, start_range: float, end_range: float,
+               compression: dict = None, columnar: bool = False) -> None:
+    """A reader process that saves every scan in the ring until ingest stops
+
+    Start it with IngestProcess.spawn_reader(write_ring, file_path, start_range, end_range).
+
+    Args:
+        ring_name (str): The ring to read.
+        file_path (str): The capture to write.
+        start_range (float): The start range of the scan (in meters)
+        end_range (float): The end range of the scan (in meters)
+        compression (dict): See save_data().
+        columnar (bool): See save_data().
+    """
+    reader = RingReader(ring_name, from_start=True)
+    with open_writer(file_path, start_range, end_range, compression, columnar) as writer:
+        while True:
+            # check first, so the scans written before it closed are still read
+            closed = reader.ring.closed
+
+            scans = reader.read()
+            if len(scans["timestamps"]):
+                width = int(scans["lengths"].max())
+                writer.write(scans["timestamps"], scans["samples"][:, :width], scans["flags"],
+                             scans["host_times"])
+
+            if closed:
+                break
+            time.sleep(POLL_INTERVAL)
+
+    if reader.lost:
+        print(f"WARNING: {reader.lost} scans were overwritten before they were saved")
+    reader.close()
+
+
+class IngestProcess:
+
+    def __init__(self, address: tuple, config: dict = None, capacity: int = 4096,
+                 width: int = 4096) -> None:
+        """Creates the scan ring. Call start() to start the ingest process.
+
+        Args:
+            address (tuple): The radar's (ip, port).
+            config (dict): The whole config, for the reduction and reassembly
+                settings. None uses the defaults.
+            capacity (int): Scans the ring holds. Readers that fall further
+                behind than this lose scans.
+            width (int): Samples per scan in the ring, longer scans are cut.
+        """
+        self.address = address
+        self.config = config or {}
+        self.ring = SharedScanRing.create(capacity, width)
+
+        self.requests = None  # our end of the request pipe
+        self.stop_event = multiprocessing.Event()
+        self.process = None
+
+    @property
+    def name(self) -> str:
+        """Name of the ring, for RingReader"""
+        return self.ring.name
+
+    def start(self) -> None:
+        """Starts the ingest process"""
+
+        ours, theirs = multiprocessing.Pipe()
+        self.requests = ours
+        self.process = multiprocessing.Process(
+            target=run_ingest,
+            args=(self.address, self.ring.name, theirs, self.stop_event, self.config),
+            daemon=True)
+        self.process.start()
+        theirs.close()  # the child has its own copy now
+
+    def request(self, name: str, *args, timeout: float = 5, **kwargs):
+        """Runs a request in the ingest process and waits for the result
+
+        Args:
+            name (str): See handle_request().
+            timeout (float): How long to wait for the result in seconds.
+
+        Returns:
+            The result
+        """
+        self.requests.send((name, args, kwargs))
+        if not self.requests.poll(timeout):
+            raise TimeoutError(f"ingest process did not answer {name}")
+
+        result, error = self.requests.recv()
+        if error is not None:
+            raise error
+        return result
+
+    def send_sync(self, msgtype: int or str, noreply: bool, **kwargs) -> dict:
+        """commanager.send_sync(), run by the ingest process
+
+        While the radar is scanning, use noreply=True. Waiting for a reply
+        throws away the scan packets that arrive before it.
+        """
+        return self.request("send_sync", msgtype, noreply, **kwargs)
+
+    def get_metrics(self) -> dict:
+        """The ingest process's commanager.get_metrics()"""
+        return self.request("metrics")
+
+    def reader(self, from_start: bool = False) -> RingReader:
+        """Creates a reader of the ring in this process
+
+        Args:
+            from_start (bool): See RingReader.
+        """
+        return RingReader(self.ring, from_start)
+
+    def spawn_reader(self, target: callable, *args) -> multiprocessing.Process:
+        """Starts a reader process
+
+        Args:
+            target (callable): Called in the new process with the ring name
+                followed by args. It should attach with RingReader(name).
+            *args: More arguments for target.
+
+        Returns:
+            The started process
+        """
+        process = multiprocessing.Process(target=target, args=(self.ring.name, *args), daemon=True)
+        process.start()
+        return process
+
+    def stop(self) -> None:
+        """Stops the ingest process. The ring stays readable until close()."""
+
+        if self.process is None:
+            return
+
+        self.stop_event.set()
+        self.process.join()
+        self.process = None
+        self.requests.close()
+
+    def close(self) -> None:
+        """Stops the ingest process and deletes the ring"""
+
+        self.stop()
+        self.ring.close()
@@ -0,0 +1,221 @@
+import bisect
+
+# Ingest telemetry kept by commanager
+# Everything here is a plain counter or a fixed-bucket histogram, so
+# updating it per packet is a handful of integer operations and it can stay
+# on during real captures.
+
+
+class Histogram:
+
+    def __init__(self, low: float, high: float, per_decade: int = 10) -> None:
+        """Creates a histogram with log-spaced buckets
+
+        Args:
+            low (float): Upper edge of the first bucket, smaller values land in it.
+            high (float): Values above this land in the last bucket.
+            per_decade (int): Buckets per power of 10.
+        """
+        self.edges = []
+        edge = low
+        while edge < high * 1.0001:
+            self.edges.append(edge)
+            edge *= 10 ** (1 / per_decade)
+
+        self.counts = [0] * (len(self.edges) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value: float) -> None:
+        """Records a value"""
+
+        self.counts[bisect.bisect_left(self.edges, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> float:
+        """Estimates a percentile from the buckets
+
+        Args:
+            q (float): The percentile, 0 to 100.
+
+        Returns:
+            The upper edge of the bucket holding the percentile, or None if empty
+        """
+        if self.count == 0:
+            return None
+
+        target = q / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                if index == len(self.edges):
+                    return self.max
+                return min(self.edges[index], self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        """count, mean, min, p50, p90, p99 and max"""
+
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max
+        }
+
+
+class IngestMetrics:
+
+    def __init__(self) -> None:
+        """Creates an empty set of metrics"""
+
+        self.packets = 0  # packets handed to commanager
+        self.bytes = 0  # bytes in those packets, headers included
+        self.message_types = {}  # msgtype: packets
+        self.scans = 0  # scans completed
+        self.parts_per_scan = {}  # messageCount: completed scans
+        self.expired = 0  # scans discarded because of missing parts
+        self.salvaged = 0  # scans kept with missing parts
+        self.detection_lists = 0  # MRM_DETECTION_LIST_INFO messages stored
+        self.detections = 0  # detections in them
+
+        self.newest_scan = None  # newest completed radar timestamp
+        self.scan_gaps = Histogram(0.1, 10000)  # ms between completed scans
+        self.decode_time = Histogram(0.1, 10000)  # us per MRM_SCAN_INFO decode
+        self.reassembly_time = Histogram(0.1, 10000)  # us per part added
+        self.scan_latency = Histogram(0.01, 10000)  # ms from first to last part received
+
+    def packet(self, msgtype: int, size: int) -> None:
+        """Counts a received packet
+
+        Args:
+            msgtype (int): The message type.
+            size (int): The packet size in bytes.
+        """
+        self.packets += 1
+        self.bytes += size
+        self.message_types[msgtype] = self.message_types.get(msgtype, 0) + 1
+
+    def scan(self, timestamp: int, messageCount: int, latency: float = None, flags: int = 0) -> None:
+        """Counts a completed scan
+
+        Args:
+            timestamp (int): The radar timestamp of the scan (ms).
+            messageCount (int): How many parts it was sent in.
+            latency (float): Seconds between its first and last part arriving.
+            flags (int): Its reassembly flags, non-zero if it was salvaged.
+        """
+        self.scans += 1
+        if flags:
+            self.salvaged += 1
+        self.parts_per_scan[messageCount] = self.parts_per_scan.get(messageCount, 0) + 1
+
+        # scans can complete out of order, only measure forward steps
+        if self.newest_scan is None or timestamp > self.newest_scan:
+            if self.newest_scan is not None:
+                self.scan_gaps.add(timestamp - self.newest_scan)
+            self.newest_scan = timestamp
+
+        if latency is not None:
+            self.scan_latency.add(latency * 1e3)
+
+    def detection_list(self, detections: int) -> None:
+        """Counts a stored detection list
+
+        Args:
+            detections (int): How many detections it had.
+        """
+        self.detection_lists += 1
+        self.detections += detections
+
+    def summary(self, reassembler=None, receiver=None) -> dict:
+        """Collects everything into one dict
+
+        Args:
+            reassembler (ScanReassembler): Adds its duplicate, late and pending counts.
+            receiver (PacketReceiver): Adds its packet and overrun counts. These
+                count from when the receiver was started, not per capture.
+
+        Returns:
+            dict of counters, with histograms as dicts from Histogram.summary()
+        """
+        result = {
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "message_types": {f"0x{msgtype:04X}": count
+                              for msgtype, count in sorted(self.message_types.items())},
+            "scans": self.scans,
+            "parts_per_scan": dict(sorted(self.parts_per_scan.items())),
+            "expired": self.expired,
+            "salvaged": self.salvaged,
+            "detection_lists": self.detection_lists,
+            "detections": self.detections,
+            "scan_gaps_ms": self.scan_gaps.summary(),
+            "decode_us": self.decode_time.summary(),
+            "reassembly_us": self.reassembly_time.summary(),
+            "scan_latency_ms": self.scan_latency.summary()
+        }
+
+        if reassembler is not None:
+            result["duplicates"] = reassembler.duplicates
+            result["late"] = reassembler.late
+            result["incomplete"] = len(reassembler)
+
+        if receiver is not None:
+            result["received"] = receiver.received
+            result["overruns"] = receiver.overruns
+
+        return result
+
+    def report(self, reassembler=None, receiver=None) -> list[str]:
+        """Formats the summary as a few short lines for a log
+
+        Args:
+            reassembler (ScanReassembler): See summary().
+            receiver (PacketReceiver): See summary().
+
+        Returns:
+            list of strings
+        """
+        s = self.summary(reassembler, receiver)
+
+        def fmt(value):
+            return "-" if value is None else f"{value:.3g}"
+
+        lines = [f"Packets: {s['packets']} ({s['bytes'] / 1e6:.1f} MB)"]
+        if "overruns" in s:
+            lines[0] += f", {s['overruns']} overruns"
+
+        # salvaged scans are counted in scans too, report them apart
+        scans = f"Scans: {s['scans'] - s['salvaged']} complete"
+        if s["salvaged"]:
+            scans += f", {s['salvaged']} salvaged"
+        scans += f", {s['expired']} expired"
+        if "incomplete" in s:
+            scans += f", {s['incomplete']} incomplete, {s['duplicates']} duplicate " \
+                     f"and {s['late']} late parts"
+        lines.append(scans)
+
+        if s["detection_lists"]:
+            lines.append(f"Detection lists: {s['detection_lists']} with {s['detections']} detections")
+
+        gaps = s["scan_gaps_ms"]
+        lines.append(f"Scan gap ms: p50 {fmt(gaps['p50'])}, p99 {fmt(gaps['p99'])}, "
+                     f"max {fmt(gaps['max'])}")
+
+        decode, reassembly = s["decode_us"], s["reassembly_us"]
+        lines.append(f"Decode us: p50 {fmt(decode['p50'])}, p99 {fmt(decode['p99'])}; "
+                     f"reassembly us: p50 {fmt(reassembly['p50'])}, p99 {fmt(reassembly['p99'])}")
+
+        return lines
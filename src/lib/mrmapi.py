@@ -1,387 +1,225 @@
 # MRM API functions
-from lib.util import bytes_to_int, bytes_from_list
+import struct
+import numpy as np
 
 # MRM API functions
 # For more information, see the MRM API documentation
 # https://tdsr-uwb.com/wp-content/uploads/2021/03/320-0298G-MRM-API-Specification.pdf
 
+# Every fixed-size message is described by a schema: a list of
+# (name, struct format, default) fields in wire order. Reserved bytes
+# use a name of None and an "x" format. The schemas are compiled into
+# struct.Struct objects at import, so packing and unpacking a message
+# is a single call.
 
-class mrmapi:
 
-    # ID 0x1001
-    def MRM_SET_CONFIG_REQUEST(nodeID=5, scanStart=0, scanEnd=5, scanResolution=32, baseIntegrationIndex=6,
-                               antennaMode=2, transmitGain=60, codeChannel=7, persistFlag=0) -> bytes:
-        """compiles a MRM_SET_CONFIG_REQUEST packetk
-            Args:
-                nodeID (int): Node ID
-                scanStart (int): Start of scan in picoseconds
-                scanEnd (int): End of scan in picoseconds
-                scanResolution (int): Resolution of scan in picoseconds
-                baseIntegrationIndex (int): Base integration index
-                antennaMode (int): Antenna mode
-                transmitGain (int): Transmit gain
-                codeChannel (int): Code channel
-                persistFlag (int): Persist flag
-            Returns:
-                A bytes object containing the packet
-        """
+class MessageCodec:
 
-        params = [
-            [nodeID, 32, False],
-            [scanStart, 32, True],
-            [scanEnd, 32, True],
-            [scanResolution, 16, False],
-            [baseIntegrationIndex, 16, False],
-
-            # between these comments are NYI parameters
-            [0, 16, False],
-            [0, 16, False],
-            [0, 16, False],
-            [0, 16, False],
-            [0, 8, False],
-            [0, 8, False],
-            [0, 8, False],
-            [0, 8, False],
-            # end NYI parameters
-
-            [antennaMode, 8, False],
-            [transmitGain, 8, False],
-            [codeChannel, 8, False],
-            [persistFlag, 8, False]
-        ]
-
-        return bytes_from_list(params)
-
-    # ID 0x1101
-
-    def MRM_SET_CONFIG_CONFIRM(payload: bytes) -> dict:
-        """decodes a MRM_SET_CONFIG_CONFIRM packet
+    def __init__(self, name: str, fields: list, prepare: callable = None, finish: callable = None):
+        """Compiles a message schema
             Args:
-                payload (bytes): The payload of the packet
-            Returns:
-                A dictionary containing the decoded packet
+                name (str): The message name
+                fields (list): (name, format, default) tuples in wire order
+                prepare (callable): Optional hook to check/adjust the values before packing
+                finish (callable): Optional hook to post-process a decoded dict
         """
 
-        status = bytes_to_int(payload[0:4], False)
-        return {"status": status}
-
-    # ID 0x1002
+        self.name = name
+        self.prepare = prepare
+        self.finish = finish
 
-    def MRM_GET_CONFIG_REQUEST() -> bytes:
-        """compiles a MRM_GET_CONFIG_REQUEST packet
-            Returns:
-                A bytes object containing the packet
-        """
+        self.names = []  # names of the fields that carry a value
+        self.defaults = {}  # default values for outgoing messages
+        self.grouped = {}  # fields holding several values (e.g. "4B"), name: count
 
-        return bytes()
+        for field in fields:
+            fieldname, fmt = field[0], field[1]
+            if fieldname is None:
+                continue
 
-    # ID 0x1102
+            self.names.append(fieldname)
+            self.defaults[fieldname] = field[2] if len(field) > 2 else 0
 
-    def MRM_GET_CONFIG_CONFIRM(payload: bytes) -> dict:
-        """decodes a MRM_GET_CONFIG_CONFIRM packet
-            Args:
-                payload (bytes): The payload of the packet
-            Returns:
-                A dictionary containing the decoded packet
-        """
-        nodeID = bytes_to_int(payload[0:4], False)
-        scanStart = bytes_to_int(payload[4:8], True)
-        scanEnd = bytes_to_int(payload[8:12], True)
-        scanResolution = bytes_to_int(payload[12:14], False)
-        baseIntegrationIndex = bytes_to_int(payload[14:16], False)
-        antennaMode = bytes_to_int(payload[28:29], False)
-        transmitGain = bytes_to_int(payload[29:30], False)
-        codeChannel = bytes_to_int(payload[30:31], False)
-        persistFlag = bytes_to_int(payload[31:32], False)
-        timestamp = bytes_to_int(payload[32:36], False)
-        status = bytes_to_int(payload[36:40], False)
+            count = fmt[:-1]
+            if count and fmt[-1] != "s" and int(count) > 1:
+                self.grouped[fieldname] = int(count)
 
-        return {
-            "nodeID": nodeID,
-            "scanStart": scanStart,
-            "scanEnd": scanEnd,
-            "scanResolution": scanResolution,
-            "baseIntegrationIndex": baseIntegrationIndex,
-            "antennaMode": antennaMode,
-            "transmitGain": transmitGain,
-            "codeChannel": codeChannel,
-            "persistFlag": persistFlag,
-            "timestamp": timestamp,
-            "status": status
-        }
+        self.struct = struct.Struct(">" + "".join(field[1] for field in fields))
+        self.size = self.struct.size
 
-    # ID 0x1003
+    def __values(self, kwargs: dict) -> list:
+        """Orders the given values for packing
 
-    def MRM_CONTROL_REQUEST(scanCount=1, scanIntervalTime=0) -> bytes:
-        """compiles a MRM_CONTROL_REQUEST packet
             Args:
-                scanCount (int): Number of scans to perform
-                scanIntervalTime (int): Time between scans in microseconds
+                kwargs (dict): The field values
             Returns:
-                A bytes object containing the packet
+                The flat list of values to hand to struct
         """
 
-        params = [
-            [scanCount, 16, False],
-            [0, 16, False],
-            [scanIntervalTime, 32, False]
-        ]
+        for key in kwargs:
+            if key not in self.defaults:
+                raise TypeError(f"{self.name} got an unexpected field '{key}'")
 
-        return bytes_from_list(params)
+        values = {**self.defaults, **kwargs}
 
-    # ID 0x1103
+        if self.prepare is not None:
+            self.prepare(values)
 
-    def MRM_CONTROL_CONFIRM(payload: bytes) -> dict:
-        """decodes a MRM_CONTROL_CONFIRM packet
-            Args:
-                payload (bytes): The payload of the packet
-            Returns:    
-                A dictionary containing the decoded packet
-        """
+        if not self.grouped:
+            return [values[name] for name in self.names]
 
-        status = bytes_to_int(payload[0:4], False)
-        return {"status": status}
+        flat = []
+        for name in self.names:
+            if name in self.grouped:
+                flat.extend(values[name])
+            else:
+                flat.append(values[name])
+        return flat
 
-    # ID 0x1004
+    def pack_into(self, buffer, offset: int, **kwargs) -> int:
+        """Packs a message directly into a writable buffer
 
-    def MRM_SERVER_CONNECT_REQUEST(ipaddr=(192, 168, 1, 151), port=21210) -> bytes:
-        """compiles a MRM_SERVER_CONNECT_REQUEST packet
             Args:
-                ipaddr (int, int, int, int): IP address of the server
-                port (int): Port of the server    
+                buffer (bytearray): The buffer to write to
+                offset (int): Where in the buffer to start writing
+                **kwargs: The field values. Missing fields use their defaults
             Returns:
-                A bytes object containing the packet
+                The number of bytes written
         """
 
-        params = [
-            [ipaddr[0], 8, False],
-            [ipaddr[1], 8, False],
-            [ipaddr[2], 8, False],
-            [ipaddr[3], 8, False],
-            [port, 16, False],
-            [0, 16, False]
-        ]
-
-        return bytes_from_list(params)
+        self.struct.pack_into(buffer, offset, *self.__values(kwargs))
+        return self.size
 
-    # ID 0x1104
+    def pack(self, **kwargs) -> bytes:
+        """Packs a message into a new bytes object
 
-    def MRM_SERVER_CONNECT_CONFIRM(payload: bytes) -> dict:
-        """decodes a MRM_SERVER_CONNECT_CONFIRM packet
             Args:
-                payload (bytes): The payload of the packet
-            Returns:
-                A dictionary containing the decoded packet
-        """
-
-        connectionStatus = bytes_to_int(payload[0:4], False)
-        return {connectionStatus}
-
-    # ID 0x1005
-
-    def MRM_SERVER_DISCONNECT_REQUEST() -> bytes:
-        """compiles a MRM_SERVER_DISCONNECT_REQUEST packet
+                **kwargs: The field values. Missing fields use their defaults
             Returns:
                 A bytes object containing the packet
         """
 
-        return bytes()
+        return self.struct.pack(*self.__values(kwargs))
 
-    # ID 0x1105
+    def unpack(self, payload: bytes) -> dict:
+        """Decodes a message
 
-    def MRM_SERVER_DISCONNECT_CONFIRM(payload: bytes) -> dict:
-        """decodes a MRM_SERVER_DISCONNECT_CONFIRM packet
             Args:
                 payload (bytes): The payload of the packet
             Returns:
                 A dictionary containing the decoded packet
         """
 
-        status = bytes_to_int(payload[0:4], False)
-        return {"status": status}
+        raw = self.struct.unpack_from(payload)
 
-    # ID 0x1006
+        if not self.grouped:
+            result = dict(zip(self.names, raw))
+        else:
+            result = {}
+            pos = 0
+            for name in self.names:
+                count = self.grouped.get(name, 1)
+                result[name] = raw[pos] if count == 1 else raw[pos:pos + count]
+                pos += count
 
-    def MRM_SET_FILTER_CONFIG_REQUEST(filterMask=1, motionFilterIndex=0) -> bytes:
-        """compiles a MRM_SET_FILTER_CONFIG_REQUEST packet
-            Args:
-                filterMask (int): Filter mask
-                motionFilterIndex (int): Motion filter index  
-            Returns:
-                A bytes object containing the packet
-        """
+        if self.finish is not None:
+            result = self.finish(result)
 
-        params = [
-            [filterMask, 32, False],
-            [motionFilterIndex, 16, False],
-            [0, 16, False]
-        ]
+        return result
 
-        return bytes_from_list(params)
 
-    # ID 0x1106
+# hooks for the few messages that need more than a plain layout
 
-    def MRM_SET_FILTER_CONFIG_CONFIRM(payload: bytes) -> dict:
-        """decodes a MRM_SET_FILTER_CONFIG_CONFIRM packet
-            Args:
-                payload (bytes): The payload of the packet
-            Returns:
-                A dictionary containing the decoded packet
-        """
-
-        status = bytes_to_int(payload[0:4], False)
-        return {"status": status}
-
-    # ID 0x1007
-
-    def MRM_GET_FILTER_CONFIG_REQUEST() -> bytes:
-        """compiles a MRM_GET_FILTER_CONFIG_REQUEST packet
-            Returns:
-                A bytes object containing the packet
-        """
-
-        return bytes()
-
-    # ID 0x1107
-
-    def MRM_GET_FILTER_CONFIG_CONFIRM(payload: bytes) -> dict:
-        """decodes a MRM_GET_FILTER_CONFIG_CONFIRM packet
-            Args:
-                payload (bytes): The payload of the packet
-            Returns:
-                A dictionary containing the decoded packet
-        """
-
-        filterMask = bytes_to_int(payload[0:2], False)
-        motionFilterIndex = bytes_to_int(payload[2:3], False)
-        status = bytes_to_int(payload[4:8], False)
-
-        return {
-            "filterMask": filterMask,
-            "motionFilterIndex": motionFilterIndex,
-            "status": status
-        }
-
-    # ID 0xF001
-
-    def MRM_GET_STATUSINFO_REQUEST() -> bytes:
-        """compiles a MRM_GET_STATUSINFO_REQUEST packet 
-            Returns:
-                A bytes object containing the packet
-        """
+def __check_sleep_mode(values: dict):
+    """makes sure we don't accidentally lose connection to the device"""
 
-        return bytes()
+    if (values["mode"] == 3 or values["mode"] == 4):
+        print("WARNING: Setting sleep mode to 3 or 4 will cause the device to stop responding to Ethernet commands!")
+        print("Mode will be set to 1 (IDLE) instead!")
+        values["mode"] = 1
 
-    # ID 0xF101
 
-    def MRM_GET_STATUSINFO_CONFIRM(payload: bytes) -> dict:
-        """decodes a MRM_GET_STATUSINFO_CONFIRM packet
-            Args:
-                payload (bytes): The payload of the packet
-            Returns:
-                A dictionary containing the decoded packet
-        """
+def __decode_package_version(result: dict) -> dict:
+    """the package version is 32 bytes, 1 char each"""
 
-        mrmVersionMajor = bytes_to_int(payload[0:1], False)
-        mrmVersionMinor = bytes_to_int(payload[1:2], False)
-        mrmVersionBuild = bytes_to_int(payload[2:4], False)
-        uwbKernelMajor = bytes_to_int(payload[4:5], False)
-        uwbKernelMinor = bytes_to_int(payload[5:6], False)
-        uwbKernelBuild = bytes_to_int(payload[6:8], False)
-        fpgaFirmwareVersion = bytes_to_int(payload[8:9], False)
-        fpgaFirmwareYear = bytes_to_int(payload[9:10], False)
-        fpgaFirmwareMonth = bytes_to_int(payload[10:11], False)
-        fpgaFirmwareDay = bytes_to_int(payload[11:12], False)
-        serialNumber = bytes_to_int(payload[12:16], False)
-        boardRevision = bytes_to_int(payload[16:17], False)
-        bitTestResult = bytes_to_int(payload[17:18], False)
-        boardType = bytes_to_int(payload[18:19], False)
-        transmitterConfig = bytes_to_int(payload[19:20], False)
-        temperature = bytes_to_int(payload[20:24], True)
-        # next 32 bytes are 1 char each
-        packageVersion = ""
-        for pos in range(24, 56):
-            packageVersion += chr(payload[pos])
-
-        status = bytes_to_int(payload[56:60], False)
+    result["packageVersion"] = result["packageVersion"].decode("latin-1")
+    return result
 
-        return {
-            "mrmVersionMajor": mrmVersionMajor,
-            "mrmVersionMinor": mrmVersionMinor,
-            "mrmVersionBuild": mrmVersionBuild,
-            "uwbKernelMajor": uwbKernelMajor,
-            "uwbKernelMinor": uwbKernelMinor,
-            "uwbKernelBuild": uwbKernelBuild,
-            "fpgaFirmwareVersion": fpgaFirmwareVersion,
-            "fpgaFirmwareYear": fpgaFirmwareYear,
-            "fpgaFirmwareMonth": fpgaFirmwareMonth,
-            "fpgaFirmwareDay": fpgaFirmwareDay,
-            "serialNumber": serialNumber,
-            "boardRevision": boardRevision,
-            "bitTestResult": bitTestResult,
-            "boardType": boardType,
-            "transmitterConfig": transmitterConfig,
-            "temperature": temperature,
-            "packageVersion": packageVersion,
-            "status": status
-        }
 
-    # ID 0xF002
+# ID 0xF10C
+# This is the "mystery packet"
+# It's sent instead of the actual response when an error is detected
+# Generally we never want this to be sent
 
-    def MRM_REBOOT_REQUEST() -> bytes:
-        """compiles a MRM_REBOOT_REQUEST packet
-            Returns:
-                A bytes object containing the packet
-        """
-
-        return bytes()
-
-    # ID 0xF102
-
-    def MRM_REBOOT_CONFIRM(payload: bytes) -> dict:
-        """decodes a MRM_REBOOT_CONFIRM packet
-            Args:
-                payload (bytes): The payload of the packet
-            Returns:
-                A dictionary containing the decoded packet
-        """
+def __report_generror(result: dict) -> dict:
+    """reports a decoded MRM_GENERROR packet"""
 
-        status = bytes_to_int(payload[0:4], False)
-        return {"status": status}
+    errorCode = result["errorCode"]
 
-    # ID 0xF003
-
-    def MRM_SET_OPMODE_REQUEST(opMode=1) -> bytes:
-        """compiles a MRM_SET_OPMODE_REQUEST packet
-            Args:
-                opMode (int): The opMode to set
-            Returns:
-                A bytes object containing the packet
-        """
-
-        params = [
-            [opMode, 32, False]
-        ]
-
-        return bytes_from_list(params)
-
-    # ID 0xF103
-
-    def MRM_SET_OPMODE_CONFIRM(payload: bytes) -> dict:
-        """decodes a MRM_SET_OPMODE_CONFIRM packet
-            Args:
-                payload (bytes): The payload of the packet
-            Returns:
-                A dictionary containing the decoded packet
-        """
+    # detect if it's an internal error (0x80000000)
+    if (errorCode & 0x80000000 == 0x80000000):
+        # here is where it gets especially nasty
+        # the given error code is actully OR'd with 0x80000000
+        # so we have to sus that out
+        errorCode = errorCode & 0x7FFFFFFF
+        print("WARNING! Internal Error Detected!")
+        print(
+            "This is a bug in the MRM API and should be reported to the manufacturer!")
+        print(f"Error Code: {errorCode}")
+
+        # stop the program from continuing to avoid any further issues
+        exit()
+
+    print("Message Error!\nOffending Message Info:")
+    print(
+        f"Type: {hex(result['targetMessageType'])}\n MessageID: {result['targetMessageID']}\n Error Code: {errorCode}")
+
+    return result
+
+
+# common layouts
+STATUS_ONLY = [("status", "I")]
+
+# MRM_SCAN_INFO header layout (48 bytes), the samples follow it
+SCAN_INFO = MessageCodec("MRM_SCAN_INFO", [
+    ("sourceID", "I"),
+    ("timestamp", "I"),
+    (None, "16x"),
+    ("scanStart", "i"),
+    ("scanStop", "i"),
+    ("scanStep", "h"),
+    ("scanType", "B"),
+    (None, "x"),
+    ("antennaID", "B"),
+    ("operationalMode", "B"),
+    ("numMessageSamples", "H"),
+    ("numTotalSamples", "I"),
+    ("messageIndex", "H"),
+    ("messageCount", "H")
+])
+SCAN_INFO_HEADER = SCAN_INFO.struct
+
+# scan samples are big-endian signed 32 bit ints
+SCAN_SAMPLE_DTYPE = np.dtype(">i4")
+
+# MRM_DETECTION_LIST_INFO records: the sample index of the detection and its magnitude
+DETECTION_DTYPE = np.dtype([("index", ">u2"), ("magnitude", ">i2")])
+DETECTION_COUNT = struct.Struct(">H")
+
+# bits of filterMask in MRM_SET_FILTER_CONFIG_REQUEST, each one turns on a
+# kind of data the radar sends while scanning
+FILTER_RAW = 0x1  # MRM_SCAN_INFO with the raw scan
+FILTER_FAST_TIME = 0x2  # MRM_SCAN_INFO with the fast-time filtered scan
+FILTER_MOTION = 0x4  # MRM_SCAN_INFO with the motion filtered scan
+FILTER_DETECTION_LIST = 0x8  # MRM_DETECTION_LIST_INFO
 
-        opmode = bytes_to_int(payload[0:4], False)
-        status = bytes_to_int(payload[4:8], False)
 
-        return {
-            "opmode": opmode,
-            "status": status
-        }
+class mrmapi:
+    # The fixed-size requests and confirms are generated from the schemas
+    # registered at the bottom of this file, e.g.
+    #   mrmapi.MRM_CONTROL_REQUEST(scanCount=1, scanIntervalTime=0) -> bytes
+    #   mrmapi.MRM_CONTROL_CONFIRM(payload) -> dict
+    # The messages below have a variable length and are decoded by hand.
 
     # ID 0xF201
 
@@ -389,37 +227,21 @@ class mrmapi:
         """decodes a MRM_SCAN_INFO packet
             Args:
                 payload (bytes): The payload of the packet
-            Returns:    
-                A dictionary containing the decoded packet
+            Returns:
+                A dictionary containing the decoded packet. scanData is a
+                read-only big-endian int32 view over the payload, so it is
+                only valid for as long as the payload buffer is
         """
 
-        sourceID = bytes_to_int(payload[0:4], False)
-        timestamp = bytes_to_int(payload[4:8], False)
-        # next 16 bytes are reserved
-        scanStart = bytes_to_int(payload[24:28], True)
-        scanStop = bytes_to_int(payload[28:32], True)
-        scanStep = bytes_to_int(payload[32:34], True)
-        scanType = bytes_to_int(payload[34:35], False)
-        # 1 byte reserved
-        antennaID = bytes_to_int(payload[36:37], False)
-        operationalMode = bytes_to_int(payload[37:38], False)
-
-        # here is where we go off-track for a bit
-        # next section describes how much data we got
-        # and the data itself
-
-        numMessageSamples = bytes_to_int(payload[38:40], False)
-        numTotalSamples = bytes_to_int(payload[40:44], False)
-
-        # these next two basically tell us how many total messages
-        # and which message we are on
-        messageIndex = bytes_to_int(payload[44:46], False)
-        messageCount = bytes_to_int(payload[46:48], False)
-
-        # now we are onto scan data
-        scanData = []
-        for pos in range(48, len(payload), 4):
-            scanData.append(bytes_to_int(payload[pos:pos+4], True))
+        (sourceID, timestamp, scanStart, scanStop, scanStep, scanType, antennaID,
+         operationalMode, numMessageSamples, numTotalSamples, messageIndex,
+         messageCount) = SCAN_INFO_HEADER.unpack_from(payload)
+
+        # everything after the header is scan data, so view it in place
+        # instead of decoding it one sample at a time
+        scanData = np.frombuffer(payload, dtype=SCAN_SAMPLE_DTYPE,
+                                 count=(len(payload) - SCAN_INFO_HEADER.size) // 4,
+                                 offset=SCAN_INFO_HEADER.size)
 
         return {
             "sourceID": sourceID,
@@ -440,241 +262,177 @@ class mrmapi:
     # ID 0x1201
 
     def MRM_DETECTION_LIST_INFO(payload: bytes) -> dict:
-        """decodes a MRM_DETECTION_LIST_INFO packet 
+        """decodes a MRM_DETECTION_LIST_INFO packet
             Args:
                 payload (bytes): The payload of the packet
             Returns:
-                A dictionary containing the decoded packet
+                A dictionary containing the decoded packet. detections is a
+                read-only DETECTION_DTYPE view over the payload, with fields
+                index and magnitude, valid for as long as the payload buffer is
         """
 
-        numDetections = bytes_to_int(payload[0:2], False)
-
-        # the rest of the payload is made up of
-        # 4 byte detection records. The end is
-        # padded with 0s if the number of detections
-        # is below 350
+        (numDetections,) = DETECTION_COUNT.unpack_from(payload)
 
-        detections = []
-        for pos in range(2, len(numDetections * 4), 4):
-            index = bytes_to_int(payload[pos:pos+2], False)
-            magnitude = bytes_to_int(payload[pos+2:pos+4], True)
-            detections.append({"index": index, "magnitude": magnitude})
+        # the rest of the payload is made up of 4 byte detection records.
+        # The end is padded with 0s if there are fewer than 350 detections
+        count = min(numDetections, (len(payload) - DETECTION_COUNT.size) // DETECTION_DTYPE.itemsize)
+        detections = np.frombuffer(payload, dtype=DETECTION_DTYPE, count=count,
+                                   offset=DETECTION_COUNT.size)
 
         return {
             "numDetections": numDetections,
             "detections": detections
         }
 
-    # ID 0xF005
-
-    def MRM_SET_SLEEPMODE_REQUEST(mode=1) -> bytes:
-        """compiles a MRM_SET_SLEEPMODE_REQUEST packet
-            Args:
-                mode (int): The sleep mode to set
-            Returns:
-                A bytes object containing the packet
-        """
-
-        # additional warning to make sure we don't accidentally
-        # lose connection to the device
-
-        if (mode == 3 or mode == 4):
-            print("WARNING: Setting sleep mode to 3 or 4 will cause the device to stop responding to Ethernet commands!")
-            print("Mode will be set to 1 (IDLE) instead!")
-            mode = 1
-
-        params = [
-            [mode, 32, False]
-        ]
-
-        return bytes_from_list(params)
-
-    # ID 0xF105
-
-    def MRM_SET_SLEEPMODE_CONFIRM(payload: bytes) -> dict:
-        """decodes a MRM_SET_SLEEPMODE_CONFIRM packet
-            Args:
-                payload (bytes): The payload of the packet
-            Returns:
-                A dictionary containing the decoded packet
-        """
-
-        status = bytes_to_int(payload[0:4], False)
-        return {"status": status}
-
-    # ID 0xF006
-
-    def MRM_GET_SLEEPMODE_REQUEST() -> bytes:
-        """compiles a MRM_GET_SLEEPMODE_REQUEST packet
-            Returns:
-                A bytes object containing the packet
-        """
-
-        return bytes()
-
-    # ID 0xF106
-
-    def MRM_GET_SLEEPMODE_CONFIRM(payload: bytes) -> dict:
-        """decodes a MRM_GET_SLEEPMODE_CONFIRM packet
-            Args:
-                payload (bytes): The payload of the packet
-            Returns:
-                A dictionary containing the decoded packet
-        """
-
-        sleepMode = bytes_to_int(payload[0:4], False)
-        status = bytes_to_int(payload[4:8], False)
-
-        return {
-            "sleepMode": sleepMode,
-            "status": status
-        }
-
-    # ID 0xF202
-
-    def MRM_READY_INFO(payload: bytes) -> dict:
-        """decodes a MRM_READY_INFO packet
-            Args:
-                payload (bytes): The payload of the packet
-            Returns:
-                A dictionary containing the decoded packet
-        """
-
-        return {}
-
-    # ID 0xF10C
-    # This is the "mystery packet"
-    # It's sent instead of the actual response when an error is detected
-    # Generally we never want this to be sent
-
-    def MRM_GENERROR(payload: bytes) -> dict:
-        """decodes a MRM_GENERROR packet
-            Args:
-                payload (bytes): The payload of the packet
-            Returns:    
-                A dictionary containing the decoded packet
-        """
-
-        targetMessageType = bytes_to_int(payload[0:2], False)
-        targetMessageID = bytes_to_int(payload[2:4], False)
-        errorCode = bytes_to_int(payload[4:8], False)
-
-        # detect if it's an internal error (0x80000000)
-        if (errorCode & 0x80000000 == 0x80000000):
-            # here is where it gets especially nasty
-            # the given error code is actully OR'd with 0x80000000
-            # so we have to sus that out
-            errorCode = errorCode & 0x7FFFFFFF
-            print("WARNING! Internal Error Detected!")
-            print(
-                "This is a bug in the MRM API and should be reported to the manufacturer!")
-            print(f"Error Code: {errorCode}")
-
-            # stop the program from continuing to avoid any further issues
-            exit()
-
-        print("Message Error!\nOffending Message Info:")
-        print(
-            f"Type: {hex(targetMessageType)}\n MessageID: {targetMessageID}\n Error Code: {errorCode}")
-
-        return {
-            "targetMessageType": targetMessageType,
-            "targetMessageID": targetMessageID,
-            "errorCode": errorCode
-        }
-
 
 # function bank
 
 outgoing_func_bank = {}
 incoming_func_bank = {}
+incoming_codec_bank = {}  # compiled schemas of the fixed-size incoming messages
+
+# dict of ID: name
+message_types = {}
 
 
-def __add_to_outgoing(msgtype: int, func: callable, responseid: int = None):
-    """"registers" a function to be called when a packet is sent
+def __add_to_outgoing(msgtype: int, name: str, responseid: int = None, fields: list = [], prepare: callable = None):
+    """"registers" a schema to be used when a packet is sent
         Args:
-            msgtype: The message type to register the function to
-            func: The function to call
+            msgtype: The message type to register the schema to
+            name: The message name
             responseid: The message ID to send in the response
+            fields: The message schema, see MessageCodec
+            prepare: Optional hook to check/adjust the values before packing
     """
 
+    codec = MessageCodec(name, fields, prepare=prepare)
+
     outgoing_func_bank[msgtype] = {
-        "func": func,
+        "func": codec.pack,
+        "codec": codec,
         "responseID": responseid
     }
+    message_types[msgtype] = name
+    setattr(mrmapi, name, codec.pack)
 
 
-def __add_to_incoming(msgtype: int, func: callable):
-    """"registers" a function to be called when a packet is received
+def __add_to_incoming(msgtype: int, name: str, fields: list = None, finish: callable = None):
+    """"registers" a schema (or a hand-written decoder) to be used when a packet is received
         Args:
-            msgtype: The message type to register the function to
-            func: The function to call
+            msgtype: The message type to register the decoder to
+            name: The message name
+            fields: The message schema, see MessageCodec. If None, the
+                decoder is the mrmapi function of the same name
+            finish: Optional hook to post-process a decoded dict
     """
 
+    if fields is None:
+        func = getattr(mrmapi, name)
+    else:
+        codec = MessageCodec(name, fields, finish=finish)
+        incoming_codec_bank[msgtype] = codec
+        func = codec.unpack
+        setattr(mrmapi, name, func)
+
     incoming_func_bank[msgtype] = func
+    message_types[msgtype] = name
 
 
 # fill up the bank
-__add_to_outgoing(0x1001, mrmapi.MRM_SET_CONFIG_REQUEST, 0x1101)
-__add_to_outgoing(0x1002, mrmapi.MRM_GET_CONFIG_REQUEST, 0x1102)
-__add_to_outgoing(0x1003, mrmapi.MRM_CONTROL_REQUEST, 0x1103)
-__add_to_outgoing(0x1004, mrmapi.MRM_SERVER_CONNECT_REQUEST, 0x1104)
-__add_to_outgoing(0x1005, mrmapi.MRM_SERVER_DISCONNECT_REQUEST, 0x1105)
-__add_to_outgoing(0x1006, mrmapi.MRM_SET_FILTER_CONFIG_REQUEST, 0x1106)
-__add_to_outgoing(0x1007, mrmapi.MRM_GET_FILTER_CONFIG_REQUEST, 0x1107)
-__add_to_outgoing(0xF001, mrmapi.MRM_GET_STATUSINFO_REQUEST, 0xF101)
-__add_to_outgoing(0xF002, mrmapi.MRM_REBOOT_REQUEST, 0xF102)
-__add_to_outgoing(0xF003, mrmapi.MRM_SET_OPMODE_REQUEST, 0xF103)
-__add_to_outgoing(0xF005, mrmapi.MRM_SET_SLEEPMODE_REQUEST, 0xF105)
-__add_to_outgoing(0xF006, mrmapi.MRM_GET_SLEEPMODE_REQUEST, 0xF106)
-
-__add_to_incoming(0x1101, mrmapi.MRM_SET_CONFIG_CONFIRM)
-__add_to_incoming(0x1102, mrmapi.MRM_GET_CONFIG_CONFIRM)
-__add_to_incoming(0x1103, mrmapi.MRM_CONTROL_CONFIRM)
-__add_to_incoming(0x1104, mrmapi.MRM_SERVER_CONNECT_CONFIRM)
-__add_to_incoming(0x1105, mrmapi.MRM_SERVER_DISCONNECT_CONFIRM)
-__add_to_incoming(0x1106, mrmapi.MRM_SET_FILTER_CONFIG_CONFIRM)
-__add_to_incoming(0x1107, mrmapi.MRM_GET_FILTER_CONFIG_CONFIRM)
-__add_to_incoming(0xF101, mrmapi.MRM_GET_STATUSINFO_CONFIRM)
-__add_to_incoming(0xF102, mrmapi.MRM_REBOOT_CONFIRM)
-__add_to_incoming(0xF103, mrmapi.MRM_SET_OPMODE_CONFIRM)
-__add_to_incoming(0xF201, mrmapi.MRM_SCAN_INFO)
-__add_to_incoming(0xF105, mrmapi.MRM_SET_SLEEPMODE_CONFIRM)
-__add_to_incoming(0xF106, mrmapi.MRM_GET_SLEEPMODE_CONFIRM)
-__add_to_incoming(0xF202, mrmapi.MRM_READY_INFO)
-__add_to_incoming(0xF10C, mrmapi.MRM_GENERROR)
-
-
-# dict of ID: name
-message_types = {
-    0x1001: "MRM_SET_CONFIG_REQUEST",
-    0x1002: "MRM_GET_CONFIG_REQUEST",
-    0x1003: "MRM_CONTROL_REQUEST",
-    0x1004: "MRM_SERVER_CONNECT_REQUEST",
-    0x1005: "MRM_SERVER_DISCONNECT_REQUEST",
-    0x1006: "MRM_SET_FILTER_CONFIG_REQUEST",
-    0x1007: "MRM_GET_FILTER_CONFIG_REQUEST",
-    0x1101: "MRM_SET_CONFIG_CONFIRM",
-    0x1102: "MRM_GET_CONFIG_CONFIRM",
-    0x1103: "MRM_CONTROL_CONFIRM",
-    0x1104: "MRM_SERVER_CONNECT_CONFIRM",
-    0x1105: "MRM_SERVER_DISCONNECT_CONFIRM",
-    0x1106: "MRM_SET_FILTER_CONFIG_CONFIRM",
-    0x1107: "MRM_GET_FILTER_CONFIG_CONFIRM",
-    0xF001: "MRM_GET_STATUSINFO_REQUEST",
-    0xF002: "MRM_REBOOT_REQUEST",
-    0xF003: "MRM_SET_OPMODE_REQUEST",
-    0xF005: "MRM_SET_SLEEPMODE_REQUEST",
-    0xF006: "MRM_GET_SLEEPMODE_REQUEST",
-    0xF101: "MRM_GET_STATUSINFO_CONFIRM",
-    0xF102: "MRM_REBOOT_CONFIRM",
-    0xF103: "MRM_SET_OPMODE_CONFIRM",
-    0xF105: "MRM_SET_SLEEPMODE_CONFIRM",
-    0xF106: "MRM_GET_SLEEPMODE_CONFIRM",
-    0xF201: "MRM_SCAN_INFO",
-    0xF202: "MRM_READY_INFO",
-    0xF10C: "MRM_GENERROR"
-}
+__add_to_outgoing(0x1001, "MRM_SET_CONFIG_REQUEST", 0x1101, [
+    ("nodeID", "I", 5),
+    ("scanStart", "i", 0),  # picoseconds
+    ("scanEnd", "i", 5),  # picoseconds
+    ("scanResolution", "H", 32),  # picoseconds
+    ("baseIntegrationIndex", "H", 6),
+    (None, "12x"),  # NYI parameters
+    ("antennaMode", "B", 2),
+    ("transmitGain", "B", 60),
+    ("codeChannel", "B", 7),
+    ("persistFlag", "B", 0)
+])
+__add_to_outgoing(0x1002, "MRM_GET_CONFIG_REQUEST", 0x1102)
+__add_to_outgoing(0x1003, "MRM_CONTROL_REQUEST", 0x1103, [
+    ("scanCount", "H", 1),
+    (None, "2x"),
+    ("scanIntervalTime", "I", 0)  # microseconds
+])
+__add_to_outgoing(0x1004, "MRM_SERVER_CONNECT_REQUEST", 0x1104, [
+    ("ipaddr", "4B", (192, 168, 1, 151)),
+    ("port", "H", 21210),
+    (None, "2x")
+])
+__add_to_outgoing(0x1005, "MRM_SERVER_DISCONNECT_REQUEST", 0x1105)
+__add_to_outgoing(0x1006, "MRM_SET_FILTER_CONFIG_REQUEST", 0x1106, [
+    ("filterMask", "H", FILTER_RAW),
+    ("motionFilterIndex", "B", 0),
+    (None, "x")
+])
+__add_to_outgoing(0x1007, "MRM_GET_FILTER_CONFIG_REQUEST", 0x1107)
+__add_to_outgoing(0xF001, "MRM_GET_STATUSINFO_REQUEST", 0xF101)
+__add_to_outgoing(0xF002, "MRM_REBOOT_REQUEST", 0xF102)
+__add_to_outgoing(0xF003, "MRM_SET_OPMODE_REQUEST", 0xF103, [("opMode", "I", 1)])
+__add_to_outgoing(0xF005, "MRM_SET_SLEEPMODE_REQUEST", 0xF105, [("mode", "I", 1)],
+                  prepare=__check_sleep_mode)
+__add_to_outgoing(0xF006, "MRM_GET_SLEEPMODE_REQUEST", 0xF106)
+
+__add_to_incoming(0x1101, "MRM_SET_CONFIG_CONFIRM", STATUS_ONLY)
+__add_to_incoming(0x1102, "MRM_GET_CONFIG_CONFIRM", [
+    ("nodeID", "I"),
+    ("scanStart", "i"),
+    ("scanEnd", "i"),
+    ("scanResolution", "H"),
+    ("baseIntegrationIndex", "H"),
+    (None, "12x"),
+    ("antennaMode", "B"),
+    ("transmitGain", "B"),
+    ("codeChannel", "B"),
+    ("persistFlag", "B"),
+    ("timestamp", "I"),
+    ("status", "I")
+])
+__add_to_incoming(0x1103, "MRM_CONTROL_CONFIRM", STATUS_ONLY)
+__add_to_incoming(0x1104, "MRM_SERVER_CONNECT_CONFIRM", [("connectionStatus", "I")])
+__add_to_incoming(0x1105, "MRM_SERVER_DISCONNECT_CONFIRM", STATUS_ONLY)
+__add_to_incoming(0x1106, "MRM_SET_FILTER_CONFIG_CONFIRM", STATUS_ONLY)
+__add_to_incoming(0x1107, "MRM_GET_FILTER_CONFIG_CONFIRM", [
+    ("filterMask", "H"),
+    ("motionFilterIndex", "B"),
+    (None, "x"),
+    ("status", "I")
+])
+__add_to_incoming(0xF101, "MRM_GET_STATUSINFO_CONFIRM", [
+    ("mrmVersionMajor", "B"),
+    ("mrmVersionMinor", "B"),
+    ("mrmVersionBuild", "H"),
+    ("uwbKernelMajor", "B"),
+    ("uwbKernelMinor", "B"),
+    ("uwbKernelBuild", "H"),
+    ("fpgaFirmwareVersion", "B"),
+    ("fpgaFirmwareYear", "B"),
+    ("fpgaFirmwareMonth", "B"),
+    ("fpgaFirmwareDay", "B"),
+    ("serialNumber", "I"),
+    ("boardRevision", "B"),
+    ("bitTestResult", "B"),
+    ("boardType", "B"),
+    ("transmitterConfig", "B"),
+    ("temperature", "i"),
+    ("packageVersion", "32s"),
+    ("status", "I")
+], finish=__decode_package_version)
+__add_to_incoming(0xF102, "MRM_REBOOT_CONFIRM", STATUS_ONLY)
+__add_to_incoming(0xF103, "MRM_SET_OPMODE_CONFIRM", [("opmode", "I"), ("status", "I")])
+__add_to_incoming(0xF201, "MRM_SCAN_INFO")
+__add_to_incoming(0x1201, "MRM_DETECTION_LIST_INFO")
+__add_to_incoming(0xF105, "MRM_SET_SLEEPMODE_CONFIRM", STATUS_ONLY)
+__add_to_incoming(0xF106, "MRM_GET_SLEEPMODE_CONFIRM", [("sleepMode", "I"), ("status", "I")])
+__add_to_incoming(0xF202, "MRM_READY_INFO", [])
+__add_to_incoming(0xF10C, "MRM_GENERROR", [
+    ("targetMessageType", "H"),
+    ("targetMessageID", "H"),
+    ("errorCode", "I")
+], finish=__report_generror)
 
 
 def resolve_name(id: str) -> int:
@@ -0,0 +1,225 @@
+import selectors
+import time
+import numpy as np
+from lib.commanager import commanager
+from lib.radario import RadarConnection, PACKET_HEADER, MAX_PACKET_SIZE, RECV_TIMEOUT
+
+# Runs several radars at once, for example two antennas on one platform
+# Each node has its own commanager and socket. Config and control go through
+# the usual sync calls, then scan data from every node is read by one
+# selector loop on the calling thread. Every scan is stamped with the host
+# time it was received, which is the same clock for all nodes, so scans from
+# different radars can be lined up afterwards.
+
+
+class MultiRadar:
+
+    def __init__(self, addresses: dict, buffer_capacity: int = None) -> None:
+        """Creates a manager and a socket for every radar
+
+        Args:
+            addresses (dict): name: (ip, port) of each radar.
+            buffer_capacity (int): The most scans to keep per radar. None keeps all.
+        """
+        self.nodes = {name: commanager(buffer_capacity, RadarConnection(address))
+                      for name, address in addresses.items()}
+
+        self.selector = selectors.DefaultSelector()
+        self.buffers = {name: bytearray(MAX_PACKET_SIZE) for name in self.nodes}
+        self.running = False
+
+    def __getitem__(self, name: str) -> commanager:
+        return self.nodes[name]
+
+    def init_radars(self, configs: dict) -> dict:
+        """Configures every radar
+
+        Args:
+            configs (dict): name: keyword arguments for commanager.init_radar.
+
+        Returns:
+            name: configuration read back from that radar
+        """
+        return {name: self.nodes[name].init_radar(**kwargs) for name, kwargs in configs.items()}
+
+    def start(self, scan_count: int, scan_interval: int) -> bool:
+        """Starts every radar scanning and switches to the selector loop
+
+        Args:
+            scan_count (int): Number of scans for each radar, 65535 for infinite.
+            scan_interval (int): Time between scans.
+
+        Returns:
+            Whether every radar confirmed
+        """
+        ok = True
+        for name, comm in self.nodes.items():
+            resp = comm.send_sync("MRM_CONTROL_REQUEST", False,
+                                  scanCount=scan_count, scanIntervalTime=scan_interval)
+            if resp["status"] != 0:
+                print(f"ERROR: {name} failed to start scanning: {resp['status']}")
+                ok = False
+
+        for name, comm in self.nodes.items():
+            connection = comm.connection
+            receiver = connection.receiver
+
+            # hand the socket over from the receive thread to the selector,
+            # keeping anything the thread already picked up
+            if receiver is not None:
+                receiver.stop()
+                if connection.held_buffer is not None:
+                    receiver.release(connection.held_buffer)
+                while receiver.ready:
+                    index, size, rx_time = receiver.ready.popleft()
+                    self.__handle(comm, receiver.views[index][:size], rx_time)
+                connection.stop_receiver()
+
+            comm.mode = "async"
+            connection.sock.setblocking(False)
+            self.selector.register(connection.sock, selectors.EVENT_READ, name)
+
+        self.running = True
+        return ok
+
+    def __handle(self, comm: commanager, data: memoryview, rx_time: float) -> None:
+        """Passes one datagram to a node's commanager"""
+
+        if len(data) < PACKET_HEADER.size:
+            return
+        msgtype, msgid = PACKET_HEADER.unpack_from(data)
+        comm.handle_packet(msgtype, msgid, data[PACKET_HEADER.size:], rx_time)
+
+    def poll(self, timeout: float = RECV_TIMEOUT) -> int:
+        """Handles whatever has arrived from any radar
+
+        Args:
+            timeout (float): How long to wait for the first packet in seconds.
+
+        Returns:
+            The number of packets handled
+        """
+        handled = 0
+
+        for key, _events in self.selector.select(timeout):
+            name = key.data
+            comm = self.nodes[name]
+            buffer = self.buffers[name]
+            view = memoryview(buffer)
+            recorder = comm.connection.recorder
+
+            # drain the socket, then move on to the next one
+            while True:
+                try:
+                    size = key.fileobj.recv_into(buffer)
+                except (BlockingIOError, InterruptedError):
+                    break
+
+                rx_time = time.monotonic()
+                if recorder is not None:
+                    recorder.record(view[:size], rx_time)
+
+                self.__handle(comm, view[:size], rx_time)
+                handled += 1
+
+        return handled
+
+    def run(self, scan_count: int = None) -> dict:
+        """Runs the selector loop until every radar has scan_count scans or all go quiet
+
+        Args:
+            scan_count (int): Scans wanted from each radar. None runs until
+                nothing arrives for RECV_TIMEOUT seconds.
+
+        Returns:
+            name: ScanBuffer of that radar's scans
+        """
+        while self.running:
+            if self.poll(RECV_TIMEOUT) == 0:
+                # no radar has sent anything for a while
+                break
+
+            # count what the radars sent, including scans held back by
+            # salvage mode, since reduction keeps fewer than that
+            if scan_count is not None and \
+                    all(comm.received_scans() >= scan_count for comm in self.nodes.values()):
+                break
+
+        for comm in self.nodes.values():
+            comm.flush_reassembly()
+
+        return {name: comm.databuffer for name, comm in self.nodes.items()}
+
+    def stop(self) -> None:
+        """Leaves the selector loop and stops every radar scanning"""
+
+        self.running = False
+
+        for name, comm in self.nodes.items():
+            sock = comm.connection.sock
+            if name in self.__registered():
+                self.selector.unregister(sock)
+            sock.setblocking(True)
+            sock.settimeout(RECV_TIMEOUT)
+
+            comm.mode = "sync"
+            comm.send_sync("MRM_CONTROL_REQUEST", True, scanCount=0, scanIntervalTime=0)
+
+    def __registered(self) -> set:
+        """Names of the radars the selector is watching"""
+        return {key.data for key in self.selector.get_map().values()}
+
+    def aligned(self, tolerance: float = None) -> dict:
+        """Lines up scans from every radar by host receive time
+
+        The first radar is the reference. Each of its scans is matched with
+        the nearest scan from every other radar, and kept only if all of them
+        are within the tolerance.
+
+        Args:
+            tolerance (float): Largest host time difference in seconds. Defaults
+                to half the reference radar's median scan interval.
+
+        Returns:
+            name: indexes into that radar's databuffer, all the same length
+        """
+        names = list(self.nodes)
+        host_times = {name: self.nodes[name].databuffer.latest_host_times(
+            len(self.nodes[name].databuffer)) for name in names}
+
+        reference = host_times[names[0]]
+        if tolerance is None:
+            steps = np.diff(np.sort(reference))
+            tolerance = np.median(steps) / 2 if len(steps) else 0
+
+        keep = np.ones(len(reference), dtype=bool)
+        matches = {names[0]: np.arange(len(reference))}
+
+        for name in names[1:]:
+            times = host_times[name]
+            order = np.argsort(times, kind="stable")
+            times = times[order]
+
+            if len(times) == 0:
+                keep[:] = False
+                matches[name] = np.zeros(len(reference), dtype=np.int64)
+                continue
+
+            # nearest neighbour: the closer of the scans either side
+            right = np.clip(np.searchsorted(times, reference), 0, len(times) - 1)
+            left = np.clip(right - 1, 0, len(times) - 1)
+            nearest = np.where(np.abs(times[left] - reference) <= np.abs(times[right] - reference),
+                               left, right)
+
+            keep &= np.abs(times[nearest] - reference) <= tolerance
+            matches[name] = order[nearest]
+
+        return {name: indexes[keep] for name, indexes in matches.items()}
+
+    def close(self) -> None:
+        """Closes every socket"""
+
+        self.running = False
+        for comm in self.nodes.values():
+            comm.connection.close()
+        self.selector.close()
@@ -1,54 +1,377 @@
 # creates and manages socket connections
-from lib.util import bytes_to_int, int_to_bytes
+# Each RadarConnection owns its socket, send buffer and receive thread, so
+# several radars can be used at once. The module level functions use a
+# default connection to the radar in config.json, created on first use.
+from lib.mrmapi import MessageCodec
 from lib.config import get_config
+from lib.recorder import PacketRecorder
+from collections import deque
+import threading
 import socket
+import struct
+import time
 
-# create a socket
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+# every packet starts with a message type and a message ID
+PACKET_HEADER = struct.Struct(">HH")
 
+# largest packet we expect to send or receive
+MAX_PACKET_SIZE = 4096
 
-# set timeout to 2 seconds
-sock.settimeout(2)
+# how long a receive waits before raising TimeoutError (seconds)
+RECV_TIMEOUT = 2
 
-cfg = get_config()
+# kernel receive buffer to ask for, so bursts survive while we're busy
+SOCKET_RCVBUF = 4 * 1024 * 1024
 
-server_address = (cfg["net"]["ip"], cfg["net"]["port"])
 
+class PacketReceiver(threading.Thread):
+    """Receives packets on a background thread.
 
-def send_payload(msgtype: int, msgid: int, payload: bytes) -> int:
-    """Constructs a packet and sends it to the radar.
+    Packets are read with recv_into into a pool of preallocated buffers and
+    handed to the consumer through a deque, which is safe to append to and
+    pop from across threads without a lock. The consumer gets a memoryview
+    into the pool and gives the buffer back with release().
+    """
 
-    Args:
-        msgtype (int): The message type.
-        msgid (int): The message ID.
-        payload (bytes): The payload.
+    def __init__(self, sock: socket.socket, pool_size=1024, buffer_size=MAX_PACKET_SIZE):
+        """Creates the receiver. Call start() to begin receiving.
 
-    Returns:
-        The number of bytes sent.
-    """
-    msgtype = int_to_bytes(msgtype, 16, False)
-    msgid = int_to_bytes(msgid, 16, False)
-    packet = msgtype + msgid + payload
+        Args:
+            sock (socket.socket): The socket to receive from.
+            pool_size (int): Number of preallocated buffers.
+            buffer_size (int): Size of each buffer in bytes.
+        """
+        threading.Thread.__init__(self, name="radar-recv", daemon=True)
+
+        self.sock = sock
+        self.buffers = [bytearray(buffer_size) for _ in range(pool_size)]
+        self.views = [memoryview(buffer) for buffer in self.buffers]
+
+        # used when the pool is exhausted, the packet is dropped
+        self.scratch = bytearray(buffer_size)
+
+        self.free = deque(range(pool_size))  # indexes of free buffers
+        self.ready = deque()  # (index, size, receive time) of filled buffers
+        self.has_data = threading.Event()
+
+        self.recorder = None  # PacketRecorder that gets a copy of every packet
+        self.running = False
+        self.received = 0  # packets received
+        self.overruns = 0  # packets dropped because the pool was full
+
+    def run(self):
+        """Receive loop, runs on the background thread."""
+
+        self.running = True
+        while self.running:
+            try:
+                index = self.free.popleft()
+            except IndexError:
+                # consumer is too far behind, drop the packet
+                index = None
+
+            buffer = self.scratch if index is None else self.buffers[index]
+
+            try:
+                size = self.sock.recv_into(buffer)
+            except TimeoutError:
+                if index is not None:
+                    self.free.appendleft(index)
+                continue
+            except OSError:
+                # socket was closed
+                break
+
+            rx_time = time.monotonic()
+
+            # record before dropping anything, so the log has what the radar sent
+            recorder = self.recorder
+            if recorder is not None:
+                recorder.record(memoryview(buffer)[:size], rx_time)
+
+            if index is None:
+                self.overruns += 1
+                continue
+
+            self.received += 1
+            self.ready.append((index, size, rx_time))
+            self.has_data.set()
+
+        self.running = False
+
+    def stop(self):
+        """Stops the receive loop."""
+
+        self.running = False
+        self.join()
+
+    def get(self, timeout: float) -> tuple[int, int, float]:
+        """Waits for the next packet.
+
+        Args:
+            timeout (float): How long to wait in seconds.
+
+        Returns:
+            (buffer index, size, receive time) of the packet.
+        """
+        deadline = time.monotonic() + timeout
+
+        while True:
+            try:
+                return self.ready.popleft()
+            except IndexError:
+                pass
+
+            # clear and check again, so a packet that lands in between
+            # still wakes us up
+            self.has_data.clear()
+            if self.ready:
+                continue
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self.has_data.wait(remaining):
+                raise TimeoutError("timed out waiting for a packet")
+
+    def release(self, index: int):
+        """Gives a buffer back to the pool.
+
+        Args:
+            index (int): The buffer index returned by get().
+        """
+        self.free.append(index)
+
+
+class RadarConnection:
+
+    def __init__(self, address: tuple) -> None:
+        """Creates a socket for talking to one radar.
+
+        Args:
+            address (tuple): (ip, port) of the radar.
+        """
+        self.address = address
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.settimeout(RECV_TIMEOUT)
+
+        # outgoing packets are packed in place here instead of being concatenated
+        self.send_buffer = bytearray(MAX_PACKET_SIZE)
+
+        self.receiver = None  # the running PacketReceiver, started on the first receive
+        self.held_buffer = None  # pool buffer backing the last returned payload
+        self.recorder = None  # PacketRecorder, if recording
+
+    def send_payload(self, msgtype: int, msgid: int, payload: bytes) -> int:
+        """Constructs a packet and sends it to the radar.
+
+        Args:
+            msgtype (int): The message type.
+            msgid (int): The message ID.
+            payload (bytes): The payload.
+
+        Returns:
+            The number of bytes sent.
+        """
+        packet = PACKET_HEADER.pack(msgtype, msgid) + payload
+
+        return self.sock.sendto(packet, self.address)
+
+    def send_message(self, msgtype: int, msgid: int, codec: MessageCodec, **kwargs) -> int:
+        """Packs a message straight into the send buffer and sends it to the radar.
+
+        Args:
+            msgtype (int): The message type.
+            msgid (int): The message ID.
+            codec (MessageCodec): The compiled schema for the message.
+            **kwargs: The message fields.
+
+        Returns:
+            The number of bytes sent.
+        """
+        PACKET_HEADER.pack_into(self.send_buffer, 0, msgtype, msgid)
+        size = PACKET_HEADER.size + \
+            codec.pack_into(self.send_buffer, PACKET_HEADER.size, **kwargs)
+
+        return self.sock.sendto(memoryview(self.send_buffer)[:size], self.address)
+
+    def start_receiver(self, pool_size=1024) -> PacketReceiver:
+        """Starts receiving on a background thread.
+
+        Args:
+            pool_size (int): Number of preallocated packet buffers.
+
+        Returns:
+            The receiver.
+        """
+        if self.receiver is not None and self.receiver.is_alive():
+            return self.receiver
+
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_RCVBUF)
+        except OSError:
+            # not fatal, we just get the default buffer size
+            pass
 
-    bytes_sent = sock.sendto(packet, server_address)
+        # the thread wakes up regularly to check if it should stop
+        self.sock.settimeout(0.2)
 
-    return bytes_sent
+        self.receiver = PacketReceiver(self.sock, pool_size)
+        self.receiver.recorder = self.recorder
+        self.receiver.start()
 
+        return self.receiver
 
-def recv_payload() -> tuple[int, int, bytes]:
-    """Receives a packet from the radar.
+    def stop_receiver(self) -> None:
+        """Stops the background receiver, if running."""
+
+        if self.receiver is None:
+            return
+
+        self.receiver.stop()
+        self.receiver = None
+        self.held_buffer = None
+        self.sock.settimeout(RECV_TIMEOUT)
+
+    def start_recording(self, path: str) -> PacketRecorder:
+        """Starts writing every received datagram to a packet log.
+
+        Args:
+            path (str): Where to write the log, see lib.recorder.
+
+        Returns:
+            The recorder.
+        """
+        self.stop_recording()
+        self.recorder = PacketRecorder(path)
+
+        if self.receiver is None:
+            self.start_receiver()
+        self.receiver.recorder = self.recorder
+
+        return self.recorder
+
+    def stop_recording(self) -> None:
+        """Stops recording and closes the packet log, if recording."""
+
+        if self.recorder is None:
+            return
+
+        if self.receiver is not None:
+            self.receiver.recorder = None
+        self.recorder.close()
+        self.recorder = None
+
+    def recv_packet(self, timeout: float = RECV_TIMEOUT) -> tuple[int, int, memoryview, float]:
+        """Receives a packet from the radar.
+
+        The payload is a view into a pool buffer and is only valid until the
+        next call, so copy anything that needs to outlive it.
+
+        Args:
+            timeout (float): How long to wait in seconds. 0 only returns a
+                packet that has already arrived.
+
+        Returns:
+            (msgtype, msgid, payload, receive time). The receive time is from
+            time.monotonic().
+        """
+        receiver = self.receiver
+        if receiver is None:
+            receiver = self.start_receiver()
+
+        # the previous payload is no longer needed
+        if self.held_buffer is not None:
+            receiver.release(self.held_buffer)
+            self.held_buffer = None
+
+        index, size, rx_time = receiver.get(timeout)
+        self.held_buffer = index
+
+        data = receiver.views[index]
+        msgtype, msgid = PACKET_HEADER.unpack_from(data)
+
+        # slicing a memoryview doesn't copy the payload
+        return (msgtype, msgid, data[PACKET_HEADER.size:size], rx_time)
+
+    def recv_payload(self) -> tuple[int, int, memoryview]:
+        """Receives a packet from the radar.
+
+        Returns:
+            The payload, as a memoryview that is valid until the next receive.
+        """
+        msgtype, msgid, payload, _rx_time = self.recv_packet()
+
+        return (msgtype, msgid, payload)
+
+    def close(self) -> None:
+        """Closes the socket."""
+
+        self.stop_recording()
+        self.stop_receiver()
+        self.sock.close()
+
+
+default_connection = None  # connection to the radar in config.json
+
+
+def get_connection() -> RadarConnection:
+    """Gets the default connection, creating it from the config on first use.
 
     Returns:
-        The payload.
+        The connection.
     """
-    data, server = sock.recvfrom(4096)
+    global default_connection
+
+    if default_connection is None:
+        cfg = get_config()
+        default_connection = RadarConnection((cfg["net"]["ip"], cfg["net"]["port"]))
+
+    return default_connection
+
+
+def send_payload(msgtype: int, msgid: int, payload: bytes) -> int:
+    """send_payload() on the default connection."""
+    return get_connection().send_payload(msgtype, msgid, payload)
+
+
+def send_message(msgtype: int, msgid: int, codec: MessageCodec, **kwargs) -> int:
+    """send_message() on the default connection."""
+    return get_connection().send_message(msgtype, msgid, codec, **kwargs)
 
-    msgtype = bytes_to_int(data[0:2], False)
-    msgid = bytes_to_int(data[2:4], False)
 
-    return (msgtype, msgid, data[4:])
+def start_receiver(pool_size=1024) -> PacketReceiver:
+    """start_receiver() on the default connection."""
+    return get_connection().start_receiver(pool_size)
+
+
+def stop_receiver():
+    """stop_receiver() on the default connection."""
+    get_connection().stop_receiver()
+
+
+def start_recording(path: str) -> PacketRecorder:
+    """start_recording() on the default connection."""
+    return get_connection().start_recording(path)
+
+
+def stop_recording():
+    """stop_recording() on the default connection."""
+    get_connection().stop_recording()
+
+
+def recv_packet(timeout: float = RECV_TIMEOUT) -> tuple[int, int, memoryview, float]:
+    """recv_packet() on the default connection."""
+    return get_connection().recv_packet(timeout)
+
+
+def recv_payload() -> tuple[int, int, memoryview]:
+    """recv_payload() on the default connection."""
+    return get_connection().recv_payload()
 
 
 def killSocket():
-    """Closes the socket."""
-    sock.close()
+    """Closes the default connection."""
+    global default_connection
+
+    if default_connection is not None:
+        default_connection.close()
+        default_connection = None
@@ -0,0 +1,196 @@
+import json
+import time
+
+# Adjusts the scan interval while the radar is scanning
+# Once per period, the controller looks at what happened since the last
+# look: scans lost (expired, or dropped by the receive pool), the number of
+# scans waiting in the reassembler, and how full the receive queue and the
+# consumer are. If anything is falling behind, the scan interval is raised
+# by half (at least one step). Once everything has been keeping up for a
+# few periods, it is lowered by one step. Both stay within the configured
+# bounds. Every change is recorded so it can be saved with the capture.
+
+
+class RateController:
+
+    def __init__(self, interval: int, min_interval: int = 0, max_interval: int = 100000,
+                 step: int = 1000, max_drop_rate: float = 0.01, max_backlog: int = 64,
+                 period: float = 1.0, calm_periods: int = 3, scan_count: int = 65535,
+                 consumer: callable = None) -> None:
+        """Creates a controller. Attach it with commanager.controller = controller.
+
+        Args:
+            interval (int): The scan interval the scan was started with (us).
+            min_interval (int): Fastest interval to go to (us).
+            max_interval (int): Slowest interval to go to (us).
+            step (int): How much to speed up by at a time (us).
+            max_drop_rate (float): Fraction of scans lost in a period before slowing down.
+            max_backlog (int): Scans waiting in the reassembler before slowing down.
+            period (float): Seconds between looks.
+            calm_periods (int): Periods without trouble before speeding up.
+            scan_count (int): Scans the scan was started with, 65535 for continuous.
+                A finite scan is restarted with the scans it still has to go.
+            consumer (callable): Returns how full whatever consumes the scans
+                is, from 0 to 1. None if there's nothing to watch.
+        """
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.step = step
+        self.max_drop_rate = max_drop_rate
+        self.max_backlog = max_backlog
+        self.period = period
+        self.calm_periods = calm_periods
+        self.scan_count = scan_count
+        self.consumer = consumer
+
+        self.last_check = None  # host time of the last look
+        self.last_counts = None  # (scans, lost) at the last look
+        self.calm = 0  # periods in a row without trouble
+        self.adjustments = []  # every change, oldest first
+
+    @classmethod
+    def from_config(cls, config: dict, **kwargs) -> "RateController" or None:
+        """Creates a controller from the "rateControl" section of config.json
+
+        Args:
+            config (dict): The whole config.
+            **kwargs: Override the config, e.g. scan_count or consumer.
+
+        Returns:
+            The controller, or None if rate control isn't enabled
+        """
+        rate = config.get("rateControl", {})
+        if not rate.get("enabled", False):
+            return None
+
+        options = {
+            "interval": config["radar"]["scanInterval"],
+            "min_interval": rate.get("minInterval", 0),
+            "max_interval": rate.get("maxInterval", 100000),
+            "step": rate.get("step", 1000),
+            "max_drop_rate": rate.get("maxDropRate", 0.01),
+            "max_backlog": rate.get("maxBacklog", 64),
+            "period": rate.get("period", 1.0)
+        }
+        options.update(kwargs)
+        return cls(**options)
+
+    def update(self, comm) -> dict or None:
+        """Takes a look if a period has passed, and adjusts the rate if needed.
+        Called by commanager.get_data after every packet.
+
+        Args:
+            comm (commanager): The manager of the scan.
+
+        Returns:
+            The adjustment, or None if the rate didn't change
+        """
+        # the scan is ending, leave the radar alone
+        if comm.shutdown_mode:
+            return None
+        if self.scan_count != 65535 and comm.metrics.scans >= self.scan_count:
+            return None
+
+        now = time.monotonic()
+        if self.last_check is None:
+            self.last_check = now
+            self.last_counts = self.__counts(comm)
+            return None
+        if now - self.last_check < self.period:
+            return None
+
+        counts = self.__counts(comm)
+        scans = counts[0] - self.last_counts[0]
+        lost = counts[1] - self.last_counts[1]
+        self.last_check = now
+        self.last_counts = counts
+
+        drop_rate = lost / max(scans + lost, 1)
+        backlog = len(comm.reassembler) + len(comm.reassembler.ready)
+        queue = self.__queue(comm)
+        consumer = self.consumer() if self.consumer is not None else 0.0
+
+        reasons = []
+        if drop_rate > self.max_drop_rate:
+            reasons.append(f"drop rate {drop_rate:.1%}")
+        if backlog > self.max_backlog:
+            reasons.append(f"backlog {backlog}")
+        if queue > 0.5:
+            reasons.append(f"receive queue {queue:.0%}")
+        if consumer > 0.5:
+            reasons.append(f"consumer {consumer:.0%}")
+
+        if reasons:
+            self.calm = 0
+            interval = min(max(int(self.interval * 1.5), self.interval + self.step),
+                           self.max_interval)
+            reason = "slow down: " + ", ".join(reasons)
+        elif drop_rate == 0 and queue < 0.1 and consumer < 0.1:
+            self.calm += 1
+            if self.calm < self.calm_periods:
+                return None
+            self.calm = 0
+            interval = max(self.interval - self.step, self.min_interval)
+            reason = "speed up"
+        else:
+            self.calm = 0
+            return None
+
+        if interval == self.interval:
+            return None
+
+        scan_count = self.scan_count
+        if scan_count != 65535:
+            # the radar starts counting again
+            scan_count = max(scan_count - comm.metrics.scans, 1)
+        comm.send_control(scan_count, interval)
+
+        adjustment = {
+            "host_time": now,
+            "radar_time": comm.metrics.newest_scan,
+            "scans": comm.metrics.scans,
+            "old_interval": self.interval,
+            "new_interval": interval,
+            "reason": reason,
+            "drop_rate": drop_rate,
+            "backlog": backlog,
+            "queue": queue,
+            "consumer": consumer
+        }
+        self.adjustments.append(adjustment)
+        self.interval = interval
+
+        return adjustment
+
+    def __counts(self, comm) -> tuple[int, int]:
+        """(scans stored, scans lost) so far"""
+
+        lost = comm.metrics.expired
+        receiver = comm.connection.receiver
+        if receiver is not None:
+            # a dropped packet loses at most one scan
+            lost += receiver.overruns
+        return (comm.metrics.scans, lost)
+
+    def __queue(self, comm) -> float:
+        """How full the receive pool is, from 0 to 1"""
+
+        receiver = comm.connection.receiver
+        if receiver is None or not receiver.views:
+            return 0.0
+        return len(receiver.ready) / len(receiver.views)
+
+    def save(self, file_path: str) -> None:
+        """Writes the adjustments to a JSON file, next to the capture
+
+        Args:
+            file_path (str): Where to write them.
+        """
+        with open(file_path, "w") as f:
+            json.dump({
+                "min_interval": self.min_interval,
+                "max_interval": self.max_interval,
+                "final_interval": self.interval,
+                "adjustments": self.adjustments
+            }, f, indent=4)
@@ -1,4 +1,3 @@
-import pandas
 import numpy as np
 
 
@@ -14,6 +13,9 @@ def read_csv(filepath: str, object_name: str) -> np.ndarray:
 
     """
 
+    # pandas is slow to import, so only load it when a csv is read
+    import pandas
+
     # read in csv
     df = pandas.read_csv(filepath, header=[2, 4, 5])
 
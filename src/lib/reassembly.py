@@ -0,0 +1,331 @@
+import heapq
+import numpy as np
+
+# Reassembles scans that were split over several MRM_SCAN_INFO messages
+# Each scan in flight owns a preallocated sample array and a bitmask of the
+# parts received so far. Parts are written straight to their offset, and
+# stale scans are found through a heap ordered by timestamp, so the work per
+# packet doesn't depend on how many scans are in flight.
+#
+# In salvage mode, scans that are still missing parts when they expire are
+# kept instead of discarded. The missing samples are left at 0 ("mask") or
+# filled by interpolating between the neighbouring complete scans
+# ("interpolate"), and the scan is flagged. Scans are then released in
+# timestamp order, so a salvaged scan takes its place in the slow-time series.
+
+# flags of a released scan
+SCAN_PARTIAL = 1  # some parts never arrived
+SCAN_INTERPOLATED = 2  # the missing samples were filled from neighbouring scans
+
+SALVAGE_MODES = [None, "mask", "interpolate"]
+
+
+class PendingScan:
+    __slots__ = ("timestamp", "samples", "received", "complete", "messageCount", "first_rx",
+                 "last_rx", "part_size", "flags")
+
+    def __init__(self, timestamp: int, samples: np.ndarray, messageCount: int, first_rx: float = None) -> None:
+        """A scan that is still missing parts
+
+        Args:
+            timestamp (int): The radar timestamp of the scan.
+            samples (np.ndarray): Where the parts are written.
+            messageCount (int): How many parts the scan was split into.
+            first_rx (float): Host receive time of the first part to arrive.
+        """
+        self.timestamp = timestamp
+        self.samples = samples
+        self.messageCount = messageCount
+        self.first_rx = first_rx
+        self.last_rx = first_rx  # host receive time of the latest part
+        self.received = 0  # bit i is set once part i has arrived
+        self.complete = (1 << messageCount) - 1
+        self.part_size = None  # samples in every part but the last, once one arrives
+        self.flags = 0  # SCAN_PARTIAL, SCAN_INTERPOLATED
+
+    def missing(self) -> list[tuple[int, int]]:
+        """Finds the samples of the parts that haven't arrived
+
+        Returns:
+            list of (start, end) sample ranges
+        """
+        length = len(self.samples)
+        size = self.part_size or -(-length // self.messageCount)
+
+        ranges = []
+        for index in range(self.messageCount):
+            if self.received >> index & 1:
+                continue
+
+            if index == self.messageCount - 1:
+                ranges.append((min(index * size, length), length))
+            else:
+                ranges.append((min(index * size, length), min((index + 1) * size, length)))
+
+        return ranges
+
+
+class ScanReassembler:
+
+    def __init__(self, expiry: int = 3000, salvage: str = None) -> None:
+        """Creates a reassembler
+
+        Args:
+            expiry (int): How long (in radar ms) to wait for missing parts
+                before a scan is discarded, or salvaged.
+            salvage (str): None to discard incomplete scans, "mask" to keep
+                them with the missing samples at 0, "interpolate" to fill the
+                missing samples from the neighbouring scans.
+        """
+        if salvage not in SALVAGE_MODES:
+            raise ValueError(f"Unknown salvage mode {salvage}, expected one of {SALVAGE_MODES}")
+
+        self.expiry = expiry
+        self.salvage = salvage
+        self.pending = {}  # timestamp: PendingScan
+        self.expiry_heap = []  # timestamps of pending scans, oldest on top
+        self.done = set()  # completed timestamps that haven't expired yet
+        self.done_heap = []  # those of them moved off the top of expiry_heap
+        self.free = {}  # length: sample arrays ready to be reused
+        self.ready = []  # (timestamp, scan) heap of scans waiting to be released in order
+        self.previous = None  # (timestamp, samples) copy of the last complete scan released
+
+        self.newest = 0  # newest timestamp seen
+        self.duplicates = 0  # parts received more than once
+        self.late = 0  # parts that arrived after their scan expired
+        self.expired = 0  # scans discarded because of missing parts
+        self.salvaged = 0  # incomplete scans kept by salvage mode
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def add(self, header: dict, rx_time: float = None) -> PendingScan or None:
+        """Adds a decoded MRM_SCAN_INFO part
+
+        Args:
+            header (dict): The decoded packet, see mrmapi.MRM_SCAN_INFO
+            rx_time (float): Host receive time of the packet, if known
+
+        Returns:
+            The scan if this part completed it, otherwise None. Pass it to
+            release() once its samples have been copied out. In salvage mode
+            this is always None, completed scans come out of collect().
+        """
+        timestamp = header["timestamp"]
+        index = header["messageIndex"]
+        total = header["numTotalSamples"]
+
+        if timestamp > self.newest:
+            self.newest = timestamp
+
+        scan = self.pending.get(timestamp)
+        if scan is None:
+            if timestamp < self.newest - self.expiry:
+                # its scan has already been completed or discarded
+                self.late += 1
+                return None
+
+            if timestamp in self.done:
+                # a late copy of a part of a finished scan
+                self.duplicates += 1
+                return None
+
+            scan = PendingScan(timestamp, self.__take(total), header["messageCount"], rx_time)
+            self.pending[timestamp] = scan
+            heapq.heappush(self.expiry_heap, timestamp)
+
+        bit = 1 << index
+        if scan.received & bit:
+            self.duplicates += 1
+            return None
+        scan.received |= bit
+        scan.last_rx = rx_time
+
+        # write the part at its offset. Every part but the last is full
+        # sized, so the last one is placed against the end of the scan
+        data = header["scanData"]
+        count = min(header["numMessageSamples"], len(data))
+        if index == scan.messageCount - 1:
+            offset = max(len(scan.samples) - count, 0)
+        else:
+            offset = index * count
+            scan.part_size = count
+        count = max(min(count, len(scan.samples) - offset), 0)
+        scan.samples[offset:offset + count] = data[:count]
+
+        if scan.received != scan.complete:
+            return None
+
+        # done, it stays on the heap and is skipped when it reaches the top
+        del self.pending[timestamp]
+        self.done.add(timestamp)
+
+        if self.salvage is not None:
+            heapq.heappush(self.ready, (timestamp, scan))
+            return None
+        return scan
+
+    def collect(self, timestamp: int) -> list[PendingScan]:
+        """Salvages scans that are too old to complete and releases scans in
+        timestamp order. Only used in salvage mode.
+
+        A scan is released once every older scan has been completed or
+        salvaged. Pass each one to release() once its samples have been
+        copied out.
+
+        Args:
+            timestamp (int): The newest radar timestamp seen.
+
+        Returns:
+            The scans, oldest first
+        """
+        if self.salvage is None:
+            return []
+
+        released = []
+        heap = self.expiry_heap
+        limit = timestamp - self.expiry
+
+        while heap and heap[0] < limit:
+            old = heapq.heappop(heap)
+            scan = self.pending.pop(old, None)
+            if scan is None:
+                # already completed
+                self.done.discard(old)
+                continue
+
+            # its older neighbour has to be released first
+            self.__release_before(old, released)
+            self.__salvage(scan)
+            heapq.heappush(self.ready, (old, scan))
+
+        # uncover the oldest pending scan. Completed ones still have to
+        # catch late duplicates until they expire, so they are kept aside
+        while heap and heap[0] not in self.pending:
+            heapq.heappush(self.done_heap, heapq.heappop(heap))
+
+        done_heap = self.done_heap
+        while done_heap and done_heap[0] < limit:
+            self.done.discard(heapq.heappop(done_heap))
+
+        self.__release_before(heap[0] if heap else None, released)
+        return released
+
+    def flush(self) -> list[PendingScan]:
+        """Salvages every pending scan and releases everything, for the end of
+        a capture. Only used in salvage mode.
+
+        Returns:
+            The scans, oldest first
+        """
+        return self.collect(self.newest + self.expiry + 1)
+
+    def __release_before(self, timestamp: int, released: list) -> None:
+        """Moves the ready scans older than timestamp (all if None) into released"""
+
+        ready = self.ready
+        while ready and (timestamp is None or ready[0][0] < timestamp):
+            old, scan = heapq.heappop(ready)
+            if scan.flags == 0 and self.salvage == "interpolate":
+                self.previous = (old, scan.samples.copy())
+            released.append(scan)
+
+    def __salvage(self, scan: PendingScan) -> None:
+        """Fills in the parts of a scan that never arrived and flags it"""
+
+        self.salvaged += 1
+        scan.flags = SCAN_PARTIAL
+        if self.salvage != "interpolate":
+            # the samples are zeroed when the scan is started
+            return
+
+        length = len(scan.samples)
+        before = self.previous
+        if before is not None and len(before[1]) != length:
+            before = None
+
+        # the closest complete scan after it that is waiting to be released
+        after = None
+        for timestamp, other in self.ready:
+            if timestamp > scan.timestamp and other.flags == 0 and len(other.samples) == length \
+                    and (after is None or timestamp < after[0]):
+                after = (timestamp, other.samples)
+
+        if before is None and after is None:
+            return
+
+        for start, end in scan.missing():
+            if before is None:
+                scan.samples[start:end] = after[1][start:end]
+            elif after is None:
+                scan.samples[start:end] = before[1][start:end]
+            else:
+                # linear in time between the two neighbours
+                weight = (scan.timestamp - before[0]) / (after[0] - before[0])
+                low = before[1][start:end].astype(np.float64)
+                high = after[1][start:end]
+                scan.samples[start:end] = np.rint(low + weight * (high - low))
+
+        scan.flags |= SCAN_INTERPOLATED
+
+    def expire(self, timestamp: int) -> list[int]:
+        """Discards scans that are too old to complete
+
+        Args:
+            timestamp (int): The newest radar timestamp seen.
+
+        Returns:
+            The timestamps of the discarded scans
+        """
+        discarded = []
+        heap = self.expiry_heap
+        limit = timestamp - self.expiry
+
+        while heap and heap[0] < limit:
+            old = heapq.heappop(heap)
+            scan = self.pending.pop(old, None)
+            if scan is None:
+                # already completed
+                self.done.discard(old)
+                continue
+
+            self.release(scan)
+            self.expired += 1
+            discarded.append(old)
+
+        return discarded
+
+    def release(self, scan: PendingScan) -> None:
+        """Returns a scan's sample array so a later scan can reuse it
+
+        Args:
+            scan (PendingScan): A scan returned by add().
+        """
+        self.free.setdefault(len(scan.samples), []).append(scan.samples)
+        scan.samples = None
+
+    def __take(self, length: int) -> np.ndarray:
+        """Gets a zeroed sample array, reusing a released one if possible"""
+
+        arrays = self.free.get(length)
+        if arrays:
+            samples = arrays.pop()
+            samples.fill(0)
+            return samples
+        return np.zeros(length, dtype=np.int32)
+
+
+def reassembly_from_config(config: dict) -> dict:
+    """Gets the reassembly settings from the "reassembly" section of config.json
+
+    Args:
+        config (dict): The whole config.
+
+    Returns:
+        Keyword arguments for ScanReassembler and commanager (expiry, salvage)
+    """
+    reassembly = config.get("reassembly", {})
+    return {
+        "expiry": reassembly.get("expiry", 3000),
+        "salvage": reassembly.get("salvage", None)
+    }
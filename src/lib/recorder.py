@@ -0,0 +1,117 @@
+import struct
+import threading
+import time
+
+# Records raw radar datagrams to a binary log and plays them back
+#
+# A log starts with PACKET_LOG_MAGIC, followed by one record per datagram:
+# the receive time (time.monotonic(), float64), the datagram length (uint16)
+# and the datagram itself, header included. Everything is big-endian like
+# the MRM API.
+
+PACKET_LOG_MAGIC = b"T2PKTLOG\x00\x01"
+
+RECORD_HEADER = struct.Struct(">dH")
+
+# same as radario.PACKET_HEADER, radario imports this module
+PACKET_HEADER = struct.Struct(">HH")
+
+
+class PacketRecorder:
+
+    def __init__(self, path: str) -> None:
+        """Opens a packet log for writing
+
+        Args:
+            path (str): Where to write the log. An existing file is overwritten.
+        """
+        self.path = path
+        self.file = open(path, "wb", buffering=1024 * 1024)
+        self.file.write(PACKET_LOG_MAGIC)
+
+        # records are written from the receive thread
+        self.lock = threading.Lock()
+        self.count = 0  # datagrams recorded
+
+    def record(self, data: memoryview, rx_time: float) -> None:
+        """Appends a datagram to the log
+
+        Args:
+            data (memoryview): The full datagram.
+            rx_time (float): When it was received, from time.monotonic().
+        """
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(RECORD_HEADER.pack(rx_time, len(data)))
+            self.file.write(data)
+            self.count += 1
+
+    def close(self) -> None:
+        """Flushes and closes the log"""
+
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def read_packets(path: str):
+    """Reads a packet log
+
+    Args:
+        path (str): The log to read.
+
+    Yields:
+        (receive time, msgtype, msgid, payload) for every datagram in the log
+    """
+    with open(path, "rb") as f:
+        if f.read(len(PACKET_LOG_MAGIC)) != PACKET_LOG_MAGIC:
+            raise ValueError(f"{path} is not a packet log")
+
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                # end of the log, or a record cut short by a crash
+                return
+
+            rx_time, size = RECORD_HEADER.unpack(header)
+            data = f.read(size)
+            if len(data) < size or size < PACKET_HEADER.size:
+                return
+
+            msgtype, msgid = PACKET_HEADER.unpack_from(data)
+            yield (rx_time, msgtype, msgid, memoryview(data)[PACKET_HEADER.size:])
+
+
+def replay(path: str, comm, speed: float = 1.0) -> int:
+    """Feeds a packet log into a commanager as if it was coming from the radar
+
+    Packets are handed to comm.handle_packet with their recorded receive
+    times, so reassembly sees exactly what it saw during the recording.
+
+    Args:
+        path (str): The log to replay.
+        comm (commanager): Where to send the packets.
+        speed (float): Playback speed, 1 is real time. None plays as fast as possible.
+
+    Returns:
+        The number of packets replayed
+    """
+    count = 0
+    first_rx = None
+    start = time.monotonic()
+
+    for rx_time, msgtype, msgid, payload in read_packets(path):
+        if first_rx is None:
+            first_rx = rx_time
+
+        if speed:
+            delay = start + (rx_time - first_rx) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        comm.handle_packet(msgtype, msgid, payload, rx_time)
+        count += 1
+
+    return count
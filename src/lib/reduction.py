@@ -0,0 +1,136 @@
+import numpy as np
+
+# Cuts scans down as they are reassembled, before they are buffered
+# Range gating keeps a window of range bins, coherent integration averages
+# every N scans into one, and decimation keeps one of every M averaged
+# scans. With the defaults every scan passes through untouched.
+
+
+class ScanReducer:
+
+    def __init__(self, gate_start: int = 0, gate_end: int = None, average: int = 1,
+                 decimate: int = 1) -> None:
+        """Creates a reducer
+
+        Args:
+            gate_start (int): First range bin to keep.
+            gate_end (int): Range bin to stop at (exclusive). None keeps the rest.
+            average (int): Number of consecutive scans averaged into one.
+            decimate (int): Keep one of every this many averaged scans.
+        """
+        if average < 1 or decimate < 1:
+            raise ValueError("average and decimate must be at least 1")
+
+        self.gate = slice(gate_start, gate_end)
+        self.average = average
+        self.decimate = decimate
+
+        self.input_length = None  # samples per scan before gating
+        self.sum = None  # running sum of the scans being averaged
+        self.out = None  # reused for the averaged scan
+        self.timestamps = 0  # sum of their timestamps
+        self.host_times = 0.0  # sum of their host times
+        self.flags = 0  # flags of any of them
+        self.count = 0  # scans in the running sum
+        self.averaged = 0  # averaged scans produced, for decimation
+
+    @classmethod
+    def from_config(cls, config: dict) -> "ScanReducer":
+        """Creates a reducer from the "reduction" section of config.json, if any
+
+        Args:
+            config (dict): The whole config.
+
+        Returns:
+            The reducer
+        """
+        reduction = config.get("reduction", {})
+        return cls(gate_start=reduction.get("gateStart", 0),
+                   gate_end=reduction.get("gateEnd", None),
+                   average=reduction.get("average", 1),
+                   decimate=reduction.get("decimate", 1))
+
+    @property
+    def passthrough(self) -> bool:
+        """Whether the reducer leaves scans as they are"""
+        return self.gate == slice(0, None) and self.average == 1 and self.decimate == 1
+
+    def reset(self) -> None:
+        """Drops a partly averaged scan and restarts decimation"""
+
+        self.sum = None
+        self.count = 0
+        self.averaged = 0
+
+    def process(self, timestamp: int, samples: np.ndarray, host_time: float = None, flags: int = 0):
+        """Runs one reassembled scan through the reducer
+
+        Args:
+            timestamp (int): The radar timestamp of the scan.
+            samples (np.ndarray): The samples.
+            host_time (float): When the host received it.
+            flags (int): Its reassembly flags, an average gets the flags of all its scans.
+
+        Returns:
+            (timestamp, samples, host_time, flags) of a reduced scan, or None if this
+            scan was folded into an average or decimated away. The samples
+            are only valid until the next call.
+        """
+        self.input_length = len(samples)
+        gated = samples[self.gate]
+
+        if self.average == 1:
+            result = (timestamp, gated, host_time, flags)
+        else:
+            if self.sum is None or len(self.sum) != len(gated):
+                self.sum = np.zeros(len(gated), dtype=np.int64)
+                self.out = np.zeros(len(gated), dtype=np.int32)
+                self.count = 0
+
+            if self.count == 0:
+                self.sum[:] = gated
+                self.timestamps = timestamp
+                self.host_times = np.nan if host_time is None else host_time
+                self.flags = flags
+            else:
+                self.sum += gated
+                self.timestamps += timestamp
+                self.host_times += np.nan if host_time is None else host_time
+                self.flags |= flags
+            self.count += 1
+
+            if self.count < self.average:
+                return None
+
+            # the average is stamped with the middle of the window
+            np.floor_divide(self.sum, self.average, out=self.out, casting="unsafe")
+            result = (self.timestamps // self.average, self.out, self.host_times / self.average,
+                      self.flags)
+            self.count = 0
+
+        self.averaged += 1
+        if (self.averaged - 1) % self.decimate != 0:
+            return None
+
+        return result
+
+    def ranges(self, start_range: float, end_range: float) -> tuple[float, float]:
+        """Gets the range covered by the gated scans
+
+        Bins are evenly spaced from the first to the last, like
+        np.linspace(start_range, end_range, input_length).
+
+        Args:
+            start_range (float): Range of the first bin before gating.
+            end_range (float): Range of the last bin before gating.
+
+        Returns:
+            (start_range, end_range) of the first and last bin kept
+        """
+        if self.input_length is None or self.input_length < 2:
+            return start_range, end_range
+
+        bin_size = (end_range - start_range) / (self.input_length - 1)
+        first, stop, _step = self.gate.indices(self.input_length)
+        last = max(stop - 1, first)  # an empty gate is pinned to its first bin
+        return start_range + first * bin_size, start_range + last * bin_size
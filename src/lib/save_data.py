@@ -1,49 +1,268 @@
 from collections import deque
+from lib.scanbuffer import ScanBuffer
+from lib.compression import CompressedCaptureWriter, COMPRESSED_EXTENSION
+from lib.columnar import ColumnarCaptureWriter, COLUMNAR_EXTENSION
+from lib.clock import wall_clock_offset
+import numpy as np
 import pickle
-
-# create the "./data" directory if it doesn't exist
 import os
-if not os.path.exists("./data"):
-    os.makedirs("./data")
-
-# same with the bundles directory
-if not os.path.exists("./bundles"):
-    os.makedirs("./bundles")
 
 
-def save_data(data: deque, start_range: float, end_range: float, file_path: str):
+def save_data(data: deque, start_range: float, end_range: float, file_path: str,
+              compression: dict = None, columnar: bool = False, clock=None):
     """ Saves the data to a file.
         Args:
-            data (deque): A deque of data sets
+            data (deque or ScanBuffer): A deque of data sets
             start_range (float): The start range of the scan (in meters)
             end_range (float): The end range of the scan (in meters)
             filepath (str): The path where to save the file 
+            compression (dict): Keyword arguments for CompressedCaptureWriter
+                (codec, transform, level). None writes the plain pickle format.
+            columnar (bool): Write a columnar capture for np.memmap instead,
+                see columnar.py. compression is ignored.
+            clock (ClockModel): The model that gave the scans their host
+                times. Its summary goes in the header, and its wall_offset
+                turns them into wall clock time.
         Returns:
             None
     """
 
     print("Saving to " + file_path)
 
+    # create the directory (usually "./data") if it doesn't exist
+    directory = os.path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    if compression is not None or columnar:
+        with open_writer(file_path, start_range, end_range, compression, columnar, clock) as writer:
+            if isinstance(data, ScanBuffer):
+                writer.write(*data.arrays(), data.latest_flags(len(data)),
+                             data.latest_host_times(len(data)))
+            else:
+                writer.write(np.array([frame["timestamp"] for frame in data]),
+                             np.array([frame["data"] for frame in data]),
+                             np.array([frame.get("flags", 0) for frame in data]),
+                             np.array([frame.get("host_time", np.nan) for frame in data]))
+        print("Done saving.")
+        return None
+
     # construct the header
     point_count = len(data[0]["data"])
     frame_count = len(data)
+    wall_offset = wall_clock_offset() if clock is None else clock.wall_offset
 
     header = {
         "point_count": point_count,
         "frame_count": frame_count,
         "start_range": start_range,
-        "end_range": end_range
+        "end_range": end_range,
+        "clock": None if clock is None else clock.summary()
     }
 
+    if isinstance(data, ScanBuffer):
+        host_times = data.latest_host_times(len(data))
+    else:
+        host_times = [frame.get("host_time", np.nan) for frame in data]
+
     with open(file_path, 'wb') as f:
         # write the header
         pickle.dump(header, f)
 
-        # write the data
-        for frame in data:
+        # write the data, with the host times on the wall clock
+        for frame, host_time in zip(data, host_times):
+            if not np.isnan(host_time):
+                frame = dict(frame, host_time=float(host_time + wall_offset))
             pickle.dump(frame, f)
 
         f.close()
     print("Done saving.")
 
     return None
+
+
+# file extensions of the plain, compressed and columnar formats. The
+# readers go by the first bytes of a file, not its name
+CAPTURE_EXTENSIONS = (".pkl", COMPRESSED_EXTENSION, COLUMNAR_EXTENSION)
+
+# the header of a streamed capture is always this many bytes, so it can be
+# rewritten in place with the latest frame count
+HEADER_SIZE = 1024
+
+
+class CaptureWriter:
+    """Streams scans to a capture file while they are being collected.
+
+    The file has the same layout as save_data() writes: a pickled header
+    followed by one pickled frame per scan. Frames with a host time carry it
+    as "host_time", in time.time() seconds. The header carries a "pad" field
+    that keeps it HEADER_SIZE bytes long, and it is rewritten after every
+    batch, so the file is readable up to the last flushed batch even if the
+    program dies mid-capture.
+    """
+
+    def __init__(self, file_path: str, start_range: float, end_range: float, batch_size=256,
+                 clock=None):
+        """ Opens a capture file for writing.
+            Args:
+                file_path (str): The path where to save the file
+                start_range (float): The start range of the scan (in meters)
+                end_range (float): The end range of the scan (in meters)
+                batch_size (int): How many scans to write between header updates
+                clock (ClockModel): The model that gives the scans their host
+                    times. Its summary is kept in the header.
+        """
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.file_path = file_path
+        self.start_range = start_range
+        self.end_range = end_range
+        self.batch_size = batch_size
+        self.clock = clock
+        # added to host times to put them on the wall clock
+        self.wall_offset = wall_clock_offset() if clock is None else clock.wall_offset
+
+        self.point_count = None  # set by the first scan written
+        self.frame_count = 0  # frames covered by the header on disk
+        self.pending = 0  # frames written since the last header update
+
+        self.file = open(file_path, "wb")
+        self.file.write(self.__header())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __header(self) -> bytes:
+        """Pickles the header, padded to exactly HEADER_SIZE bytes"""
+
+        header = {
+            "point_count": self.point_count or 0,
+            "frame_count": self.frame_count,
+            "start_range": self.start_range,
+            "end_range": self.end_range,
+            "clock": None if self.clock is None else self.clock.summary(),
+            "pad": bytes(256)
+        }
+
+        # at 256+ bytes the pad's length prefix has a fixed size, so the
+        # pickle grows exactly as much as the pad does
+        header["pad"] = bytes(256 + HEADER_SIZE - len(pickle.dumps(header)))
+        data = pickle.dumps(header)
+
+        if len(data) != HEADER_SIZE:
+            raise ValueError("capture header doesn't fit in HEADER_SIZE")
+        return data
+
+    def write(self, timestamps, samples, flags=None, host_times=None) -> None:
+        """ Appends scans to the file.
+            Args:
+                timestamps (np.ndarray): The radar timestamp of each scan
+                samples (np.ndarray): One scan per row. Scans are padded or cut
+                    to the length of the first scan written.
+                flags (np.ndarray): Reassembly flags of each scan, saved with
+                    the scans that have any. None if all are complete.
+                host_times (np.ndarray): Host time of each scan, from
+                    time.monotonic(). NaN or None if unknown.
+        """
+        if self.point_count is None:
+            if len(timestamps) == 0:
+                return
+            self.point_count = samples.shape[1]
+
+        for index, (timestamp, row) in enumerate(zip(timestamps, samples)):
+            if len(row) != self.point_count:
+                fitted = np.zeros(self.point_count, dtype=row.dtype)
+                fitted[:min(len(row), self.point_count)] = row[:self.point_count]
+                row = fitted
+
+            frame = {"timestamp": int(timestamp), "data": row}
+            if flags is not None and flags[index]:
+                frame["flags"] = int(flags[index])
+            if host_times is not None and not np.isnan(host_times[index]):
+                frame["host_time"] = float(host_times[index] + self.wall_offset)
+            pickle.dump(frame, self.file)
+            self.pending += 1
+
+            if self.pending >= self.batch_size:
+                self.flush()
+
+    def write_buffer(self, buffer) -> int:
+        """ Moves every scan out of a ScanBuffer into the file.
+            Args:
+                buffer (ScanBuffer): The buffer to drain. It is left empty.
+            Returns:
+                The number of scans written
+        """
+        count = len(buffer)
+        if count == 0:
+            return 0
+
+        buffer.sort()
+        self.write(*buffer.arrays(), buffer.latest_flags(count), buffer.latest_host_times(count))
+        buffer.clear()
+
+        return count
+
+    def flush(self) -> None:
+        """ Writes out everything so far and updates the header to cover it."""
+
+        # the frames have to be on disk before the header counts them
+        self.file.flush()
+        self.frame_count += self.pending
+        self.pending = 0
+
+        self.file.seek(0)
+        self.file.write(self.__header())
+        self.file.seek(0, os.SEEK_END)
+        self.file.flush()
+
+    def close(self) -> None:
+        """ Finalises the header and closes the file."""
+
+        if self.file is None:
+            return
+
+        self.flush()
+        self.file.close()
+        self.file = None
+
+
+def open_writer(file_path: str, start_range: float, end_range: float, compression: dict = None,
+                columnar: bool = False, clock=None):
+    """ Opens a streaming writer for the configured capture format.
+        Args:
+            file_path (str): The path where to save the file
+            start_range (float): The start range of the scan (in meters)
+            end_range (float): The end range of the scan (in meters)
+            compression (dict): See save_data().
+            columnar (bool): See save_data().
+            clock (ClockModel): See save_data().
+        Returns:
+            A CaptureWriter, CompressedCaptureWriter or ColumnarCaptureWriter
+    """
+    if columnar:
+        return ColumnarCaptureWriter(file_path, start_range, end_range, clock=clock)
+    if compression is not None:
+        return CompressedCaptureWriter(file_path, start_range, end_range, **compression,
+                                       clock=clock)
+    return CaptureWriter(file_path, start_range, end_range, clock=clock)
+
+
+def capture_extension(compression: dict = None, columnar: bool = False) -> str:
+    """ Gets the file extension for the configured capture format.
+        Args:
+            compression (dict): See save_data().
+            columnar (bool): See save_data().
+        Returns:
+            ".t2c" for columnar, ".t2z" for compressed, ".pkl" otherwise
+    """
+    if columnar:
+        return COLUMNAR_EXTENSION
+    if compression is not None:
+        return COMPRESSED_EXTENSION
+    return ".pkl"
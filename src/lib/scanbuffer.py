@@ -0,0 +1,238 @@
+import numpy as np
+
+# Storage for reassembled scans
+# Scans are rows of one preallocated 2D int32 matrix, with their timestamps,
+# host receive times and reassembly flags in matching vectors. The matrix grows in large chunks, and once it
+# reaches its capacity the oldest scans are overwritten.
+
+
+class ScanBuffer:
+
+    def __init__(self, capacity: int = None, chunk: int = 4096, width: int = 0) -> None:
+        """Creates an empty buffer
+
+        Args:
+            capacity (int): The most scans to keep. None keeps growing.
+            chunk (int): How many rows to add each time the buffer grows.
+            width (int): Expected samples per scan, grows if a longer scan arrives.
+        """
+        self.capacity = capacity
+        self.chunk = chunk if capacity is None else min(chunk, capacity)
+
+        self.samples = np.zeros((0, width), dtype=np.int32)
+        self.timestamps = np.zeros(0, dtype=np.int64)
+        self.host_times = np.zeros(0, dtype=np.float64)
+        self.flags = np.zeros(0, dtype=np.uint8)
+
+        self.width = width  # samples per scan in use
+        self.start = 0  # row of the oldest scan
+        self.count = 0  # number of scans stored
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> dict:
+        """Gets a single scan, oldest first. Negative indexes count from the newest.
+
+        Args:
+            index (int): The scan to get.
+
+        Returns:
+            dict with keys: timestamp (int), data (view of the samples), and
+            flags (int) if the scan was salvaged
+        """
+        row = self.__row(index)
+        frame = {
+            "timestamp": int(self.timestamps[row]),
+            "data": self.samples[row, :self.width]
+        }
+        if self.flags[row]:
+            frame["flags"] = int(self.flags[row])
+        return frame
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def __row(self, index: int) -> int:
+        """Converts a scan index into a row of the matrix"""
+
+        if index < 0:
+            index += self.count
+        if index < 0 or index >= self.count:
+            raise IndexError("scan index out of range")
+        return (self.start + index) % self.samples.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the buffer in bytes"""
+        return self.samples.nbytes + self.timestamps.nbytes + self.host_times.nbytes + \
+            self.flags.nbytes
+
+    def __grow(self, rows: int, width: int) -> None:
+        """Reallocates the storage. Scans are moved to the top, oldest first.
+
+        Args:
+            rows (int): New number of rows.
+            width (int): New number of columns.
+        """
+        samples = np.zeros((rows, width), dtype=np.int32)
+        timestamps = np.zeros(rows, dtype=np.int64)
+        host_times = np.full(rows, np.nan)
+        flags = np.zeros(rows, dtype=np.uint8)
+
+        order = self.__order()
+        samples[:self.count, :self.samples.shape[1]] = self.samples[order]
+        timestamps[:self.count] = self.timestamps[order]
+        host_times[:self.count] = self.host_times[order]
+        flags[:self.count] = self.flags[order]
+
+        self.samples = samples
+        self.timestamps = timestamps
+        self.host_times = host_times
+        self.flags = flags
+        self.start = 0
+
+    def __order(self):
+        """Rows of the stored scans, oldest first"""
+
+        if self.start + self.count <= self.samples.shape[0]:
+            return slice(self.start, self.start + self.count)
+        return (np.arange(self.count) + self.start) % self.samples.shape[0]
+
+    def append(self, timestamp: int, data: np.ndarray, host_time: float = None,
+               flags: int = 0) -> np.ndarray:
+        """Adds a scan, overwriting the oldest one if the buffer is full
+
+        Args:
+            timestamp (int): The radar timestamp of the scan.
+            data (np.ndarray): The samples. Shorter scans are 0-padded.
+            host_time (float): When the host received it, from time.monotonic().
+                This is the same clock for every radar. NaN if not given.
+            flags (int): Reassembly flags, see reassembly.SCAN_PARTIAL.
+
+        Returns:
+            The row the scan was written to
+        """
+        rows, columns = self.samples.shape
+
+        if len(data) > columns:
+            # widen by at least 256 samples so this rarely happens
+            self.__grow(rows, max(len(data), columns + 256))
+            rows, columns = self.samples.shape
+
+        if len(data) > self.width:
+            self.width = len(data)
+
+        if self.count == rows and (self.capacity is None or rows < self.capacity):
+            grow_to = rows + self.chunk
+            if self.capacity is not None:
+                grow_to = min(grow_to, self.capacity)
+            self.__grow(grow_to, columns)
+            rows = grow_to
+
+        if self.count == rows:
+            # full, overwrite the oldest scan
+            row = self.start
+            self.start = (self.start + 1) % rows
+        else:
+            row = (self.start + self.count) % rows
+            self.count += 1
+
+        out = self.samples[row]
+        out[:len(data)] = data
+        out[len(data):] = 0
+        self.timestamps[row] = timestamp
+        self.host_times[row] = np.nan if host_time is None else host_time
+        self.flags[row] = flags
+
+        return out
+
+    def latest(self, n: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """Gets the most recent scans, oldest first
+
+        Args:
+            n (int): How many scans to get.
+
+        Returns:
+            (timestamps, samples). These are views into the buffer unless the
+            requested scans wrap around the end of the ring, in which case
+            they are copies.
+        """
+        n = min(n, self.count)
+        first = (self.start + self.count - n) % max(self.samples.shape[0], 1)
+
+        if first + n <= self.samples.shape[0]:
+            return (self.timestamps[first:first + n],
+                    self.samples[first:first + n, :self.width])
+
+        rows = (np.arange(n) + first) % self.samples.shape[0]
+        return (self.timestamps[rows], self.samples[rows, :self.width])
+
+    def arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        """Gets every stored scan, oldest first
+
+        Returns:
+            (timestamps, samples), as views when the ring hasn't wrapped
+        """
+        return self.latest(self.count)
+
+    def trim(self, width: int) -> None:
+        """Drops samples past the given width from every scan
+
+        Args:
+            width (int): The new number of samples per scan.
+        """
+        self.width = min(width, self.width)
+
+    def latest_host_times(self, n: int = 1) -> np.ndarray:
+        """Gets the host receive times of the most recent scans, oldest first
+
+        Args:
+            n (int): How many scans to get.
+
+        Returns:
+            The host times, matching latest(n)
+        """
+        return self.__latest_column(self.host_times, n)
+
+    def latest_flags(self, n: int = 1) -> np.ndarray:
+        """Gets the reassembly flags of the most recent scans, oldest first
+
+        Args:
+            n (int): How many scans to get.
+
+        Returns:
+            The flags, matching latest(n)
+        """
+        return self.__latest_column(self.flags, n)
+
+    def __latest_column(self, column: np.ndarray, n: int) -> np.ndarray:
+        """Gets the last n entries of a per-scan vector, oldest first"""
+
+        n = min(n, self.count)
+        first = (self.start + self.count - n) % max(self.samples.shape[0], 1)
+
+        if first + n <= self.samples.shape[0]:
+            return column[first:first + n]
+        return column[(np.arange(n) + first) % self.samples.shape[0]]
+
+    def sort(self) -> None:
+        """Sorts the stored scans by timestamp"""
+
+        timestamps, samples = self.arrays()
+        host_times = self.latest_host_times(self.count)
+        flags = self.latest_flags(self.count)
+        order = np.argsort(timestamps, kind="stable")
+
+        self.samples[:self.count, :self.width] = samples[order]
+        self.timestamps[:self.count] = timestamps[order]
+        self.host_times[:self.count] = host_times[order]
+        self.flags[:self.count] = flags[order]
+        self.start = 0
+
+    def clear(self) -> None:
+        """Removes all scans but keeps the allocated storage"""
+
+        self.start = 0
+        self.count = 0
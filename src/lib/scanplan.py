@@ -0,0 +1,255 @@
+import asyncio
+import json
+import os
+import time
+from lib.aiocommanager import aiocommanager
+from lib.util import ps_to_range
+from lib.save_data import CaptureWriter, open_writer, capture_extension
+from lib.radario import RECV_TIMEOUT
+from lib.reduction import ScanReducer
+from lib.reassembly import reassembly_from_config
+from lib.compression import compression_from_config
+from lib.columnar import columnar_from_config
+
+# Runs a list of scans with different settings, one after the other
+# A plan is a JSON file with a list of steps. Each step sets the
+# integration index and scan window, scans scanCount times every
+# scanInterval us, and streams the scans to its own capture file. The set
+# config and get config requests of a step are sent back to back, and the
+# control request follows once the set is confirmed, so the next step
+# starts two round trips after the last scan of the previous one arrived.
+#
+# {
+#     "steps": [
+#         {"name": "near", "integrationIndex": 11, "scanStart": 6671, "scanEnd": 26685,
+#          "scanCount": 500, "scanInterval": 0},
+#         {"name": "far", "scanStart": 26685, "scanEnd": 80057}
+#     ]
+# }
+#
+# scanStart and scanEnd are round-trip times in picoseconds, like the
+# "radar" section of config.json. Anything a step leaves out comes from
+# that section.
+
+STEP_FIELDS = ["integrationIndex", "scanStart", "scanEnd", "scanCount", "scanInterval"]
+
+# how long the radar can be quiet before a step is over, on top of the scan interval (seconds)
+QUIET_TIME = 0.5
+
+# how many scans to collect before handing them to the writer
+WRITE_BATCH = 256
+
+
+def load_plan(file_path: str, radar_config: dict) -> list[dict]:
+    """Reads a scan plan and fills in what each step leaves out
+
+    Args:
+        file_path (str): The plan, a JSON file.
+        radar_config (dict): The "radar" section of config.json.
+
+    Returns:
+        The steps, each with a name and every field in STEP_FIELDS
+    """
+    with open(file_path, "r") as f:
+        plan = json.load(f)
+
+    # a bare list of steps is fine too
+    if isinstance(plan, dict):
+        plan = plan["steps"]
+
+    steps = []
+    for index, step in enumerate(plan):
+        unknown = set(step) - set(STEP_FIELDS) - {"name"}
+        if unknown:
+            raise ValueError(f"Step {index} has unknown fields {sorted(unknown)}")
+
+        full = {field: step.get(field, radar_config[field]) for field in STEP_FIELDS}
+        full["name"] = step.get("name", f"step{index}")
+
+        # a continuous scan would never hand over to the next step
+        if not 0 < full["scanCount"] < 65535:
+            raise ValueError(f"Step {index} needs a scanCount between 1 and 65534")
+
+        steps.append(full)
+
+    return steps
+
+
+class ScanPlan:
+
+    def __init__(self, steps: list[dict], out_dir: str, reducer=None, expiry: int = 3000,
+                 salvage: str = None, compression: dict = None, columnar: bool = False,
+                 node_id: int = 6) -> None:
+        """Creates the executor. Call run() to run the plan.
+
+        Args:
+            steps (list[dict]): The steps, see load_plan().
+            out_dir (str): Where the captures go, one per step.
+            reducer (ScanReducer): Reduction applied to every step's scans.
+            expiry (int): See commanager.
+            salvage (str): See commanager.
+            compression (dict): See save_data().
+            columnar (bool): See save_data().
+            node_id (int): The radar's node ID.
+        """
+        self.steps = steps
+        self.out_dir = out_dir
+        self.reducer = reducer
+        self.expiry = expiry
+        self.salvage = salvage
+        self.compression = compression
+        self.columnar = columnar
+        self.node_id = node_id
+
+        self.results = []  # one summary per finished step
+
+    @classmethod
+    def from_config(cls, steps: list[dict], out_dir: str, config: dict) -> "ScanPlan":
+        """Creates an executor with the reduction, reassembly and storage settings of config.json
+
+        Args:
+            steps (list[dict]): The steps, see load_plan().
+            out_dir (str): Where the captures go, one per step.
+            config (dict): The whole config.
+        """
+        return cls(steps, out_dir, reducer=ScanReducer.from_config(config),
+                   compression=compression_from_config(config), columnar=columnar_from_config(config),
+                   **reassembly_from_config(config))
+
+    def file_path(self, index: int, step: dict) -> str:
+        """Where a step's capture goes"""
+
+        extension = capture_extension(self.compression, self.columnar)
+        return os.path.join(self.out_dir, f"{index:02d}_{step['name']}{extension}")
+
+    def run(self, address: tuple = None) -> list[dict]:
+        """Runs every step and puts the radar to sleep at the end
+
+        Args:
+            address (tuple): (ip, port) of the radar. Defaults to the config.
+
+        Returns:
+            The summaries of the steps, see run_step()
+        """
+        return asyncio.run(self.run_async(address))
+
+    async def run_async(self, address: tuple = None) -> list[dict]:
+        """run(), from a running event loop"""
+
+        os.makedirs(self.out_dir, exist_ok=True)
+
+        comm = aiocommanager(address)
+        comm.reducer = self.reducer
+        comm.expiry = self.expiry
+        comm.salvage = self.salvage
+        await comm.connect()
+
+        writer = None
+        try:
+            for index, step in enumerate(self.steps):
+                writer = await self.run_step(comm, index, step, writer)
+        finally:
+            if writer is not None:
+                writer.close()
+            self.save_summary()
+
+        await comm.sleep_radar()
+        comm.close()
+        return self.results
+
+    async def run_step(self, comm: aiocommanager, index: int, step: dict,
+                       previous=None) -> CaptureWriter:
+        """Sets up the radar for a step and streams its scans to a capture
+
+        Adds a summary with the step, the config the radar ended up with,
+        the file, the scans received from the radar ("scans", salvaged ones
+        included), the scans written after reduction ("written") and the
+        ingest metrics to results.
+
+        Args:
+            comm (aiocommanager): The connected manager.
+            index (int): The step's position in the plan.
+            step (dict): The step.
+            previous (CaptureWriter): The last step's writer, of any format. It is closed
+                while the radar works on the requests.
+
+        Returns:
+            The step's writer, still open
+        """
+        comm.__reset__()
+        print(f"Step {index} ({step['name']}): {step['scanCount']} scans")
+
+        configured = comm.set_and_get(
+            ("MRM_SET_CONFIG_REQUEST", {"nodeID": self.node_id, "persistFlag": 1,
+                                        "baseIntegrationIndex": step["integrationIndex"],
+                                        "scanStart": step["scanStart"],
+                                        "scanEnd": step["scanEnd"]}),
+            ("MRM_GET_CONFIG_REQUEST", {}))
+        comm.mode = "async"
+        start_time = time.monotonic()
+
+        if previous is not None:
+            previous.close()
+
+        try:
+            status, radar_config = await configured
+
+            # UDP could overtake the set with the control request, and the
+            # step would scan with the old config
+            await comm.send("MRM_CONTROL_REQUEST", scanCount=step["scanCount"],
+                            scanIntervalTime=step["scanInterval"])
+        except TimeoutError:
+            raise TimeoutError(f"Radar did not answer the requests of step {index}")
+
+        if status.get("status", 0) != 0:
+            print(f"WARNING: Radar rejected the config of step {index}")
+
+        # figure out what the actual ranges are, and where gating moves them
+        start_range = ps_to_range(radar_config["scanStart"])
+        end_range = ps_to_range(radar_config["scanEnd"])
+        if comm.reducer is not None:
+            start_range, end_range = comm.reducer.ranges(start_range, end_range)
+
+        file_path = self.file_path(index, step)
+        writer = open_writer(file_path, start_range, end_range, self.compression, self.columnar,
+                             comm.clock)
+
+        quiet = QUIET_TIME + step["scanInterval"] / 1e6
+        written = 0
+        while comm.received_scans() < step["scanCount"]:
+            comm.scan_event.clear()
+            try:
+                await asyncio.wait_for(comm.scan_event.wait(), quiet)
+            except asyncio.TimeoutError:
+                break
+
+            if len(comm.databuffer) >= WRITE_BATCH:
+                written += writer.write_buffer(comm.databuffer)
+
+        comm.flush_reassembly()
+        written += writer.write_buffer(comm.databuffer)
+        comm.mode = "sync"
+
+        # averaging and decimation write fewer scans than the radar sent,
+        # so compare what the radar sent. Salvaged scans are counted in it
+        received = comm.metrics.scans
+        if received < step["scanCount"]:
+            print(f"WARNING: Step {index} got {received} of {step['scanCount']} scans")
+
+        self.results.append({
+            "step": step,
+            "radar_config": radar_config,
+            "file": file_path,
+            "scans": received,
+            "written": written,
+            "duration": time.monotonic() - start_time,
+            "metrics": comm.get_metrics()
+        })
+
+        return writer
+
+    def save_summary(self) -> None:
+        """Writes the summaries of the finished steps to plan.json in out_dir"""
+
+        with open(os.path.join(self.out_dir, "plan.json"), "w") as f:
+            json.dump(self.results, f, indent=4)
@@ -0,0 +1,274 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+# A ring of scans in shared memory, for passing scans between processes
+# One process writes scans with append(), the same way commanager fills a
+# ScanBuffer, and any number of processes read them with a RingReader.
+#
+# The block starts with a small header of int64s, followed by one int64
+# sequence number, timestamp, host time, flags and length per slot, and
+# then the samples as a (capacity, width) int32 matrix. Scan n goes to slot
+# n % capacity. The writer marks the slot with sequence -1 while it writes
+# and sets it to n when done, then bumps the write count in the header. A
+# reader copies a slot and checks its sequence number before and after, so
+# it can tell if the writer lapped it and the copy is torn. The writer
+# never waits for readers.
+
+RING_MAGIC = 0x5432524E47000001  # "T2RNG" and a version
+
+# header fields, as indexes into the int64 header
+MAGIC, CAPACITY, WIDTH, WRITTEN, CLOSED = range(5)
+HEADER_FIELDS = 8
+
+
+def attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """Opens an existing shared memory block without taking ownership of it
+
+    Before Python 3.13 every process that opens a block registers it with
+    its resource tracker. Processes started with multiprocessing share the
+    tracker of the process that created the block, so that is harmless, but
+    readers started any other way would delete the block when they exit.
+    """
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name)
+
+
+class SharedScanRing:
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool) -> None:
+        """Maps the ring onto a shared memory block. Use create() or attach().
+
+        Args:
+            shm (SharedMemory): The block.
+            owner (bool): Whether close() should also delete the block.
+        """
+        self.shm = shm
+        self.owner = owner
+
+        self.header = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=shm.buf)
+        if self.header[MAGIC] != RING_MAGIC:
+            raise ValueError(f"{shm.name} is not a scan ring")
+
+        capacity = int(self.header[CAPACITY])
+        width = int(self.header[WIDTH])
+        self.capacity = capacity
+        self.width = width
+
+        offset = self.header.nbytes
+        self.sequence = np.ndarray(capacity, dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self.sequence.nbytes
+        self.timestamps = np.ndarray(capacity, dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self.timestamps.nbytes
+        self.host_times = np.ndarray(capacity, dtype=np.float64, buffer=shm.buf, offset=offset)
+        offset += self.host_times.nbytes
+        self.flags = np.ndarray(capacity, dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self.flags.nbytes
+        self.lengths = np.ndarray(capacity, dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self.lengths.nbytes
+        self.samples = np.ndarray((capacity, width), dtype=np.int32, buffer=shm.buf, offset=offset)
+
+    @staticmethod
+    def size(capacity: int, width: int) -> int:
+        """Bytes needed for a ring"""
+        return 8 * HEADER_FIELDS + 5 * 8 * capacity + 4 * capacity * width
+
+    @classmethod
+    def create(cls, capacity: int, width: int, name: str = None) -> "SharedScanRing":
+        """Creates a new ring. The creator owns it and deletes it on close().
+
+        Args:
+            capacity (int): How many scans the ring holds.
+            width (int): Samples per scan, longer scans are cut.
+            name (str): Name of the block, a random one if None.
+
+        Returns:
+            The ring
+        """
+        shm = shared_memory.SharedMemory(name, create=True, size=cls.size(capacity, width))
+
+        header = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[CAPACITY] = capacity
+        header[WIDTH] = width
+        header[MAGIC] = RING_MAGIC
+
+        ring = cls(shm, True)
+        ring.sequence[:] = -1
+        return ring
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedScanRing":
+        """Opens a ring created by another process
+
+        Args:
+            name (str): The ring's name.
+
+        Returns:
+            The ring
+        """
+        return cls(attach_shared_memory(name), False)
+
+    @property
+    def name(self) -> str:
+        """The name other processes attach with"""
+        return self.shm.name
+
+    @property
+    def written(self) -> int:
+        """Number of scans written so far"""
+        return int(self.header[WRITTEN])
+
+    @property
+    def closed(self) -> bool:
+        """Whether the writer has said it is done"""
+        return bool(self.header[CLOSED])
+
+    def __len__(self) -> int:
+        return min(self.written, self.capacity)
+
+    def append(self, timestamp: int, data: np.ndarray, host_time: float = None,
+               flags: int = 0) -> np.ndarray:
+        """Writes a scan, overwriting the oldest one. Only one process may write.
+
+        Takes the same arguments as ScanBuffer.append, so a ring can be used
+        as a commanager's databuffer.
+
+        Args:
+            timestamp (int): The radar timestamp of the scan.
+            data (np.ndarray): The samples. Cut to the ring width.
+            host_time (float): When the host received it. NaN if not given.
+            flags (int): Reassembly flags.
+
+        Returns:
+            The slot's samples
+        """
+        number = int(self.header[WRITTEN])
+        slot = number % self.capacity
+        length = min(len(data), self.width)
+
+        self.sequence[slot] = -1
+        out = self.samples[slot]
+        out[:length] = data[:length]
+        out[length:] = 0
+        self.timestamps[slot] = timestamp
+        self.host_times[slot] = np.nan if host_time is None else host_time
+        self.flags[slot] = flags
+        self.lengths[slot] = length
+        self.sequence[slot] = number
+
+        self.header[WRITTEN] = number + 1
+        return out
+
+    def mark_closed(self) -> None:
+        """Tells readers that no more scans will be written"""
+        self.header[CLOSED] = 1
+
+    def close(self) -> None:
+        """Unmaps the ring, and deletes it if this process created it"""
+
+        if self.shm is None:
+            return
+
+        # the arrays have to go before the block can be unmapped
+        self.header = self.sequence = self.timestamps = self.host_times = None
+        self.flags = self.lengths = self.samples = None
+
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
+
+
+class RingReader:
+
+    def __init__(self, ring: SharedScanRing or str, from_start: bool = False) -> None:
+        """Reads the scans written to a ring, each at most once
+
+        Args:
+            ring (SharedScanRing or str): The ring, or its name to attach to it.
+            from_start (bool): Start with the oldest scan still in the ring,
+                instead of only the scans written from now on.
+        """
+        self.attached = isinstance(ring, str)  # whether close() should detach
+        if self.attached:
+            ring = SharedScanRing.attach(ring)
+        self.ring = ring
+
+        self.next = max(ring.written - ring.capacity, 0) if from_start else ring.written
+        self.lost = 0  # scans overwritten before they could be read
+
+    def read(self, max_scans: int = None) -> dict:
+        """Copies out the scans written since the last read
+
+        Args:
+            max_scans (int): The most scans to return, oldest first. None
+                returns all of them.
+
+        Returns:
+            dict with keys: timestamps, samples, host_times, flags, lengths (np.ndarray)
+        """
+        ring = self.ring
+        written = ring.written
+
+        # anything the writer has lapped is gone
+        first = max(self.next, written - ring.capacity)
+        self.lost += first - self.next
+
+        last = written if max_scans is None else min(written, first + max_scans)
+        scans, torn = self.__copy(np.arange(first, last, dtype=np.int64))
+        self.lost += torn
+
+        self.next = last
+        return scans
+
+    def latest(self, n: int = 1) -> dict:
+        """Copies out the newest scans, whether or not they were read before
+
+        Args:
+            n (int): How many scans to get.
+
+        Returns:
+            dict, see read()
+        """
+        written = self.ring.written
+        first = max(written - min(n, self.ring.capacity), 0)
+        scans, _torn = self.__copy(np.arange(first, written, dtype=np.int64))
+        return scans
+
+    def __copy(self, numbers: np.ndarray) -> tuple[dict, int]:
+        """Copies scans out of the ring, leaving out any the writer overwrote meanwhile
+
+        Args:
+            numbers (np.ndarray): The scan numbers.
+
+        Returns:
+            (dict, see read(), number of scans left out)
+        """
+        ring = self.ring
+        slots = numbers % ring.capacity
+
+        before = ring.sequence[slots]
+        scans = {
+            "timestamps": ring.timestamps[slots],
+            "samples": ring.samples[slots],
+            "host_times": ring.host_times[slots],
+            "flags": ring.flags[slots].astype(np.uint8),
+            "lengths": ring.lengths[slots]
+        }
+        after = ring.sequence[slots]
+
+        # keep the slots that held the same scan for the whole copy
+        valid = (before == numbers) & (after == numbers)
+        torn = int(np.count_nonzero(~valid))
+        if torn:
+            scans = {key: value[valid] for key, value in scans.items()}
+
+        return scans, torn
+
+    def close(self) -> None:
+        """Detaches from the ring, if the reader attached to it"""
+
+        if self.attached:
+            self.ring.close()
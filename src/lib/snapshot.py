@@ -0,0 +1,139 @@
+import numpy as np
+from lib.commanager import commanager
+from lib.scanbuffer import ScanBuffer
+
+# Snapshots taken from a continuous stream
+# Instead of starting a scan for every snapshot, the radar scans
+# continuously and the newest scans are kept in a small ScanBuffer ring.
+# Taking a snapshot copies the newest scan, or averages the newest few, so
+# it costs a copy rather than a MRM_CONTROL_REQUEST round trip and a wait
+# for the data. Packets are drained with poll(), which never blocks, so it
+# can be called from a GUI timer.
+
+
+class SnapshotStream:
+
+    def __init__(self, comm: commanager, ring_size: int = 64) -> None:
+        """Creates a stream. Call start() to start the radar scanning.
+
+        Args:
+            comm (commanager): The radar to stream from. Its databuffer is
+                replaced by the ring while the stream runs.
+            ring_size (int): How many of the newest scans to keep.
+        """
+        self.comm = comm
+        self.ring_size = ring_size
+        self.snapshots = ScanBuffer()  # the snapshots taken so far
+        self.running = False
+
+    @classmethod
+    def from_config(cls, comm: commanager, config: dict) -> "SnapshotStream":
+        """Creates a stream from the "snapshot" section of config.json, if any
+
+        Args:
+            comm (commanager): The radar to stream from.
+            config (dict): The whole config.
+
+        Returns:
+            The stream
+        """
+        return cls(comm, config.get("snapshot", {}).get("ringSize", 64))
+
+    def start(self, scan_interval: int) -> dict:
+        """Starts the radar scanning until stop() is called
+
+        Args:
+            scan_interval (int): Time between scans (us), 0 is as fast as possible.
+
+        Returns:
+            The MRM_CONTROL_CONFIRM
+        """
+        comm = self.comm
+        comm.databuffer = ScanBuffer(self.ring_size)
+
+        resp = comm.send_sync("MRM_CONTROL_REQUEST", False,
+                              scanCount=65535, scanIntervalTime=scan_interval)
+        if resp["status"] != 0:
+            return resp
+
+        comm.mode = "async"
+        comm.shutdown_mode = False
+        self.running = True
+        return resp
+
+    def poll(self) -> int:
+        """Handles every packet that has already arrived, without waiting
+
+        Returns:
+            The number of packets handled
+        """
+        if not self.running:
+            return 0
+
+        comm = self.comm
+        connection = comm.connection
+        handled = 0
+
+        while True:
+            try:
+                msgtype, msgid, payload, rx_time = connection.recv_packet(0)
+            except TimeoutError:
+                break
+
+            comm.handle_packet(msgtype, msgid, payload, rx_time)
+            handled += 1
+
+        # someone else stopped the radar
+        if comm.shutdown_mode:
+            self.running = False
+            comm.mode = "sync"
+
+        return handled
+
+    def snapshot(self, average: int = 1) -> dict or None:
+        """Stores a snapshot of the newest scans in self.snapshots
+
+        Args:
+            average (int): How many of the newest scans to average, at most
+                the ring size.
+
+        Returns:
+            dict with keys: timestamp (int), data (copy of the samples),
+            scans (how many were averaged), or None if no scan has arrived yet
+        """
+        self.poll()
+
+        buffer = self.comm.databuffer
+        if len(buffer) == 0:
+            return None
+
+        count = min(average, len(buffer))
+        timestamps, samples = buffer.latest(count)
+        host_times = buffer.latest_host_times(count)
+        flags = np.bitwise_or.reduce(buffer.latest_flags(count))
+
+        if count == 1:
+            data = samples[0].copy()
+        else:
+            # same as the reducer, the average is stamped with the middle of the window
+            data = np.floor_divide(samples.sum(axis=0, dtype=np.int64), count).astype(np.int32)
+        timestamp = int(timestamps.sum() // count)
+
+        self.snapshots.append(timestamp, data, float(host_times.mean()), int(flags))
+
+        return {"timestamp": timestamp, "data": data, "scans": count}
+
+    def stop(self) -> None:
+        """Stops the radar scanning and drops whatever is still on the way"""
+
+        if not self.running:
+            return
+
+        comm = self.comm
+        comm.send_sync("MRM_CONTROL_REQUEST", True, scanCount=0, scanIntervalTime=0)
+        self.running = False
+
+        # the scans that were already sent
+        while comm.get_data():
+            pass
+        comm.mode = "sync"
@@ -1,5 +1,6 @@
 from collections import deque
-from random import randint
+from lib.scanbuffer import ScanBuffer
+import numpy as np
 
 
 def get_last_valid_index(data: list[int]) -> int:
@@ -16,41 +17,36 @@ def get_last_valid_index(data: list[int]) -> int:
             return i
 
 
-def trim_data(data: deque[dict]) -> deque[dict]:
+def trim_data(data: deque[dict] or ScanBuffer) -> deque[dict] or ScanBuffer:
     """Trims trailing 0-pads from scan data.
+
+    Scans from commanager are already sized from numTotalSamples in the
+    scan headers, so this is only needed for data from other sources.
+    Every scan is checked, and the last sample that is non-zero in any scan
+    is kept.
+
       Args:
-          data (deque): A deque of data sets
+          data (deque or ScanBuffer): A deque of data sets
       Returns:
           A deque of data sets with trailing 0-pads removed
     """
 
-    # determine the last valid index
-
-    # if there are more than 100 data points, select 100 random points
-    # this is for optimization purposes
-    zero_indexes = []
-
-    if len(data) > 100:
-        for _ in range(100):
-
-            # get a random index
-            index = randint(0, len(data) - 1)
+    # scans in a ScanBuffer share one matrix, so check every column at once
+    if isinstance(data, ScanBuffer):
+        _timestamps, samples = data.arrays()
+        used = np.flatnonzero(samples.any(axis=0))
+        data.trim(used[-1] + 1 if len(used) else 0)
+        return data
 
-            # get the last valid index
-            last_valid_index = get_last_valid_index(data[index]["data"])
-            zero_indexes.append(last_valid_index)
-
-    else:
-
-        for element in data:
-            last_valid_index = get_last_valid_index(element["data"])
-            zero_indexes.append(last_valid_index)
-
-    # get the max zero index
-    max_zero_index = max(zero_indexes)
+    # determine the last valid index over every scan
+    length = 0
+    for element in data:
+        used = np.flatnonzero(element["data"])
+        if len(used):
+            length = max(length, used[-1] + 1)
 
     # remove the 0-pads
     for element in data:
-        element["data"] = element["data"][0:max_zero_index]
+        element["data"] = element["data"][0:length]
 
     return data
@@ -1,3 +1,7 @@
+# speed of light in m/s
+SPEED_OF_LIGHT = 299792458
+
+
 def format_float(value: float, precision=3):
     """Formats a float to a string with the given precision
 
@@ -9,3 +13,69 @@ def format_float(value: float, precision=3):
         The formatted string
     """
     return ("{0:." + str(precision) + "f}").format(value)
+
+
+def bytes_to_int(data: bytes, signed: bool) -> int:
+    """Converts big-endian bytes to an int
+
+    Args:
+        data (bytes): The bytes to convert
+        signed (bool): Whether or not the value is signed
+
+    Returns:
+        The converted int
+    """
+    return int.from_bytes(data, "big", signed=signed)
+
+
+def int_to_bytes(value: int, bits: int, signed: bool) -> bytes:
+    """Converts an int to big-endian bytes
+
+    Args:
+        value (int): The value to convert
+        bits (int): The width of the value in bits
+        signed (bool): Whether or not the value is signed
+
+    Returns:
+        The converted bytes
+    """
+    return int(value).to_bytes(bits // 8, "big", signed=signed)
+
+
+def bytes_from_list(params: list) -> bytes:
+    """Packs a list of [value, bits, signed] entries into bytes
+
+    Args:
+        params (list): The entries to pack, in order
+
+    Returns:
+        The packed bytes
+    """
+    data = bytes()
+    for value, bits, signed in params:
+        data += int_to_bytes(value, bits, signed)
+    return data
+
+
+def ps_to_range(ps: float) -> float:
+    """Converts a round-trip time in picoseconds to a range in meters
+
+    Args:
+        ps (float): The time in picoseconds
+
+    Returns:
+        The range in meters
+    """
+    return ps * 1e-12 * SPEED_OF_LIGHT / 2
+
+
+def range_to_ps(distance: float) -> int:
+    """Converts a range in meters to a round-trip time in picoseconds
+
+    Args:
+        distance (float): The range in meters
+
+    Returns:
+        The time in picoseconds
+    """
+    return int(distance * 2 / SPEED_OF_LIGHT * 1e12)
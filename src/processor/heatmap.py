@@ -1,5 +1,4 @@
 import numpy as np
-import matplotlib.pyplot as plt
 
 
 def generate_heatmap(radar_data: dict, unit="m", show_start_time=False):
@@ -9,6 +8,9 @@ def generate_heatmap(radar_data: dict, unit="m", show_start_time=False):
         filePath (str): Full path to data file.
         unit (str): Unit of measurement for range axis. Defaults to meters.
     """
+    # matplotlib is slow to import, so only load it when plotting
+    import matplotlib.pyplot as plt
+
     data = radar_data["data"]
     times = radar_data["time"]
     start = radar_data["start"]
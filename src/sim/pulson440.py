@@ -0,0 +1,438 @@
+# Simulates a PulsON 440 on a local UDP port
+#
+# Speaks the part of the MRM API that mrmapi/commanager use: config set/get,
+# control, sleep mode, status info, filter config, multi-part MRM_SCAN_INFO,
+# MRM_DETECTION_LIST_INFO and the 0xF10C error packet. Scan rate, scan length, packet loss,
+# duplication and reordering are configurable so commanager can be driven
+# at and above real data rates without the radar or the Pi.
+#
+# Run from the src directory, then point config.json at 127.0.0.1:
+#   python3 -m sim.pulson440 --rate 500 --loss 0.01
+import argparse
+import random
+import socket
+import struct
+import threading
+import time
+import numpy as np
+from lib.mrmapi import outgoing_func_bank, incoming_codec_bank, SCAN_INFO_HEADER, \
+    DETECTION_DTYPE, DETECTION_COUNT, FILTER_RAW, FILTER_FAST_TIME, FILTER_MOTION, \
+    FILTER_DETECTION_LIST
+
+PACKET_HEADER = struct.Struct(">HH")
+
+# scanCount that keeps the radar scanning until it is told to stop
+INFINITE_SCANS = 65535
+
+# ps per sample with the default scanResolution
+SAMPLE_PERIOD = 61
+
+# a detection list always has room for this many detections
+MAX_DETECTIONS = 350
+
+# samples above this magnitude are reported in detection lists
+DETECTION_THRESHOLD = 2000
+
+
+class PulsonSimulator:
+
+    def __init__(self, host="127.0.0.1", port=21210, rate: float = None, max_rate: float = 200,
+                 samples: int = None, samples_per_message=350, loss=0.0, duplication=0.0,
+                 reorder=0.0, seed: int = None) -> None:
+        """Creates the simulator. Call start() or serve_forever() to run it.
+
+        Args:
+            host (str): Address to listen on.
+            port (int): Port to listen on.
+            rate (float): Scans per second. None uses scanIntervalTime from
+                MRM_CONTROL_REQUEST, falling back to max_rate when it's 0.
+            max_rate (float): Scan rate used when the scan interval is 0.
+            samples (int): Samples per scan. None derives it from the scan window.
+            samples_per_message (int): Samples per MRM_SCAN_INFO message.
+            loss (float): Probability of dropping a scan packet.
+            duplication (float): Probability of sending a scan packet twice.
+            reorder (float): Probability of holding a scan packet back and
+                sending it after the next one.
+            seed (int): Seed for the impairments and the scan data.
+        """
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024)
+        self.sock.bind((host, port))
+        self.address = self.sock.getsockname()
+
+        self.rate = rate
+        self.max_rate = max_rate
+        self.samples = samples
+        self.samples_per_message = samples_per_message
+        self.loss = loss
+        self.duplication = duplication
+        self.reorder = reorder
+        self.random = random.Random(seed)
+        self.seed = seed
+
+        # radar state, starts from the request defaults
+        self.config = dict(outgoing_func_bank[0x1001]["codec"].defaults)
+        self.filter_config = dict(outgoing_func_bank[0x1006]["codec"].defaults)
+        self.sleep_mode = 0
+        self.opmode = 1
+
+        self.client = None  # where replies and scans go
+        self.boot_time = time.monotonic()
+        self.running = False
+        self.scan_thread = None
+        self.scan_stop = threading.Event()
+
+        # packet counters
+        self.stats = {
+            "requests": 0,
+            "scans": 0,
+            "packets": 0,
+            "dropped": 0,
+            "duplicated": 0,
+            "reordered": 0,
+            "errors": 0
+        }
+
+        self.handlers = {
+            0x1001: self.__set_config,
+            0x1002: self.__get_config,
+            0x1003: self.__control,
+            0x1006: self.__set_filter_config,
+            0x1007: self.__get_filter_config,
+            0xF001: self.__get_statusinfo,
+            0xF003: self.__set_opmode,
+            0xF005: self.__set_sleepmode,
+            0xF006: self.__get_sleepmode
+        }
+
+    # request handling
+
+    def start(self) -> None:
+        """Serves requests on a background thread."""
+
+        self.running = True
+        threading.Thread(target=self.serve_forever, name="pulson-sim", daemon=True).start()
+
+    def stop(self) -> None:
+        """Stops scanning and serving."""
+
+        self.running = False
+        self.__stop_scanning()
+        self.sock.close()
+
+    def serve_forever(self) -> None:
+        """Serves requests until stop() is called."""
+
+        self.running = True
+        while self.running:
+            try:
+                data, addr = self.sock.recvfrom(4096)
+            except OSError:
+                break
+
+            if len(data) < PACKET_HEADER.size:
+                continue
+
+            self.client = addr
+            self.stats["requests"] += 1
+            self.handle_request(data)
+
+    def handle_request(self, data: bytes) -> None:
+        """Decodes a request and sends the reply.
+
+        Args:
+            data (bytes): The full request packet.
+        """
+        msgtype, msgid = PACKET_HEADER.unpack_from(data)
+        payload = data[PACKET_HEADER.size:]
+
+        entry = outgoing_func_bank.get(msgtype)
+        handler = self.handlers.get(msgtype)
+
+        if entry is None or handler is None or len(payload) < entry["codec"].size:
+            # malformed or unsupported, this is what the radar does too
+            self.send_error(msgtype, msgid, 1)
+            return
+
+        request = entry["codec"].unpack(payload)
+        reply = handler(request)
+
+        if reply is not None:
+            self.send(entry["responseID"], msgid, reply)
+
+    def send(self, msgtype: int, msgid: int, fields: dict) -> None:
+        """Packs and sends a confirm to the client.
+
+        Args:
+            msgtype (int): The confirm type.
+            msgid (int): The message ID it answers.
+            fields (dict): The confirm fields.
+        """
+        payload = incoming_codec_bank[msgtype].pack(**fields)
+        self.sock.sendto(PACKET_HEADER.pack(msgtype, msgid) + payload, self.client)
+
+    def send_error(self, msgtype: int, msgid: int, errorCode: int) -> None:
+        """Sends the 0xF10C error packet in place of a reply.
+
+        Args:
+            msgtype (int): Type of the offending message.
+            msgid (int): ID of the offending message.
+            errorCode (int): The error code.
+        """
+        self.stats["errors"] += 1
+        self.send(0xF10C, msgid, {
+            "targetMessageType": msgtype,
+            "targetMessageID": msgid,
+            "errorCode": errorCode
+        })
+
+    def timestamp(self) -> int:
+        """The radar's 32 bit millisecond counter"""
+        return int((time.monotonic() - self.boot_time) * 1000) & 0xFFFFFFFF
+
+    def __set_config(self, request: dict) -> dict:
+        self.config.update(request)
+        return {"status": 0}
+
+    def __get_config(self, request: dict) -> dict:
+        config = {key: self.config[key] for key in incoming_codec_bank[0x1102].names
+                  if key in self.config}
+        return {**config, "timestamp": self.timestamp(), "status": 0}
+
+    def __control(self, request: dict) -> dict:
+        self.__stop_scanning()
+
+        if request["scanCount"] != 0:
+            self.scan_stop.clear()
+            self.scan_thread = threading.Thread(
+                target=self.__scan_loop, args=(request["scanCount"], request["scanIntervalTime"]),
+                name="pulson-sim-scan", daemon=True)
+            self.scan_thread.start()
+
+        return {"status": 0}
+
+    def __set_filter_config(self, request: dict) -> dict:
+        self.filter_config.update(request)
+        return {"status": 0}
+
+    def __get_filter_config(self, request: dict) -> dict:
+        return {**self.filter_config, "status": 0}
+
+    def __get_statusinfo(self, request: dict) -> dict:
+        return {
+            "mrmVersionMajor": 3,
+            "mrmVersionMinor": 0,
+            "serialNumber": 440,
+            "temperature": 4000,
+            "packageVersion": b"pulson440-sim",
+            "status": 0
+        }
+
+    def __set_opmode(self, request: dict) -> dict:
+        self.opmode = request["opMode"]
+        return {"opmode": self.opmode, "status": 0}
+
+    def __set_sleepmode(self, request: dict) -> dict:
+        waking = self.sleep_mode != 0 and request["mode"] == 0
+        self.sleep_mode = request["mode"]
+
+        if self.sleep_mode != 0:
+            self.__stop_scanning()
+
+        # the confirm goes out first, then we tell the client we're ready
+        if waking:
+            threading.Timer(0.01, lambda: self.sock.sendto(
+                PACKET_HEADER.pack(0xF202, 0), self.client)).start()
+
+        return {"status": 0}
+
+    def __get_sleepmode(self, request: dict) -> dict:
+        return {"sleepMode": self.sleep_mode, "status": 0}
+
+    # scanning
+
+    def __stop_scanning(self) -> None:
+        self.scan_stop.set()
+        if self.scan_thread is not None and self.scan_thread is not threading.current_thread():
+            self.scan_thread.join()
+        self.scan_thread = None
+
+    def scan_length(self) -> int:
+        """Samples per scan for the current config"""
+
+        if self.samples is not None:
+            return self.samples
+        span = self.config["scanEnd"] - self.config["scanStart"]
+        return max(span // SAMPLE_PERIOD, 1)
+
+    def scan_bank(self, length: int, count=16) -> list[bytes]:
+        """Precomputes a few synthetic scans to cycle through
+
+        Args:
+            length (int): Samples per scan.
+            count (int): Number of distinct scans.
+
+        Returns:
+            The scans, already encoded as big-endian int32
+        """
+        rng = np.random.default_rng(self.seed)
+        bins = np.arange(length)
+
+        bank = []
+        for i in range(count):
+            scan = rng.normal(0, 200, length)
+            # a couple of slowly moving targets
+            for center, amplitude in ((length * 0.3 + i, 20000), (length * 0.6 - i / 2, 8000)):
+                scan += amplitude * np.exp(-((bins - center) / 3) ** 2) * np.cos(bins - center)
+            bank.append(scan.astype(">i4").tobytes())
+
+        return bank
+
+    def detection_bank(self, bank: list[bytes]) -> list[bytes]:
+        """Precomputes the MRM_DETECTION_LIST_INFO payload of every scan in a bank
+
+        Args:
+            bank (list[bytes]): The scans, see scan_bank().
+
+        Returns:
+            The payloads, padded to MAX_DETECTIONS records like the radar's
+        """
+        payloads = []
+        for body in bank:
+            magnitude = np.abs(np.frombuffer(body, dtype=">i4"))
+            indexes = np.flatnonzero(magnitude > DETECTION_THRESHOLD)
+            if len(indexes) > MAX_DETECTIONS:
+                # keep the strongest, in sample order
+                indexes = np.sort(indexes[np.argsort(magnitude[indexes])[-MAX_DETECTIONS:]])
+
+            records = np.zeros(MAX_DETECTIONS, dtype=DETECTION_DTYPE)
+            records["index"][:len(indexes)] = indexes
+            records["magnitude"][:len(indexes)] = np.minimum(magnitude[indexes], 0x7FFF)
+            payloads.append(DETECTION_COUNT.pack(len(indexes)) + records.tobytes())
+
+        return payloads
+
+    def __scan_loop(self, scan_count: int, interval: int) -> None:
+        """Sends scans until scan_count is reached or scanning is stopped"""
+
+        if self.rate is not None:
+            period = 1.0 / self.rate
+        elif interval > 0:
+            period = interval / 1e6
+        else:
+            period = 1.0 / self.max_rate
+
+        length = self.scan_length()
+        bank = self.scan_bank(length)
+
+        mask = self.filter_config["filterMask"]
+        send_scans = mask & (FILTER_RAW | FILTER_FAST_TIME | FILTER_MOTION)
+        detections = self.detection_bank(bank) if mask & FILTER_DETECTION_LIST else None
+        per_message = self.samples_per_message
+        message_count = (length + per_message - 1) // per_message
+
+        held = None  # packet being held back to reorder it
+        sent = 0
+        last_timestamp = -1
+        next_time = time.monotonic()
+
+        while not self.scan_stop.is_set():
+            if scan_count != INFINITE_SCANS and sent >= scan_count:
+                break
+
+            now = time.monotonic()
+            if next_time > now:
+                # wake up early to check for stop requests
+                self.scan_stop.wait(next_time - now)
+                continue
+            next_time += period
+
+            body = bank[sent % len(bank)]
+
+            # scans are told apart by timestamp, so never reuse a millisecond
+            timestamp = max(self.timestamp(), last_timestamp + 1) & 0xFFFFFFFF
+            last_timestamp = timestamp
+
+            for index in range(message_count if send_scans else 0):
+                first = index * per_message
+                count = min(per_message, length - first)
+
+                header = SCAN_INFO_HEADER.pack(
+                    self.config["nodeID"], timestamp, self.config["scanStart"],
+                    self.config["scanEnd"], SAMPLE_PERIOD, 1, 0, self.opmode,
+                    count, length, index, message_count)
+                packet = PACKET_HEADER.pack(0xF201, 0) + header + body[first * 4:(first + count) * 4]
+
+                held = self.__send_scan_packet(packet, held)
+
+            # the radar sends the detection list after its scan
+            if detections is not None:
+                packet = PACKET_HEADER.pack(0x1201, 0) + detections[sent % len(detections)]
+                held = self.__send_scan_packet(packet, held)
+
+            sent += 1
+            self.stats["scans"] += 1
+
+        if held is not None:
+            self.__transmit(held)
+
+    def __send_scan_packet(self, packet: bytes, held: bytes or None) -> bytes or None:
+        """Sends a scan packet through the impairments
+
+        Args:
+            packet (bytes): The packet to send.
+            held (bytes): A packet held back from before, or None.
+
+        Returns:
+            The packet now being held back, or None
+        """
+        if self.random.random() < self.loss:
+            self.stats["dropped"] += 1
+            return held
+
+        if held is None and self.random.random() < self.reorder:
+            self.stats["reordered"] += 1
+            return packet
+
+        self.__transmit(packet)
+        if self.random.random() < self.duplication:
+            self.stats["duplicated"] += 1
+            self.__transmit(packet)
+
+        if held is not None:
+            self.__transmit(held)
+        return None
+
+    def __transmit(self, packet: bytes) -> None:
+        try:
+            self.sock.sendto(packet, self.client)
+            self.stats["packets"] += 1
+        except OSError:
+            # client went away or the socket was closed
+            self.scan_stop.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local PulsON 440 simulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=21210)
+    parser.add_argument("--rate", type=float, default=None, help="scans per second")
+    parser.add_argument("--samples", type=int, default=None, help="samples per scan")
+    parser.add_argument("--per-message", type=int, default=350, help="samples per message")
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--dup", type=float, default=0.0)
+    parser.add_argument("--reorder", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    sim = PulsonSimulator(args.host, args.port, rate=args.rate, samples=args.samples,
+                          samples_per_message=args.per_message, loss=args.loss,
+                          duplication=args.dup, reorder=args.reorder, seed=args.seed)
+    print(f"Simulating a PulsON 440 on {sim.address[0]}:{sim.address[1]}")
+
+    try:
+        sim.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(sim.stats)